@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for GitHub Code Fetcher
+
+Stands up a local stand-in for the GitHub search API and archive downloads,
+plus a local bare git repository, and measures search and download
+throughput (and optionally peak Python memory) at several result-set sizes,
+in serial and parallel mode. Nothing touches the network, so the benchmarks
+run on an offline Linux box with git installed.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --sizes 10,100 --methods zip,clone --jobs 8 --latency 50
+    python benchmark.py --rate-limit 20 --rate-window 5 --memory --json results.json
+
+Author: Sreeram (sreeram.lagisetty@gmail.com)
+GitHub: https://github.com/Sreeram5678
+Repository: https://github.com/Sreeram5678/GITHUB-Code-Fetcher.git
+"""
+
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+from contextlib import redirect_stderr, redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import click
+
+from github_code_fetcher import GitHubCodeFetcher, format_size, parse_repository
+
+# Every fake repository gets the same archive contents and the same git history
+DEFAULT_FILES = 20
+DEFAULT_FILE_SIZE = 16 * 1024
+
+
+def make_search_item(i: int, clone_url: str) -> Dict:
+    """Build a search API item for the i-th fake repository (higher i, fewer stars)."""
+    return {
+        'id': i, 'node_id': f"R_{i}", 'name': f"repo{i}", 'full_name': f"bench/repo{i}",
+        'description': f"Benchmark repository {i}", 'html_url': f"https://example.invalid/bench/repo{i}",
+        'clone_url': clone_url, 'stargazers_count': 100000 - i, 'forks_count': i % 50,
+        'language': 'Python', 'size': 1, 'created_at': '2015-01-01T00:00:00Z',
+        'updated_at': '2020-01-01T00:00:00Z', 'pushed_at': '2020-01-01T00:00:00Z',
+        'topics': [], 'license': None, 'archived': False, 'default_branch': 'main'
+    }
+
+
+def make_file_contents(files: int, file_size: int) -> List[Tuple[str, bytes]]:
+    """Deterministic, moderately compressible file contents for archives and git."""
+    line = b"def benchmark(value):\n    return value * 2  # padding to make files compress like code\n"
+    body = (line * (file_size // len(line) + 1))[:file_size]
+    return [(f"src/module{i}.py", body) for i in range(files)]
+
+
+def build_archives(contents: List[Tuple[str, bytes]]) -> Dict[str, bytes]:
+    """Build the ZIP and gzipped tar archives served for every repository."""
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in contents:
+            archive.writestr(f"repo-main/{name}", data)
+
+    tar_buffer = io.BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode='w:gz') as archive:
+        for name, data in contents:
+            info = tarfile.TarInfo(f"repo-main/{name}")
+            info.size = len(data)
+            info.mtime = 1577836800
+            archive.addfile(info, io.BytesIO(data))
+
+    return {'zip': zip_buffer.getvalue(), 'tar.gz': tar_buffer.getvalue()}
+
+
+def make_bare_repository(root: Path, contents: List[Tuple[str, bytes]]) -> Path:
+    """Create a bare git repository with one commit on ``main`` holding ``contents``."""
+    work = root / "work"
+    bare = root / "bench.git"
+    env = {**os.environ, 'GIT_AUTHOR_NAME': 'bench', 'GIT_AUTHOR_EMAIL': 'bench@example.invalid',
+           'GIT_COMMITTER_NAME': 'bench', 'GIT_COMMITTER_EMAIL': 'bench@example.invalid'}
+
+    subprocess.run(['git', 'init', '-q', '-b', 'main', str(work)], check=True, env=env)
+    for name, data in contents:
+        path = work / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    subprocess.run(['git', '-C', str(work), 'add', '-A'], check=True, env=env)
+    subprocess.run(['git', '-C', str(work), 'commit', '-q', '-m', 'Benchmark fixture'], check=True, env=env)
+    subprocess.run(['git', 'clone', '-q', '--bare', str(work), str(bare)], check=True, env=env)
+    return bare
+
+
+class MockGitHub:
+    """Local HTTP server standing in for the search API and archive downloads.
+
+    ``/search/repositories`` serves ``total`` fake repositories sorted by
+    stars, paginated like the real API (at most 1000 results per query), and
+    ``/<owner>/<name>/archive/refs/heads/<branch>.zip`` / ``.tar.gz`` serve the
+    shared archives. Every response is delayed by ``latency`` seconds. Search
+    responses carry ``X-RateLimit-*`` headers; with ``rate_limit`` set, requests
+    beyond that many per ``rate_window`` seconds get a rate-limited 403 until
+    the window resets.
+    """
+
+    def __init__(self, total: int, clone_url: str, archives: Dict[str, bytes], latency: float = 0.0,
+                 rate_limit: Optional[int] = None, rate_window: float = 60.0):
+        self.items = [make_search_item(i, clone_url) for i in range(total)]
+        self.archives = archives
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.requests = 0
+        self.rate_limited = 0
+        self.window_start = time.time()
+        self.window_count = 0
+        self.lock = threading.Lock()
+
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this Nagle's
+            # algorithm and delayed ACKs add ~40ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                mock.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'MockGitHub':
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler: BaseHTTPRequestHandler) -> None:
+        """Serve one request."""
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(handler.path)
+        if url.path == '/search/repositories':
+            self._search(handler, parse_qs(url.query))
+        elif url.path.endswith('.zip'):
+            self._send(handler, 200, self.archives['zip'], 'application/zip')
+        elif url.path.endswith('.tar.gz'):
+            self._send(handler, 200, self.archives['tar.gz'], 'application/gzip')
+        else:
+            self._send(handler, 404, b'{"message": "Not Found"}')
+
+    def _search(self, handler: BaseHTTPRequestHandler, query: Dict[str, List[str]]) -> None:
+        headers, allowed = self._rate_limit_headers()
+        if not allowed:
+            self._send(handler, 403, b'{"message": "API rate limit exceeded"}', headers=headers)
+            return
+
+        per_page = min(int(query.get('per_page', ['30'])[0]), 100)
+        page = int(query.get('page', ['1'])[0])
+        start = (page - 1) * per_page
+        items = self.items[:1000][start:start + per_page]
+        body = json.dumps({'total_count': len(self.items), 'incomplete_results': False, 'items': items})
+        self._send(handler, 200, body.encode(), headers=headers)
+
+    def _rate_limit_headers(self) -> Tuple[Dict[str, str], bool]:
+        """Count a search request against the window and build its rate limit headers."""
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= self.rate_window:
+                self.window_start = now
+                self.window_count = 0
+            self.window_count += 1
+            limit = self.rate_limit or 1000000
+            remaining = max(0, limit - self.window_count)
+            allowed = self.window_count <= limit
+            if not allowed:
+                self.rate_limited += 1
+            reset = math.ceil(self.window_start + self.rate_window)
+
+        return {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(reset),
+            'X-RateLimit-Resource': 'search',
+        }, allowed
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, body: bytes,
+              content_type: str = 'application/json', headers: Optional[Dict[str, str]] = None) -> None:
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def measure(func: Callable, memory: bool = False) -> Tuple[float, Optional[int], object]:
+    """Run ``func`` with its output silenced, returning (seconds, peak traced bytes, result)."""
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+            result = func()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return seconds, peak, result
+
+
+def make_fetcher(mock: MockGitHub) -> GitHubCodeFetcher:
+    """Build a fresh fetcher pointed at the mock server (fresh rate limit buckets and telemetry)."""
+    # A token selects the authenticated rate limits; the mock does not check it
+    fetcher = GitHubCodeFetcher(token="benchmark")
+    fetcher.base_url = mock.url
+    fetcher.web_url = mock.url
+    return fetcher
+
+
+def run_benchmarks(
+    sizes: List[int],
+    methods: List[str],
+    jobs: int = 8,
+    concurrency: int = 4,
+    latency: float = 0.0,
+    rate_limit: Optional[int] = None,
+    rate_window: float = 60.0,
+    memory: bool = False,
+    files: int = DEFAULT_FILES,
+    file_size: int = DEFAULT_FILE_SIZE
+) -> List[Dict]:
+    """Run the search and download benchmarks against a local mock GitHub.
+
+    Args:
+        sizes: Numbers of repositories to search for and download
+        methods: Download methods to benchmark ('zip', 'tarball', 'clone')
+        jobs: Parallel downloads in parallel mode
+        concurrency: Parallel search page requests in parallel mode
+        latency: Seconds the mock server waits before every response
+        rate_limit: Search requests allowed per ``rate_window`` (unlimited if None)
+        rate_window: Rate limit window in seconds
+        memory: Trace peak Python memory (slows the measured code down)
+        files: Files per fake repository
+        file_size: Size in bytes of each file
+
+    Returns:
+        One result dictionary per benchmark run
+    """
+    results = []
+    contents = make_file_contents(files, file_size)
+
+    with tempfile.TemporaryDirectory(prefix="fetcher-bench-") as tmpdir:
+        root = Path(tmpdir)
+        clone_url = make_bare_repository(root, contents).as_uri()
+
+        with MockGitHub(max(sizes), clone_url, build_archives(contents), latency, rate_limit, rate_window) as mock:
+            for size in sizes:
+                for mode, pages in (('serial', 1), ('parallel', concurrency)):
+                    fetcher = make_fetcher(mock)
+                    seconds, peak, found = measure(lambda: fetcher.search_repositories(
+                        "benchmark", max_results=size, per_page=100, concurrency=pages
+                    ), memory)
+                    results.append(_result('search', 'api', mode, size, len(found), seconds, peak, fetcher))
+
+                repositories = [parse_repository(item) for item in mock.items[:size]]
+                for method in methods:
+                    for mode, workers in (('serial', 1), ('parallel', jobs)):
+                        fetcher = make_fetcher(mock)
+                        download_dir = root / f"{method}-{mode}-{size}"
+                        seconds, peak, downloaded = measure(lambda: fetcher.download_repositories(
+                            repositories, str(download_dir), method, jobs=workers
+                        ), memory)
+                        succeeded = sum(1 for ok in downloaded.values() if ok)
+                        results.append(_result('download', method, mode, size, succeeded, seconds, peak, fetcher))
+                        shutil.rmtree(download_dir, ignore_errors=True)
+
+    return results
+
+
+def _result(benchmark: str, method: str, mode: str, size: int, completed: int,
+            seconds: float, peak: Optional[int], fetcher: GitHubCodeFetcher) -> Dict:
+    """Build one result row from a measurement and the fetcher's telemetry."""
+    summary = fetcher.telemetry.summary()
+    transferred = sum(stats['bytes'] for stats in summary['requests'].values())
+    return {
+        'benchmark': benchmark,
+        'method': method,
+        'mode': mode,
+        'repos': size,
+        'completed': completed,
+        'seconds': round(seconds, 4),
+        'repos_per_second': round(completed / seconds, 1) if seconds else 0.0,
+        'bytes_transferred': transferred,
+        'mb_per_second': round(transferred / seconds / 1024 / 1024, 2) if seconds else 0.0,
+        'requests': sum(stats['count'] for stats in summary['requests'].values()),
+        'connections': sum(host['connections'] for host in fetcher.connection_stats().values()),
+        'rate_limit_wait': round(sum(stats['wait_seconds'] for stats in summary['requests'].values()), 3),
+        'peak_memory': peak,
+    }
+
+
+@click.command()
+@click.option('--sizes', default='10,100,1000', help='Comma-separated numbers of repositories')
+@click.option('--methods', default='zip,tarball,clone', help='Comma-separated download methods to benchmark')
+@click.option('--jobs', default=8, type=click.IntRange(min=1), help='Parallel downloads in parallel mode')
+@click.option('--search-concurrency', default=4, type=click.IntRange(min=1),
+              help='Parallel search page requests in parallel mode')
+@click.option('--latency', default=0.0, type=click.FloatRange(min=0), help='Mock server latency per response in ms')
+@click.option('--rate-limit', type=click.IntRange(min=1), help='Search requests allowed per rate limit window')
+@click.option('--rate-window', default=60.0, type=click.FloatRange(min=1), help='Rate limit window in seconds')
+@click.option('--files', default=DEFAULT_FILES, type=click.IntRange(min=1), help='Files per fake repository')
+@click.option('--file-size', default=DEFAULT_FILE_SIZE, type=click.IntRange(min=1), help='Bytes per file')
+@click.option('--memory', is_flag=True, help='Trace peak Python memory (slows the benchmarks down)')
+@click.option('--json', 'json_file', help='Also write the results to this JSON file')
+def main(sizes, methods, jobs, search_concurrency, latency, rate_limit, rate_window, files, file_size,
+         memory, json_file):
+    """Benchmark search and downloads against a local mock GitHub."""
+    size_list = [int(size) for size in sizes.split(',') if size.strip()]
+    method_list = [method.strip() for method in methods.split(',') if method.strip()]
+    unknown = set(method_list) - {'zip', 'tarball', 'clone'}
+    if unknown:
+        raise click.BadParameter(f"Unknown method(s): {', '.join(sorted(unknown))}", param_hint='--methods')
+
+    results = run_benchmarks(
+        size_list, method_list, jobs, search_concurrency, latency / 1000, rate_limit, rate_window,
+        memory, files, file_size
+    )
+
+    click.echo(f"{'benchmark':<10} {'method':<8} {'mode':<9} {'repos':>6} {'seconds':>9} "
+               f"{'repos/s':>9} {'MB/s':>8} {'reqs':>6} {'conns':>6} {'wait s':>7} {'peak mem':>10}")
+    for row in results:
+        peak = format_size(row['peak_memory']) if row['peak_memory'] is not None else '-'
+        click.echo(f"{row['benchmark']:<10} {row['method']:<8} {row['mode']:<9} {row['repos']:>6} "
+                   f"{row['seconds']:>9.3f} {row['repos_per_second']:>9.1f} {row['mb_per_second']:>8.2f} "
+                   f"{row['requests']:>6} {row['connections']:>6} "
+                   f"{row['rate_limit_wait']:>7.1f} {peak:>10}")
+
+    if json_file:
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        click.echo(f"\nResults saved to {json_file}")
+
+
+if __name__ == "__main__":
+    main()
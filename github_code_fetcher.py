@@ -21,74 +21,1708 @@ import os
 import sys
 import csv
 import json
+import math
+import time
+import random
+import gzip
+import io
+import hashlib
+import heapq
+import sqlite3
+import threading
+import shutil
+import tarfile
+import tempfile
+import uuid
 import zipfile
-import requests
 import re
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from urllib.parse import urljoin
 import click
-import pandas as pd
-from tqdm import tqdm
-import git
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# requests, GitPython, tqdm, python-dotenv and asyncio are imported lazily on
+# the code paths that need them, so `--help` and other light invocations start fast
+_ENV_LOADED = False
+
+# GitHub search never returns more than this many results for one query
+SEARCH_RESULT_LIMIT = 1000
+
+# No repository on GitHub was created before this date
+SEARCH_EPOCH = date(2007, 10, 1)
+
+# Repository fields used to merge sharded search results for each sort option
+SORT_FIELDS = {'stars': 'stars', 'updated': 'updated_at'}
+
+# Default read size for archive downloads and extraction (1 MiB)
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Keep-alive connections kept open per host; parallel downloads and search
+# pages beyond this many would open (and throw away) extra connections
+DEFAULT_POOL_SIZE = 32
+
+# ZIP archives larger than this are spooled to disk instead of memory (64 MiB)
+DEFAULT_SPOOL_SIZE = 64 * 1024 * 1024
+
+# Column order for metadata output
+METADATA_COLUMNS = [
+    'name', 'full_name', 'description', 'stars', 'forks', 'language',
+    'html_url', 'clone_url', 'size', 'created_at', 'updated_at',
+    'pushed_at', 'topics', 'license', 'archived', 'default_branch', 'downloaded_at'
+]
+
+# Column order for code search metadata output
+CODE_COLUMNS = ['repository', 'path', 'name', 'sha', 'html_url', 'score', 'downloaded_at']
+
+# Extra metadata columns filled in by GraphQL enrichment
+ENRICHMENT_COLUMNS = [
+    'latest_commit_sha', 'commit_count', 'languages', 'root_entry_count',
+    'latest_release', 'latest_release_at', 'disk_usage'
+]
+
+# GraphQL nodes(ids:) accepts at most 100 IDs per query
+GRAPHQL_BATCH_SIZE = 100
+
+ENRICHMENT_QUERY = """
+query($ids: [ID!]!) {
+  rateLimit { cost remaining resetAt }
+  nodes(ids: $ids) {
+    ... on Repository {
+      id
+      pushedAt
+      diskUsage
+      defaultBranchRef { target { ... on Commit { oid history { totalCount } } } }
+      languages(first: 20, orderBy: {field: SIZE, direction: DESC}) { edges { size node { name } } }
+      latestRelease { tagName publishedAt }
+      object(expression: "HEAD:") { ... on Tree { entries { name } } }
+    }
+  }
+}
+"""
+
+# Per-download-directory record of the push timestamps we last downloaded
+SYNC_STATE_FILE = ".sync_state.json"
+
+# Downloads are written to a hidden "<name>-*.partial" folder and renamed into place
+PARTIAL_SUFFIX = ".partial"
+
+# While a download replaces an existing folder, the old one is kept as ".<name>.old.partial"
+BACKUP_SUFFIX = ".old" + PARTIAL_SUFFIX
+
+# Job manifests live next to the topic folder as "<topic>.manifest.jsonl"
+MANIFEST_SUFFIX = ".manifest.jsonl"
+
+# Batch mode downloads each repository once into this folder under the download directory
+STORE_DIR = ".store"
+
+# Every search result is also recorded in this local SQLite/FTS5 index
+DEFAULT_INDEX_FILE = os.path.join("metadata", "repositories.sqlite")
+
+# Keys accepted for each query in a batch file
+BATCH_QUERY_KEYS = ('query', 'language', 'min_stars', 'max_results', 'sort', 'order')
+
+# Default weights of the ranking formula: log-scaled stars, forks and size (a
+# negative weight is a penalty) plus recency, 1.0 for an update today halving
+# every recency half-life
+DEFAULT_RANK_WEIGHTS = {'stars': 1.0, 'forks': 0.5, 'recency': 1.0, 'size': -0.1}
+
+# Corpus shard formats written by the package command (tar.zst needs zstandard)
+CORPUS_FORMATS = ('jsonl.gz', 'tar.zst')
+
+# Language recorded in the corpus index for each file extension
+EXTENSION_LANGUAGES = {
+    '.py': 'Python', '.pyi': 'Python', '.ipynb': 'Jupyter Notebook', '.js': 'JavaScript', '.mjs': 'JavaScript',
+    '.jsx': 'JavaScript', '.ts': 'TypeScript', '.tsx': 'TypeScript', '.java': 'Java', '.kt': 'Kotlin',
+    '.scala': 'Scala', '.go': 'Go', '.rs': 'Rust', '.c': 'C', '.h': 'C', '.cc': 'C++', '.cpp': 'C++',
+    '.cxx': 'C++', '.hpp': 'C++', '.cs': 'C#', '.rb': 'Ruby', '.php': 'PHP', '.swift': 'Swift', '.m': 'Objective-C',
+    '.r': 'R', '.jl': 'Julia', '.lua': 'Lua', '.pl': 'Perl', '.sh': 'Shell', '.bash': 'Shell', '.sql': 'SQL',
+    '.html': 'HTML', '.css': 'CSS', '.scss': 'SCSS', '.vue': 'Vue', '.dart': 'Dart', '.hs': 'Haskell',
+    '.ex': 'Elixir', '.exs': 'Elixir', '.erl': 'Erlang', '.clj': 'Clojure', '.ml': 'OCaml', '.md': 'Markdown',
+    '.rst': 'reStructuredText', '.json': 'JSON', '.yaml': 'YAML', '.yml': 'YAML', '.toml': 'TOML', '.xml': 'XML',
+}
+
+def _load_environment() -> None:
+    """Load environment variables from a .env file, once per process."""
+    global _ENV_LOADED
+    if not _ENV_LOADED:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _ENV_LOADED = True
 
 def sanitize_folder_name(query: str, language: str = None, min_stars: int = 0) -> str:
     """Create a safe folder name from the search query and filters.
     
-    Args:
-        query: Original search query
-        language: Programming language filter
-        min_stars: Minimum star count filter
+    Args:
+        query: Original search query
+        language: Programming language filter
+        min_stars: Minimum star count filter
+        
+    Returns:
+        Sanitized folder name
+    """
+    # Remove special characters and replace spaces with underscores
+    folder_name = re.sub(r'[<>:"/\\|?*]', '', query)
+    folder_name = re.sub(r'\s+', '_', folder_name.strip())
+    
+    # Add language suffix if specified
+    if language:
+        folder_name += f"_{language}"
+    
+    # Add star filter suffix if specified
+    if min_stars > 0:
+        folder_name += f"_min{min_stars}stars"
+    
+    # Limit length and ensure it's not empty
+    folder_name = folder_name[:50]  # Limit to 50 characters
+    if not folder_name:
+        folder_name = "search_results"
+    
+    return folder_name
+
+def parse_repository(repo: Dict) -> Dict:
+    """Convert a repository item from the GitHub search API to our record format.
+    
+    Args:
+        repo: Repository item as returned by the search API
+        
+    Returns:
+        Repository dictionary
+    """
+    return {
+        'name': repo['name'],
+        'full_name': repo['full_name'],
+        'node_id': repo.get('node_id', ''),
+        'description': repo.get('description', ''),
+        'html_url': repo['html_url'],
+        'clone_url': repo['clone_url'],
+        'stars': repo['stargazers_count'],
+        'forks': repo['forks_count'],
+        'language': repo.get('language', ''),
+        'size': repo['size'],
+        'created_at': repo['created_at'],
+        'updated_at': repo['updated_at'],
+        'pushed_at': repo.get('pushed_at', ''),
+        'topics': repo.get('topics', []),
+        'license': repo.get('license', {}).get('name', '') if repo.get('license') else '',
+        'archived': repo.get('archived', False),
+        'fork': repo.get('fork', False),
+        'default_branch': repo.get('default_branch', 'main')
+    }
+
+def parse_code_result(item: Dict) -> Dict:
+    """Convert a code search API item to our file record format.
+    
+    Args:
+        item: File item as returned by the code search API
+        
+    Returns:
+        File dictionary
+    """
+    return {
+        'repository': item['repository']['full_name'],
+        'path': item['path'],
+        'name': item['name'],
+        'sha': item['sha'],
+        'html_url': item.get('html_url', ''),
+        'score': item.get('score'),
+    }
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA-1 that git assigns to a blob with the given contents."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def _strip_archive_prefix(root: Path, name: str) -> Optional[Path]:
+    """Map an archive member name to a path under ``root`` without its top-level folder.
+    
+    GitHub archives wrap everything in a ``name-branch/`` folder. Returns None
+    for the top-level folder itself and for names that would escape ``root``.
+    """
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if len(parts) < 2 or '..' in parts or os.path.isabs(name):
+        return None
+    return root.joinpath(*parts[1:])
+
+
+def _safe_join(root: Path, relative: str) -> Optional[Path]:
+    """Join a repository-relative path onto ``root``, or None if it would escape ``root``."""
+    parts = [part for part in relative.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts or os.path.isabs(relative):
+        return None
+    return root.joinpath(*parts)
+
+
+def _directory_size(path: Path) -> int:
+    """Total size in bytes of the files under ``path``."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def remove_partial_downloads(download_dir: str) -> int:
+    """Delete temporary folders left behind by interrupted downloads.
+    
+    A backup of a repository that was being replaced is moved back into
+    place if the interruption left the repository itself missing.
+    
+    Args:
+        download_dir: Directory the downloads were written to
+        
+    Returns:
+        Number of folders removed
+    """
+    removed = 0
+    for path in Path(download_dir).glob(f".*{BACKUP_SUFFIX}"):
+        original = path.with_name(path.name[1:-len(BACKUP_SUFFIX)])
+        if path.is_dir() and not original.exists():
+            path.rename(original)
+    for path in Path(download_dir).glob(f".*{PARTIAL_SUFFIX}"):
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def load_batch_file(path: str) -> List[Dict]:
+    """Read query specifications for batch mode from a YAML or JSON file.
+    
+    The file holds either a list of queries or a mapping with ``queries`` and
+    optional ``defaults`` applied to every query. A query is a search string
+    or a mapping with any of the keys in ``BATCH_QUERY_KEYS``.
+    
+    Args:
+        path: Batch file (``.yaml``/``.yml`` needs PyYAML, anything else is read as JSON)
+        
+    Returns:
+        List of query dictionaries
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is required for YAML batch files (pip install pyyaml); or use JSON")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    
+    defaults = {}
+    if isinstance(data, dict):
+        defaults = data.get('defaults') or {}
+        data = data.get('queries') or []
+    
+    queries = []
+    for entry in data:
+        spec = {**defaults, **({'query': entry} if isinstance(entry, str) else entry)}
+        unknown = set(spec) - set(BATCH_QUERY_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown batch query keys: {', '.join(sorted(unknown))}")
+        if not spec.get('query'):
+            raise ValueError(f"Batch entry without a query: {entry}")
+        queries.append(spec)
+    return queries
+
+
+def link_repository(source: Path, link_path: Path, mode: str = "symlink") -> None:
+    """Make a downloaded repository from the content store appear in a topic folder.
+    
+    Args:
+        source: Repository folder in the content store
+        link_path: Path in the topic folder
+        mode: 'symlink' for a relative directory symlink, 'hardlink' to mirror
+            the tree with hard-linked files
+    """
+    if link_path.exists() or link_path.is_symlink():
+        return
+    link_path.parent.mkdir(parents=True, exist_ok=True)
+    if mode == "symlink":
+        link_path.symlink_to(os.path.relpath(source, link_path.parent), target_is_directory=True)
+    else:
+        shutil.copytree(source, link_path, symlinks=True, copy_function=os.link)
+
+
+class _ProgressReader:
+    """File-like wrapper that reports bytes read to a tqdm progress bar."""
+    
+    def __init__(self, raw, pbar):
+        self.raw = raw
+        self.pbar = pbar
+        self.bytes_read = 0
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.pbar.update(len(data))
+        self.bytes_read += len(data)
+        return data
+
+
+class Telemetry:
+    """Thread-safe collector for request, download and phase timings.
+    
+    ``RequestScheduler`` reports every request with its latency, retries and
+    time spent waiting on rate limits; the download code reports bytes,
+    per-repository throughput and the time spent in each phase (search,
+    transfer, extract, clone, checkout, ...). Phases are wall-clock totals
+    summed over all threads, so with parallel downloads they can exceed the
+    run time, and nested phases (enrichment within search) overlap.
+    
+    Counts, totals, mean and maximum latency cover everything recorded, but
+    memory stays bounded for long-lived processes such as ``serve``: latency
+    percentiles are taken over the last ``max_latencies`` requests per
+    resource and only the last ``max_downloads`` repository downloads are
+    listed individually.
+    """
+    
+    def __init__(self, max_latencies: int = 10000, max_downloads: int = 1000):
+        self.started = time.monotonic()
+        self.max_latencies = max_latencies
+        self.requests = {}
+        self.phases = {}
+        self.downloads = deque(maxlen=max_downloads)
+        self.download_totals = {'count': 0, 'succeeded': 0, 'bytes': 0, 'seconds': 0.0}
+        self.connections = {}
+        self.lock = threading.Lock()
+    
+    def _resource(self, resource: Optional[str]) -> Dict:
+        return self.requests.setdefault(resource or 'unpaced', {
+            'count': 0, 'errors': 0, 'retries': 0, 'wait_seconds': 0.0, 'bytes': 0,
+            'latency_total': 0.0, 'latency_max': 0.0, 'latencies': deque(maxlen=self.max_latencies)
+        })
+    
+    def record_request(self, resource: Optional[str], latency: float, status: Optional[int],
+                       retries: int = 0, wait: float = 0.0) -> None:
+        """Record one request after its final attempt.
+        
+        Args:
+            resource: Rate limit resource the request was paced against
+            latency: Seconds until the response headers of the final attempt arrived
+            status: Final HTTP status, or None if the request raised
+            retries: Number of retried attempts
+            wait: Seconds spent waiting on token buckets, rate limits and backoff
+        """
+        with self.lock:
+            stats = self._resource(resource)
+            stats['count'] += 1
+            stats['errors'] += status is None or status >= 400
+            stats['retries'] += retries
+            stats['wait_seconds'] += wait
+            stats['latency_total'] += latency
+            stats['latency_max'] = max(stats['latency_max'], latency)
+            stats['latencies'].append(latency)
+    
+    def add_wait(self, resource: Optional[str], seconds: float) -> None:
+        """Record time spent waiting on a rate limit outside a request."""
+        with self.lock:
+            self._resource(resource)['wait_seconds'] += seconds
+    
+    def add_bytes(self, resource: Optional[str], num_bytes: int) -> None:
+        """Record response body bytes received for a resource."""
+        with self.lock:
+            self._resource(resource)['bytes'] += num_bytes
+    
+    def add_phase(self, name: str, seconds: float) -> None:
+        """Add time spent in a phase."""
+        with self.lock:
+            stats = self.phases.setdefault(name, {'count': 0, 'seconds': 0.0})
+            stats['count'] += 1
+            stats['seconds'] += seconds
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Context manager that times the enclosed block as a phase."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.monotonic() - start)
+    
+    def record_download(self, full_name: str, method: str, success: bool, num_bytes: int, duration: float) -> None:
+        """Record one repository download with its size on disk and duration."""
+        with self.lock:
+            self.downloads.append({
+                'full_name': full_name, 'method': method, 'success': success,
+                'bytes': num_bytes, 'duration': round(duration, 3),
+                'throughput': round(num_bytes / duration, 1) if duration > 0 else 0.0
+            })
+            self.download_totals['count'] += 1
+            self.download_totals['succeeded'] += success
+            self.download_totals['bytes'] += num_bytes
+            self.download_totals['seconds'] += duration
+    
+    def set_connections(self, connections: Dict[str, Dict]) -> None:
+        """Record per-host connection reuse, see ``GitHubCodeFetcher.connection_stats``."""
+        with self.lock:
+            self.connections = dict(connections)
+    
+    def summary(self) -> Dict:
+        """Aggregate everything recorded so far into a JSON-serialisable dict."""
+        with self.lock:
+            requests_summary = {}
+            for resource, stats in self.requests.items():
+                latencies = sorted(stats['latencies'])
+                requests_summary[resource] = {
+                    **{key: value for key, value in stats.items() if not key.startswith('latenc')},
+                    'wait_seconds': round(stats['wait_seconds'], 3),
+                    'latency': {
+                        'mean': round(stats['latency_total'] / stats['count'], 4) if stats['count'] else 0.0,
+                        'p50': round(_percentile(latencies, 50), 4),
+                        'p95': round(_percentile(latencies, 95), 4),
+                        'max': round(stats['latency_max'], 4),
+                    }
+                }
+            downloads = list(self.downloads)
+            totals = dict(self.download_totals)
+            phases = {name: {'count': stats['count'], 'seconds': round(stats['seconds'], 3)}
+                      for name, stats in self.phases.items()}
+            connections = dict(self.connections)
+        
+        return {
+            'duration': round(time.monotonic() - self.started, 3),
+            'requests': requests_summary,
+            'phases': phases,
+            'connections': connections,
+            'downloads': {
+                'count': totals['count'],
+                'succeeded': totals['succeeded'],
+                'failed': totals['count'] - totals['succeeded'],
+                'bytes': totals['bytes'],
+                'seconds': round(totals['seconds'], 3),
+                # The most recent downloads only, see the class docstring
+                'repositories': downloads,
+            },
+        }
+    
+    def write_json(self, path: str) -> None:
+        """Write the summary as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+    
+    def write_prometheus(self, path: str) -> None:
+        """Write the summary in the Prometheus text exposition format.
+        
+        The file can be picked up by the node exporter's textfile collector.
+        """
+        summary = self.summary()
+        prefix = 'github_fetcher'
+        lines = []
+        
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines.extend(f"{prefix}_{name}{labels} {value}" for labels, value in samples)
+        
+        requests_by_resource = summary['requests'].items()
+        metric('run_duration_seconds', 'gauge', 'Wall-clock duration of the run.',
+               [('', summary['duration'])])
+        metric('requests_total', 'counter', 'Requests sent, by rate limit resource.',
+               [(f'{{resource="{r}"}}', s['count']) for r, s in requests_by_resource])
+        metric('request_errors_total', 'counter', 'Requests that failed or returned an error status.',
+               [(f'{{resource="{r}"}}', s['errors']) for r, s in requests_by_resource])
+        metric('request_retries_total', 'counter', 'Retried request attempts.',
+               [(f'{{resource="{r}"}}', s['retries']) for r, s in requests_by_resource])
+        metric('request_wait_seconds_total', 'counter', 'Time spent waiting on rate limits and backoff.',
+               [(f'{{resource="{r}"}}', s['wait_seconds']) for r, s in requests_by_resource])
+        metric('response_bytes_total', 'counter', 'Response bytes received.',
+               [(f'{{resource="{r}"}}', s['bytes']) for r, s in requests_by_resource])
+        metric('request_latency_seconds', 'gauge', 'Request latency percentiles.',
+               [(f'{{resource="{r}",quantile="{q}"}}', s['latency'][q])
+                for r, s in requests_by_resource for q in ('p50', 'p95', 'max')])
+        metric('connections_opened_total', 'counter', 'Connections opened (TLS handshakes for https), by host.',
+               [(f'{{host="{h}"}}', c['connections']) for h, c in summary['connections'].items()])
+        metric('connection_requests_total', 'counter', 'Requests sent over pooled connections, by host.',
+               [(f'{{host="{h}"}}', c['requests']) for h, c in summary['connections'].items()])
+        metric('phase_seconds_total', 'counter', 'Time spent in each phase.',
+               [(f'{{phase="{p}"}}', s['seconds']) for p, s in summary['phases'].items()])
+        downloads = summary['downloads']
+        metric('downloads_total', 'counter', 'Repository downloads, by outcome.',
+               [('{status="succeeded"}', downloads['succeeded']), ('{status="failed"}', downloads['failed'])])
+        metric('download_bytes_total', 'counter', 'Bytes on disk of downloaded repositories.',
+               [('', downloads['bytes'])])
+        metric('download_seconds_total', 'counter', 'Time spent downloading repositories.',
+               [('', downloads['seconds'])])
+        
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def _wire_bytes(response) -> int:
+    """Bytes a fully read response took on the wire (its compressed size if gzip-encoded)."""
+    wire = response.raw.tell() if hasattr(response.raw, 'tell') else None
+    return wire if isinstance(wire, int) and wire > 0 else len(response.content)
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 if empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to pace requests against one API resource."""
+    
+    def __init__(self, rate: float, capacity: float):
+        """Initialize the bucket.
+        
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+    
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available.
+        
+        Returns:
+            Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+    
+    def block_for(self, seconds: float) -> None:
+        """Stop handing out tokens for the given number of seconds and drain the bucket."""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class RequestScheduler:
+    """Central scheduler for GitHub requests.
+    
+    Paces requests per API resource with token buckets, honours the
+    ``X-RateLimit-*`` and ``Retry-After`` headers and retries rate-limited
+    (403/429) and server-error (5xx) responses with jittered exponential backoff.
+    """
+    
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    
+    def __init__(self, authenticated: bool = False, max_retries: int = 6,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 telemetry: Optional[Telemetry] = None):
+        """Initialize the scheduler.
+        
+        Args:
+            authenticated: Whether requests carry a token (raises the rate limits)
+            max_retries: Maximum number of retries per request
+            backoff_base: Initial backoff delay in seconds
+            backoff_max: Upper bound for a single backoff delay in seconds
+            telemetry: Optional collector for per-request latency, retries and waits
+        """
+        self.telemetry = telemetry
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Search: 30 req/min authenticated, 10 unauthenticated; core: 5000/h or 60/h
+        search_per_minute = 30 if authenticated else 10
+        core_per_hour = 5000 if authenticated else 60
+        self.buckets = {
+            'search': TokenBucket(search_per_minute / 60.0, search_per_minute),
+            'core': TokenBucket(core_per_hour / 3600.0, min(core_per_hour, 100)),
+            # GraphQL limits are in points; enrich_repositories also tracks the point budget
+            'graphql': TokenBucket(5000 / 3600.0, 100),
+            # Code search needs a token and allows 10 requests per minute
+            'code_search': TokenBucket(10 / 60.0, 10),
+        }
+    
+    def request(self, session, method: str, url: str, resource: Optional[str] = 'core', **kwargs):
+        """Send a request, pacing and retrying it as needed.
+        
+        Args:
+            session: requests session used to send the request
+            method: HTTP method
+            url: Request URL
+            resource: Rate limit resource ('search', 'code_search', 'core', 'graphql') or None for no pacing
+            **kwargs: Passed through to ``session.request``
+            
+        Returns:
+            The final response (callers still call ``raise_for_status``)
+        """
+        import requests
+        
+        bucket = self.buckets.get(resource)
+        attempt = 0
+        waited = 0.0
+        
+        while True:
+            if bucket:
+                waited += bucket.acquire()
+            
+            start = time.monotonic()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    self._record(resource, time.monotonic() - start, None, attempt, waited)
+                    raise
+                delay = self._backoff(attempt)
+                time.sleep(delay)
+                waited += delay
+                attempt += 1
+                continue
+            latency = time.monotonic() - start
+            
+            delay = self._retry_delay(response, attempt)
+            rate_limit_wait = self._rate_limit_wait(response)
+            if rate_limit_wait is not None:
+                bucket = self.buckets.get(response.headers.get('X-RateLimit-Resource', resource), bucket)
+                if bucket:
+                    bucket.block_for(rate_limit_wait)
+            
+            if delay is None or attempt >= self.max_retries:
+                self._record(resource, latency, response.status_code, attempt, waited)
+                return response
+            
+            response.close()
+            time.sleep(delay)
+            waited += delay
+            attempt += 1
+    
+    def _record(self, resource: Optional[str], latency: float, status: Optional[int],
+                retries: int, waited: float) -> None:
+        """Report a finished request to the telemetry collector, if any."""
+        if self.telemetry is not None:
+            self.telemetry.record_request(resource, latency, status, retries, waited)
+    
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for the given attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    
+    def _rate_limit_wait(self, response) -> Optional[float]:
+        """Seconds until the rate limit window resets if the quota is exhausted."""
+        if response.headers.get('X-RateLimit-Remaining') != '0':
+            return None
+        reset = response.headers.get('X-RateLimit-Reset')
+        if not reset:
+            return None
+        return max(0.0, float(reset) - time.time()) + 1
+    
+    def _retry_delay(self, response, attempt: int) -> Optional[float]:
+        """How long to wait before retrying a response, or None if it should not be retried."""
+        status = response.status_code
+        rate_limited = status == 403 and (
+            'Retry-After' in response.headers
+            or response.headers.get('X-RateLimit-Remaining') == '0'
+        )
+        if status not in self.RETRY_STATUSES and not rate_limited:
+            return None
+        
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        wait = self._rate_limit_wait(response)
+        if wait is not None:
+            return wait
+        return self._backoff(attempt)
+
+class ResponseCache:
+    """Persistent SQLite cache for GitHub API JSON responses.
+    
+    Entries younger than ``ttl`` are served without touching the network.
+    Older entries are revalidated with ``If-None-Match`` so an unchanged
+    response comes back as a 304, which GitHub does not count against the
+    rate limit. The least recently used entries are evicted once the cache
+    grows beyond ``max_size`` bytes.
+    """
+    
+    def __init__(self, path: str, ttl: float = 3600, max_size: int = 100 * 1024 * 1024):
+        """Open (or create) the cache database.
+        
+        Args:
+            path: SQLite database file
+            ttl: Seconds an entry is served without revalidation
+            max_size: Maximum total size of cached bodies in bytes
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, etag TEXT, body TEXT NOT NULL, size INTEGER NOT NULL, "
+            "fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+    
+    @staticmethod
+    def make_key(url: str, params: Dict) -> str:
+        """Build a cache key from a request URL and its full parameter dict."""
+        return hashlib.sha256(json.dumps([url, params], sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Look up a cached response.
+        
+        Returns:
+            Dict with 'body', 'etag' and 'fresh' keys, or None on a miss
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, body, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+        etag, body, fetched_at = row
+        return {'body': json.loads(body), 'etag': etag, 'fresh': time.time() - fetched_at < self.ttl}
+    
+    def put(self, key: str, body: Dict, etag: Optional[str] = None) -> None:
+        """Store a response body and evict old entries if over the size limit."""
+        payload = json.dumps(body)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, etag, body, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, payload, len(payload), now, now)
+            )
+            self._evict()
+            self.conn.commit()
+    
+    def touch(self, key: str) -> None:
+        """Mark an entry as revalidated (after a 304 response)."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?", (now, now, key)
+            )
+            self.conn.commit()
+    
+    def _evict(self) -> None:
+        """Delete least recently used entries until the cache fits in max_size."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in self.conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if total <= self.max_size:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+    
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self.lock:
+            self.conn.close()
+
+class MetadataIndex:
+    """Local SQLite index of every repository seen in search results.
+    
+    Records are upserted by ``full_name`` with their full metadata, plus
+    indexed ``stars``, ``language`` and ``updated_at`` columns and an FTS5
+    full-text index over ``name``, ``description`` and ``topics``, so past
+    results can be searched and filtered without any API calls. If the
+    SQLite build lacks FTS5, text search falls back to ``LIKE`` matching.
+    """
+    
+    SORT_COLUMNS = {'stars': 'r.stars', 'updated': 'r.updated_at'}
+    
+    def __init__(self, path: str):
+        """Open (or create) the index database.
+        
+        Args:
+            path: SQLite database file
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS repositories ("
+            "full_name TEXT PRIMARY KEY, name TEXT, description TEXT, topics TEXT, "
+            "stars INTEGER, language TEXT, updated_at TEXT, record TEXT NOT NULL, indexed_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS repositories_stars ON repositories (stars);"
+            "CREATE INDEX IF NOT EXISTS repositories_language ON repositories (language, stars);"
+            "CREATE INDEX IF NOT EXISTS repositories_updated ON repositories (updated_at);"
+        )
+        try:
+            # External-content FTS table kept in sync with triggers
+            self.conn.executescript(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS repositories_fts USING fts5("
+                "name, description, topics, content='repositories', content_rowid='rowid');"
+                "CREATE TRIGGER IF NOT EXISTS repositories_ai AFTER INSERT ON repositories BEGIN "
+                "INSERT INTO repositories_fts (rowid, name, description, topics) "
+                "VALUES (new.rowid, new.name, new.description, new.topics); END;"
+                "CREATE TRIGGER IF NOT EXISTS repositories_ad AFTER DELETE ON repositories BEGIN "
+                "INSERT INTO repositories_fts (repositories_fts, rowid, name, description, topics) "
+                "VALUES ('delete', old.rowid, old.name, old.description, old.topics); END;"
+                "CREATE TRIGGER IF NOT EXISTS repositories_au AFTER UPDATE ON repositories BEGIN "
+                "INSERT INTO repositories_fts (repositories_fts, rowid, name, description, topics) "
+                "VALUES ('delete', old.rowid, old.name, old.description, old.topics); "
+                "INSERT INTO repositories_fts (rowid, name, description, topics) "
+                "VALUES (new.rowid, new.name, new.description, new.topics); END;"
+            )
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+        self.conn.commit()
+    
+    def upsert(self, repositories: Iterable[Dict]) -> int:
+        """Insert or update repository records.
+        
+        Args:
+            repositories: Repository dictionaries
+            
+        Returns:
+            Number of records written
+        """
+        now = time.time()
+        rows = [
+            (
+                repo['full_name'], repo.get('name'), repo.get('description') or '',
+                ' '.join(repo.get('topics') or []), repo.get('stars'), repo.get('language'),
+                repo.get('updated_at'), json.dumps(repo, default=str), now
+            )
+            for repo in repositories
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO repositories "
+                "(full_name, name, description, topics, stars, language, updated_at, record, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (full_name) DO UPDATE SET name = excluded.name, "
+                "description = excluded.description, topics = excluded.topics, stars = excluded.stars, "
+                "language = excluded.language, updated_at = excluded.updated_at, "
+                "record = excluded.record, indexed_at = excluded.indexed_at",
+                rows
+            )
+            self.conn.commit()
+        return len(rows)
+    
+    def search(
+        self,
+        text: Optional[str] = None,
+        language: Optional[str] = None,
+        min_stars: int = 0,
+        updated_since: Optional[str] = None,
+        sort: str = "stars",
+        order: str = "desc",
+        limit: Optional[int] = 10
+    ) -> List[Dict]:
+        """Search the index.
+        
+        Every word of ``text`` must appear (as a prefix) in the name,
+        description or topics. ``key:value`` search qualifiers such as
+        ``stars:>100`` are ignored; use the keyword filters instead.
+        
+        Args:
+            text: Free-text query
+            language: Exact language filter (case-insensitive)
+            min_stars: Minimum star count
+            updated_since: Only repositories updated on or after this ISO date
+            sort: 'stars', 'updated' or 'best-match' (text relevance)
+            order: 'asc' or 'desc'
+            limit: Maximum number of results (None for all)
+            
+        Returns:
+            List of repository dictionaries
+        """
+        words = re.findall(r'\w+', re.sub(r'\S+:\S+', ' ', text or ''))
+        joins, conditions, params = [], [], []
+        rank = None
+        
+        if words and self.fts:
+            joins.append("JOIN repositories_fts ON repositories_fts.rowid = r.rowid")
+            conditions.append("repositories_fts MATCH ?")
+            params.append(' '.join(f'"{word}"*' for word in words))
+            rank = "bm25(repositories_fts)"
+        for word in words if not self.fts else []:
+            conditions.append("(r.name LIKE ? OR r.description LIKE ? OR r.topics LIKE ?)")
+            params.extend([f"%{word}%"] * 3)
+        if language:
+            conditions.append("r.language = ? COLLATE NOCASE")
+            params.append(language)
+        if min_stars > 0:
+            conditions.append("r.stars >= ?")
+            params.append(min_stars)
+        if updated_since:
+            conditions.append("r.updated_at >= ?")
+            params.append(updated_since)
+        
+        direction = 'ASC' if order == 'asc' else 'DESC'
+        if sort in self.SORT_COLUMNS:
+            order_by = f"{self.SORT_COLUMNS[sort]} {direction}"
+        elif rank:
+            # bm25() is lower for better matches
+            order_by = f"{rank} {'DESC' if order == 'asc' else 'ASC'}"
+        else:
+            order_by = f"r.stars {direction}"
+        
+        sql = f"SELECT r.record FROM repositories r {' '.join(joins)}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {order_by}, r.full_name"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(record) for (record,) in rows]
+    
+    def count(self) -> int:
+        """Number of repositories in the index."""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM repositories").fetchone()[0]
+    
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self.lock:
+            self.conn.close()
+
+def _parse_enrichment(node: Dict) -> Dict:
+    """Convert a GraphQL repository node to the enrichment fields of our record format."""
+    target = (node.get('defaultBranchRef') or {}).get('target') or {}
+    release = node.get('latestRelease') or {}
+    languages = (node.get('languages') or {}).get('edges') or []
+    tree = node.get('object') or {}
+    enrichment = {
+        'latest_commit_sha': target.get('oid', ''),
+        'commit_count': (target.get('history') or {}).get('totalCount'),
+        'languages': {edge['node']['name']: edge['size'] for edge in languages},
+        # Files and folders at the top level of the default branch, not a recursive file count
+        'root_entry_count': len(tree['entries']) if 'entries' in tree else None,
+        'latest_release': release.get('tagName', ''),
+        'latest_release_at': release.get('publishedAt', ''),
+        'disk_usage': node.get('diskUsage'),
+    }
+    if node.get('pushedAt'):
+        enrichment['pushed_at'] = node['pushedAt']
+    return enrichment
+
+
+class MetadataWriter:
+    """Incremental writer for repository metadata in CSV or JSON Lines format.
+    
+    Rows are flushed to disk on every ``write`` call, so memory use stays flat
+    for large harvests and rows already written survive a crash later in the
+    run. The file is only created once the first row arrives.
+    """
+    
+    FORMATS = ('csv', 'jsonl')
+    
+    def __init__(self, filename: str, output_format: Optional[str] = None, columns: Iterable[str] = METADATA_COLUMNS):
+        """Initialize the writer.
+        
+        Args:
+            filename: Output filename
+            output_format: 'csv' or 'jsonl' (inferred from the file extension if omitted)
+            columns: Columns to write, in order
+        """
+        self.filename = filename
+        self.output_format = output_format or (
+            'jsonl' if filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+        )
+        if self.output_format not in self.FORMATS:
+            raise ValueError(f"Unsupported metadata format: {self.output_format}")
+        self.columns = list(columns)
+        self.count = 0
+        self.downloaded_at = datetime.now().isoformat()
+        self._file = None
+        self._writer = None
+    
+    def __enter__(self) -> 'MetadataWriter':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def write(self, repositories: Iterable[Dict]) -> int:
+        """Append repositories to the output file and flush them to disk.
+        
+        Args:
+            repositories: Repository dictionaries to write
+            
+        Returns:
+            Number of rows written
+        """
+        written = 0
+        for repo in repositories:
+            if self._file is None:
+                self._open()
+            row = {column: repo.get(column) for column in self.columns}
+            if 'downloaded_at' in row and row['downloaded_at'] is None:
+                row['downloaded_at'] = self.downloaded_at
+            if self.output_format == 'csv':
+                self._writer.writerow(row)
+            else:
+                self._file.write(json.dumps(row, default=str) + "\n")
+            written += 1
+        
+        if written:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self.count += written
+        return written
+    
+    def _open(self) -> None:
+        """Create the output file and write the CSV header."""
+        Path(self.filename).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.filename, 'w', newline='', encoding='utf-8')
+        if self.output_format == 'csv':
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns)
+            self._writer.writeheader()
+    
+    def close(self) -> None:
+        """Close the output file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class JobManifest:
+    """Append-only JSON Lines record of per-repository download state.
+    
+    Each line records a state change (pending, downloading, done, failed,
+    skipped) with a timestamp, plus the byte count and duration once a
+    download finishes. The full repository record is stored with the pending
+    state so an interrupted run can be resumed without searching again.
+    """
+    
+    PENDING = 'pending'
+    DOWNLOADING = 'downloading'
+    DONE = 'done'
+    FAILED = 'failed'
+    SKIPPED = 'skipped'
+    
+    def __init__(self, path: str):
+        """Open a manifest, loading the latest state of every repository in it.
+        
+        Args:
+            path: Manifest file (created on first write)
+        """
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a truncated last line behind
+                        continue
+                    self.entries.setdefault(record['full_name'], {}).update(record)
+    
+    def start(self, repositories: List[Dict]) -> None:
+        """Begin a new job, replacing any previous manifest content."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            self.entries = {}
+            open(self.path, 'w', encoding='utf-8').close()
+        for repo in repositories:
+            self.record(repo['full_name'], self.PENDING, repo=repo)
+    
+    def record(self, full_name: str, state: str, **fields) -> None:
+        """Append a state change for a repository and flush it to disk."""
+        record = {'full_name': full_name, 'state': state, 'time': datetime.now().isoformat(), **fields}
+        with self.lock:
+            self.entries.setdefault(full_name, {}).update(record)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def repositories(self, exclude_states: Iterable[str] = ()) -> List[Dict]:
+        """Repository records in manifest order, skipping the given states."""
+        excluded = set(exclude_states)
+        return [
+            entry['repo'] for entry in self.entries.values()
+            if 'repo' in entry and entry['state'] not in excluded
+        ]
+
+class MirrorCache:
+    """Local bare git mirrors that clones borrow objects from.
+    
+    Each fork network gets one bare repository under ``root`` with a remote
+    per member repository, so a fork shares all objects with its upstream.
+    Clones pass the mirror to ``git clone --reference`` and, by default,
+    ``--dissociate`` so the clone copies the borrowed objects and stays valid
+    after the mirror is evicted. Mirrors are re-fetched when older than
+    ``refresh_interval`` and the least recently used ones are evicted once
+    the cache grows beyond ``max_size`` bytes.
+    """
+    
+    STATE_FILE = "fetcher-state.json"
+    
+    def __init__(self, root: str, max_size: int = 10 * 1024 ** 3, refresh_interval: float = 3600,
+                 dissociate: bool = True):
+        """Initialize the cache.
+        
+        Args:
+            root: Directory holding the bare mirrors
+            max_size: Maximum total size of all mirrors in bytes
+            refresh_interval: Seconds before a mirrored repository is fetched again
+            dissociate: Clone with ``--dissociate`` instead of keeping alternates
+        """
+        self.root = Path(root)
+        self.max_size = max_size
+        self.refresh_interval = refresh_interval
+        self.dissociate = dissociate
+        self.lock = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        # Number of clones currently reading from each mirror; eviction skips these
+        self._users: Dict[str, int] = {}
+    
+    def mirror_path(self, network: str) -> Path:
+        """Path of the bare mirror for a fork network (named after its root repository)."""
+        return self.root / f"{network.replace('/', '_')}.git"
+    
+    def prepare(self, repo_data: Dict, network: Optional[str] = None) -> Optional[Path]:
+        """Make sure the mirror holds a recent copy of a repository.
+        
+        Args:
+            repo_data: Repository information dictionary
+            network: Full name of the fork network root (defaults to the repository itself)
+            
+        Returns:
+            Path of the bare mirror, or None if it could not be updated
+        """
+        import git
+        
+        path = self.mirror_path(network or repo_data['full_name'])
+        remote_name = repo_data['full_name'].replace('/', '_')
+        with self.lock:
+            mirror_lock = self._locks.setdefault(str(path), threading.Lock())
+        
+        with mirror_lock:
+            try:
+                repo = git.Repo(path) if path.exists() else git.Repo.init(path, bare=True, mkdir=True)
+                state = self._read_state(path)
+                fetched = state['fetched'].get(remote_name, 0)
+                if time.time() - fetched >= self.refresh_interval:
+                    if remote_name not in [remote.name for remote in repo.remotes]:
+                        repo.create_remote(remote_name, repo_data['clone_url'])
+                    click.echo(f"Updating mirror of {repo_data['full_name']}...")
+                    repo.git.fetch(
+                        '--no-tags', '--prune', remote_name,
+                        f"+refs/heads/*:refs/remotes/{remote_name}/*"
+                    )
+                    state['fetched'][remote_name] = time.time()
+            except git.exc.GitError as e:
+                click.echo(f"Mirror update failed for {repo_data['full_name']}: {e}")
+                return None
+            state['used'] = time.time()
+            self._write_state(path, state)
+        return path
+    
+    @contextmanager
+    def borrow(self, repo_data: Dict, network: Optional[str] = None) -> Iterator[Optional[Path]]:
+        """Prepare a mirror and keep ``evict`` away from it until the block ends.
+        
+        Hold this for the whole clone that references the mirror.
+        
+        Yields:
+            Path of the bare mirror, or None if it could not be updated
+        """
+        key = str(self.mirror_path(network or repo_data['full_name']))
+        with self.lock:
+            self._users[key] = self._users.get(key, 0) + 1
+        try:
+            yield self.prepare(repo_data, network)
+        finally:
+            with self.lock:
+                self._users[key] -= 1
+                if not self._users[key]:
+                    del self._users[key]
+    
+    def refresh(self) -> int:
+        """Fetch every remote of every mirror.
+        
+        Returns:
+            Number of mirrors refreshed
+        """
+        import git
+        
+        refreshed = 0
+        for path in self._mirrors():
+            try:
+                git.Repo(path).git.fetch('--all', '--no-tags', '--prune')
+            except git.exc.GitError as e:
+                click.echo(f"Refreshing {path.name} failed: {e}")
+                continue
+            state = self._read_state(path)
+            state['fetched'] = {name: time.time() for name in state['fetched']}
+            self._write_state(path, state)
+            refreshed += 1
+        return refreshed
+    
+    def evict(self) -> List[str]:
+        """Delete least recently used mirrors until the cache fits in ``max_size``.
+        
+        Mirrors that a clone in this process is using (see ``borrow``) or
+        that are being fetched into are skipped. Clones made without
+        ``--dissociate`` still read objects from their mirror, so only run
+        this when no such clones need to be kept.
+        
+        Returns:
+            Names of the evicted mirrors
+        """
+        mirrors = sorted(
+            ((self._read_state(path)['used'], path, _directory_size(path)) for path in self._mirrors()),
+            key=lambda entry: entry[0]
+        )
+        total = sum(size for _, _, size in mirrors)
+        evicted = []
+        for _, path, size in mirrors:
+            if total <= self.max_size:
+                break
+            with self.lock:
+                mirror_lock = self._locks.setdefault(str(path), threading.Lock())
+                if self._users.get(str(path)) or not mirror_lock.acquire(blocking=False):
+                    continue
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                mirror_lock.release()
+            total -= size
+            evicted.append(path.name)
+        return evicted
+    
+    def stats(self) -> List[Dict]:
+        """Name, size, member repositories and last use of every mirror."""
+        stats = []
+        for path in self._mirrors():
+            state = self._read_state(path)
+            stats.append({
+                'name': path.name,
+                'size': _directory_size(path),
+                'repositories': sorted(state['fetched']),
+                'used': datetime.fromtimestamp(state['used']).isoformat() if state['used'] else None,
+            })
+        return stats
+    
+    def _mirrors(self) -> List[Path]:
+        return sorted(self.root.glob("*.git")) if self.root.exists() else []
+    
+    def _read_state(self, path: Path) -> Dict:
+        """Read per-remote fetch times and the last use time of a mirror."""
+        try:
+            with open(path / self.STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'fetched': {}, 'used': 0}
+    
+    def _write_state(self, path: Path, state: Dict) -> None:
+        tmp_file = path / f"{self.STATE_FILE}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, path / self.STATE_FILE)
+
+class GitHubCodeFetcher:
+    """Main class for GitHub repository search and download functionality."""
+    
+    def __init__(
+        self,
+        token: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        spool_size: int = DEFAULT_SPOOL_SIZE,
+        index: Optional[MetadataIndex] = None,
+        mirrors: Optional[MirrorCache] = None,
+        pool_size: int = DEFAULT_POOL_SIZE
+    ):
+        """Initialize the GitHub Code Fetcher.
+        
+        Args:
+            token: GitHub personal access token for authenticated requests
+            cache: Optional response cache for search requests
+            chunk_size: Read size in bytes for archive downloads
+            spool_size: ZIP archives up to this many bytes are buffered in memory
+            index: Optional local metadata index that saved metadata is also upserted into
+            mirrors: Optional bare mirror cache that clones borrow objects from
+            pool_size: Keep-alive connections kept open per host
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        _load_environment()
+        self.token = token or os.getenv('GITHUB_TOKEN')
+        self.base_url = "https://api.github.com"
+        # Archive downloads come from the web host rather than the API
+        self.web_url = "https://github.com"
+        self.session = requests.Session()
+        # One keep-alive pool per host (API, github.com, codeload) sized for
+        # parallel downloads. Retries are handled by the RequestScheduler.
+        # JSON responses are gzip-compressed via requests' default Accept-Encoding.
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.telemetry = Telemetry()
+        self.scheduler = RequestScheduler(authenticated=bool(self.token), telemetry=self.telemetry)
+        self.cache = cache
+        self.index = index
+        self.mirrors = mirrors
+        self._mirror_skip_warned = False
+        self.chunk_size = chunk_size
+        self.spool_size = spool_size
+        self._sync_state_lock = threading.Lock()
+        
+        if self.token:
+            self.session.headers.update({
+                'Authorization': f'token {self.token}',
+                'Accept': 'application/vnd.github.v3+json'
+            })
+        else:
+            click.echo("Warning: No GitHub token provided. API rate limits will be lower.")
+            
+    def search_repositories(
+        self,
+        query: str,
+        sort: str = "stars",
+        order: str = "desc",
+        language: Optional[str] = None,
+        min_stars: int = 0,
+        max_results: int = 10,
+        per_page: int = 30,
+        concurrency: int = 1
+    ) -> List[Dict]:
+        """Search GitHub repositories based on query and filters.
+        
+        Args:
+            query: Search query string
+            sort: Sort by 'stars', 'updated', or 'best-match'
+            order: 'asc' or 'desc'
+            language: Programming language filter
+            min_stars: Minimum star count
+            max_results: Maximum number of results to return
+            per_page: Results per API page (max 100)
+            concurrency: Number of result pages to fetch in parallel
+            
+        Returns:
+            List of repository dictionaries
+        """
+        return [
+            repo
+            for page in self.iter_search_pages(
+                query, sort, order, language, min_stars, max_results, per_page, concurrency
+            )
+            for repo in page
+        ]
+    
+    def iter_search_pages(
+        self,
+        query: str,
+        sort: str = "stars",
+        order: str = "desc",
+        language: Optional[str] = None,
+        min_stars: int = 0,
+        max_results: int = 10,
+        per_page: int = 30,
+        concurrency: int = 1,
+        show_progress: bool = True
+    ) -> Iterator[List[Dict]]:
+        """Search GitHub repositories, yielding each page of results as it arrives.
+        
+        Pages are yielded in result order, so callers can write them out
+        incrementally without holding the whole result set in memory. Requests
+        for more than 1000 results are sharded, see ``search_repositories_sharded``.
+        Arguments are the same as for ``search_repositories``.
+        
+        Yields:
+            Lists of repository dictionaries, one per result page
+        """
+        import asyncio
+        
+        if max_results > SEARCH_RESULT_LIMIT:
+            repositories = self.iter_sharded_repositories(
+                query, sort, order, language, min_stars, max_results, per_page, concurrency
+            )
+            while True:
+                page = list(islice(repositories, per_page))
+                if not page:
+                    return
+                yield page
+        
+        loop = asyncio.new_event_loop()
+        pages = self.aiter_search_pages(
+            query, sort, order, language, min_stars, max_results, per_page, concurrency, show_progress
+        )
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(pages.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(pages.aclose())
+            pending = asyncio.all_tasks(loop)
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.close()
+    
+    def search_repositories_sharded(
+        self,
+        query: str,
+        sort: str = "stars",
+        order: str = "desc",
+        language: Optional[str] = None,
+        min_stars: int = 0,
+        max_results: int = 10,
+        per_page: int = 100,
+        concurrency: int = 4
+    ) -> List[Dict]:
+        """Search beyond the 1000-result cap by splitting the query into shards.
+        
+        Collects ``iter_sharded_repositories`` into a list; arguments are the
+        same as for ``search_repositories``.
+        
+        Returns:
+            List of repository dictionaries
+        """
+        return list(self.iter_sharded_repositories(
+            query, sort, order, language, min_stars, max_results, per_page, concurrency
+        ))
+    
+    def iter_sharded_repositories(
+        self,
+        query: str,
+        sort: str = "stars",
+        order: str = "desc",
+        language: Optional[str] = None,
+        min_stars: int = 0,
+        max_results: int = 10,
+        per_page: int = 100,
+        concurrency: int = 4
+    ) -> Iterator[Dict]:
+        """Search beyond the 1000-result cap, yielding repositories in sort order.
+        
+        The query is split into disjoint ``stars:`` ranges (and ``created:``
+        ranges for single star counts that are still too large) of at most
+        1000 results each, see ``plan_search_shards``. For ``stars`` and
+        ``best-match`` the shards already come out in order; they are fetched
+        ``concurrency`` at a time and yielded shard by shard. For ``updated``
+        every shard is paged lazily and the streams are merged by
+        ``updated_at``, so only about ``max_results`` results plus one page per
+        shard are fetched. Either way at most a few shards are held in memory.
+        
+        Arguments are the same as for ``search_repositories``.
+        
+        Yields:
+            Repository dictionaries
+        """
+        total = self._count_search_results(self._build_search_params(query, sort, order, language, min_stars, 1)['q'])
+        if total <= SEARCH_RESULT_LIMIT:
+            yield from self.search_repositories(
+                query, sort, order, language, min_stars, min(max_results, total), per_page, concurrency
+            )
+            return
+        
+        shards = self.plan_search_shards(query, sort, order, language, min_stars, max_results)
+        click.echo(f"Splitting search into {len(shards)} shards ({total} matching repositories)")
+        
+        def shard_stream(shard: Tuple[str, int]) -> Iterator[Dict]:
+            qualifier, count = shard
+            return self._iter_search_results(
+                f"{query} {qualifier}", sort, order, language, min(count, SEARCH_RESULT_LIMIT, max_results), per_page
+            )
+        
+        if sort in SORT_FIELDS and sort != 'stars':
+            field = SORT_FIELDS[sort]
+            repositories = heapq.merge(
+                *(shard_stream(shard) for shard in shards),
+                key=lambda repo: repo[field] or '', reverse=order == 'desc'
+            )
+        else:
+            repositories = (
+                repo
+                for shard_results in self._fetch_in_order(lambda shard: list(shard_stream(shard)), shards, concurrency)
+                for repo in shard_results
+            )
+        
+        seen = set()
+        for repo in repositories:
+            if repo['full_name'] in seen:
+                continue
+            seen.add(repo['full_name'])
+            yield repo
+            if len(seen) >= max_results:
+                return
+    
+    def _iter_search_results(
+        self,
+        query: str,
+        sort: str,
+        order: str,
+        language: Optional[str],
+        limit: int,
+        per_page: int
+    ) -> Iterator[Dict]:
+        """Yield up to ``limit`` search results, requesting each page only when it is needed."""
+        import requests
         
-    Returns:
-        Sanitized folder name
-    """
-    # Remove special characters and replace spaces with underscores
-    folder_name = re.sub(r'[<>:"/\\|?*]', '', query)
-    folder_name = re.sub(r'\s+', '_', folder_name.strip())
+        params = self._build_search_params(query, sort, order, language, 0, per_page)
+        for page in range(1, math.ceil(limit / params['per_page']) + 1):
+            try:
+                items = self._fetch_search_page(params, page).get('items', [])
+            except requests.exceptions.RequestException as e:
+                click.echo(f"Error searching repositories: {e}")
+                return
+            for item in items[:limit - (page - 1) * params['per_page']]:
+                yield parse_repository(item)
+            if len(items) < params['per_page']:
+                return
     
-    # Add language suffix if specified
-    if language:
-        folder_name += f"_{language}"
+    @staticmethod
+    def _fetch_in_order(fetch: Callable, items: List, concurrency: int) -> Iterator:
+        """Yield ``fetch(item)`` for each item in order, with at most ``concurrency`` fetches running.
+        
+        Only the results in the window are held in memory; when the caller
+        stops early, fetches that have not started are cancelled.
+        """
+        pending = iter(items)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            window = deque(executor.submit(fetch, item) for item in islice(pending, max(1, concurrency)))
+            try:
+                while window:
+                    result = window.popleft().result()
+                    for item in islice(pending, 1):
+                        window.append(executor.submit(fetch, item))
+                    yield result
+            finally:
+                for future in window:
+                    future.cancel()
     
-    # Add star filter suffix if specified
-    if min_stars > 0:
-        folder_name += f"_min{min_stars}stars"
+    def plan_search_shards(
+        self,
+        query: str,
+        sort: str = "stars",
+        order: str = "desc",
+        language: Optional[str] = None,
+        min_stars: int = 0,
+        max_results: Optional[int] = None
+    ) -> List[Tuple[str, int]]:
+        """Split a search into disjoint ranges that each return at most 1000 results.
+        
+        Star ranges are bisected (geometrically, since stars are heavily skewed
+        towards small counts) until each holds at most 1000 results. A single
+        star count that still exceeds the cap is split further by creation date.
+        When sorting by stars or best match, shards are planned in star order
+        and planning stops once they cover ``max_results``; sorting by update
+        time needs the whole range, since any shard can hold the newest results.
+        
+        Returns:
+            List of (search qualifier, result count) tuples
+        """
+        base_query = self._build_search_params(query, sort, order, language, 0, 1)['q']
+        top = self._get_json(
+            f"{self.base_url}/search/repositories",
+            {'q': f"{base_query} stars:>={min_stars}", 'sort': 'stars', 'order': 'desc', 'per_page': 1},
+            resource='search'
+        ).get('items', [])
+        if not top:
+            return []
+        
+        descending = not (sort == 'stars' and order == 'asc')
+        stop_early = sort in ('stars', 'best-match') and max_results is not None
+        pending = [(min_stars, top[0]['stargazers_count'])]
+        shards = []
+        covered = 0
+        
+        while pending and not (stop_early and covered >= max_results):
+            low, high = pending.pop(0)
+            qualifier = f"stars:{low}..{high}"
+            count = self._count_search_results(f"{base_query} {qualifier}")
+            if count == 0:
+                continue
+            if count <= SEARCH_RESULT_LIMIT:
+                shards.append((qualifier, count))
+                covered += count
+            elif low < high:
+                middle = min(high - 1, max(low, int(math.sqrt((low + 1) * (high + 1))) - 1))
+                halves = [(middle + 1, high), (low, middle)] if descending else [(low, middle), (middle + 1, high)]
+                # Depth first, so shards come out in sort order
+                pending[:0] = halves
+            else:
+                for date_qualifier, date_count in self._split_by_created(f"{base_query} {qualifier}"):
+                    shards.append((f"{qualifier} {date_qualifier}", date_count))
+                    covered += date_count
+        
+        return shards
     
-    # Limit length and ensure it's not empty
-    folder_name = folder_name[:50]  # Limit to 50 characters
-    if not folder_name:
-        folder_name = "search_results"
+    def _split_by_created(self, search_query: str) -> List[Tuple[str, int]]:
+        """Bisect creation dates until each range holds at most 1000 results."""
+        pending = [(SEARCH_EPOCH, datetime.now().date())]
+        shards = []
+        while pending:
+            start, end = pending.pop(0)
+            qualifier = f"created:{start.isoformat()}..{end.isoformat()}"
+            count = self._count_search_results(f"{search_query} {qualifier}")
+            if count == 0:
+                continue
+            if count <= SEARCH_RESULT_LIMIT or start == end:
+                if count > SEARCH_RESULT_LIMIT:
+                    click.echo(f"Warning: {count} results for '{search_query} {qualifier}', "
+                               f"only {SEARCH_RESULT_LIMIT} can be fetched")
+                shards.append((qualifier, count))
+            else:
+                middle = start + (end - start) // 2
+                pending[:0] = [(start, middle), (middle + timedelta(days=1), end)]
+        return shards
     
-    return folder_name
-
-class GitHubCodeFetcher:
-    """Main class for GitHub repository search and download functionality."""
+    def _count_search_results(self, search_query: str) -> int:
+        """Number of repositories matching a raw search query string."""
+        data = self._get_json(
+            f"{self.base_url}/search/repositories", {'q': search_query, 'per_page': 1}, resource='search'
+        )
+        return data.get('total_count', 0)
     
-    def __init__(self, token: Optional[str] = None):
-        """Initialize the GitHub Code Fetcher.
+    async def search_repositories_async(
+        self,
+        query: str,
+        sort: str = "stars",
+        order: str = "desc",
+        language: Optional[str] = None,
+        min_stars: int = 0,
+        max_results: int = 10,
+        per_page: int = 30,
+        concurrency: int = 4
+    ) -> List[Dict]:
+        """Search GitHub repositories, fetching result pages concurrently.
         
-        Args:
-            token: GitHub personal access token for authenticated requests
-        """
-        self.token = token or os.getenv('GITHUB_TOKEN')
-        self.base_url = "https://api.github.com"
-        self.session = requests.Session()
+        Arguments are the same as for ``search_repositories``; see
+        ``aiter_search_pages`` for how pages are scheduled.
         
-        if self.token:
-            self.session.headers.update({
-                'Authorization': f'token {self.token}',
-                'Accept': 'application/vnd.github.v3+json'
-            })
-        else:
-            click.echo("Warning: No GitHub token provided. API rate limits will be lower.")
-            
-    def search_repositories(
+        Returns:
+            List of repository dictionaries
+        """
+        repositories = []
+        async for page in self.aiter_search_pages(
+            query, sort, order, language, min_stars, max_results, per_page, concurrency
+        ):
+            repositories.extend(page)
+        return repositories
+    
+    async def aiter_search_pages(
         self,
         query: str,
         sort: str = "stars",
@@ -96,22 +1730,222 @@ class GitHubCodeFetcher:
         language: Optional[str] = None,
         min_stars: int = 0,
         max_results: int = 10,
+        per_page: int = 30,
+        concurrency: int = 4,
+        show_progress: bool = True
+    ) -> AsyncIterator[List[Dict]]:
+        """Search GitHub repositories, fetching result pages concurrently.
+        
+        The first page is fetched on its own to learn ``total_count``; the
+        remaining pages up to ``max_results`` are then requested in parallel,
+        at most ``concurrency`` at a time. Pages are yielded in the order
+        defined by ``sort``/``order``, stopping at the first failed page so the
+        results stay contiguous.
+        
+        Yields:
+            Lists of repository dictionaries, one per result page
+        """
+        import asyncio
+        import requests
+        from tqdm import tqdm
+        
+        params = self._build_search_params(query, sort, order, language, min_stars, per_page)
+        per_page = params['per_page']
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        tasks = []
+        
+        async def fetch(page: int) -> Dict:
+            async with semaphore:
+                return await loop.run_in_executor(executor, self._fetch_search_page, params, page)
+        
+        try:
+            with tqdm(desc="Searching repositories", unit="repos", disable=not show_progress) as pbar:
+                try:
+                    data = await fetch(1)
+                except requests.exceptions.RequestException as e:
+                    click.echo(f"Error searching repositories: {e}")
+                    return
+                
+                available = min(data.get('total_count', 0), max_results, SEARCH_RESULT_LIMIT)
+                last_page = max(1, math.ceil(available / per_page))
+                tasks = [loop.create_task(fetch(page)) for page in range(2, last_page + 1)]
+                remaining = max_results
+                
+                for task in [None] + tasks:
+                    if task is not None:
+                        try:
+                            data = await task
+                        except requests.exceptions.RequestException as e:
+                            click.echo(f"Error searching repositories: {e}")
+                            break
+                    
+                    items = data.get('items', [])[:remaining]
+                    if not items:
+                        break
+                    repositories = [parse_repository(repo) for repo in items]
+                    remaining -= len(repositories)
+                    pbar.update(len(repositories))
+                    yield repositories
+                    
+                    if remaining <= 0:
+                        break
+        finally:
+            for task in tasks:
+                task.cancel()
+            executor.shutdown(wait=False)
+    
+    def search_code(
+        self,
+        query: str,
+        language: Optional[str] = None,
+        max_results: int = 10,
         per_page: int = 30
     ) -> List[Dict]:
-        """Search GitHub repositories based on query and filters.
+        """Search for files with the code search API.
+        
+        Code search requires a token and is limited to 10 requests per minute,
+        so pages are fetched one after another. As with repository search, at
+        most 1000 results are available per query.
         
         Args:
-            query: Search query string
-            sort: Sort by 'stars', 'updated', or 'best-match'
-            order: 'asc' or 'desc'
+            query: Code search query (qualifiers such as ``repo:`` or ``path:`` are passed through)
             language: Programming language filter
-            min_stars: Minimum star count
-            max_results: Maximum number of results to return
+            max_results: Maximum number of files to return
             per_page: Results per API page (max 100)
             
         Returns:
-            List of repository dictionaries
+            List of file dictionaries, see ``parse_code_result``
+        """
+        import requests
+        
+        if not self.token:
+            click.echo("Warning: Code search requires a GitHub token, skipping.")
+            return []
+        
+        params = {
+            'q': f"{query} language:{language}" if language else query,
+            'per_page': min(per_page, 100)
+        }
+        files = []
+        page = 1
+        max_results = min(max_results, SEARCH_RESULT_LIMIT)
+        
+        while len(files) < max_results:
+            try:
+                data = self._get_json(f"{self.base_url}/search/code", {**params, 'page': page}, resource='code_search')
+            except requests.exceptions.RequestException as e:
+                click.echo(f"Error searching code: {e}")
+                break
+            
+            items = data.get('items', [])
+            files.extend(parse_code_result(item) for item in items[:max_results - len(files)])
+            if len(items) < params['per_page'] or page * params['per_page'] >= data.get('total_count', 0):
+                break
+            page += 1
+        
+        return files
+    
+    def enrich_repositories(self, repositories: List[Dict], batch_size: int = GRAPHQL_BATCH_SIZE) -> List[Dict]:
+        """Add metadata that the search API does not return, using bulk GraphQL queries.
+        
+        Up to ``batch_size`` repositories (at most 100) are looked up per
+        GraphQL request via ``nodes(ids:)``, adding the fields listed in
+        ``ENRICHMENT_COLUMNS`` and refreshing ``pushed_at``. When the GraphQL
+        point budget runs low, requests wait for the reset instead of failing.
+        
+        Args:
+            repositories: Repository dictionaries (updated in place)
+            batch_size: Repositories per GraphQL request
+            
+        Returns:
+            The same repository dictionaries
+        """
+        import requests
+        
+        if not self.token:
+            click.echo("Warning: GraphQL enrichment requires a GitHub token, skipping.")
+            return repositories
+        
+        batch_size = max(1, min(batch_size, GRAPHQL_BATCH_SIZE))
+        by_id = {repo['node_id']: repo for repo in repositories if repo.get('node_id')}
+        node_ids = list(by_id)
+        
+        for start in range(0, len(node_ids), batch_size):
+            batch = node_ids[start:start + batch_size]
+            phase_start = time.monotonic()
+            try:
+                response = self._request(
+                    'POST', f"{self.base_url}/graphql", resource='graphql',
+                    json={'query': ENRICHMENT_QUERY, 'variables': {'ids': batch}}
+                )
+                response.raise_for_status()
+                payload = response.json()
+                self.telemetry.add_bytes('graphql', _wire_bytes(response))
+            except requests.exceptions.RequestException as e:
+                click.echo(f"Error enriching repositories: {e}")
+                break
+            
+            data = payload.get('data') or {}
+            for node in data.get('nodes') or []:
+                if node and node.get('id') in by_id:
+                    by_id[node['id']].update(_parse_enrichment(node))
+            
+            self.telemetry.add_phase('enrich', time.monotonic() - phase_start)
+            self._wait_for_graphql_budget(data.get('rateLimit'))
+        
+        return repositories
+    
+    def _wait_for_graphql_budget(self, rate_limit: Optional[Dict]) -> None:
+        """Sleep until the GraphQL rate limit resets if the next query would not fit."""
+        if not rate_limit or rate_limit.get('remaining', 0) >= rate_limit.get('cost', 1):
+            return
+        reset_at = datetime.strptime(rate_limit['resetAt'], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        wait = (reset_at - datetime.now(timezone.utc)).total_seconds() + 1
+        if wait > 0:
+            click.echo(f"GraphQL rate limit reached, waiting {wait:.0f}s for reset...")
+            time.sleep(wait)
+            self.telemetry.add_wait('graphql', wait)
+    
+    def _request(self, method: str, url: str, resource: Optional[str] = 'core', **kwargs):
+        """Send a request through the shared rate-limit-aware scheduler."""
+        return self.scheduler.request(self.session, method, url, resource=resource, **kwargs)
+    
+    def connection_stats(self) -> Dict[str, Dict]:
+        """Connections opened and requests sent per host, to check keep-alive reuse.
+        
+        Every opened HTTPS connection costs a TLS handshake, so ``reuse``
+        (requests per connection) shows how well handshakes are amortized.
+        
+        Returns:
+            Mapping of ``scheme://host:port`` to 'connections', 'requests' and 'reuse'
         """
+        stats = {}
+        adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = stats.setdefault(f"{pool.scheme}://{pool.host}:{pool.port}", {'connections': 0, 'requests': 0})
+                host['connections'] += pool.num_connections
+                host['requests'] += pool.num_requests
+        for host in stats.values():
+            host['reuse'] = round(host['requests'] / host['connections'], 2) if host['connections'] else 0.0
+        return stats
+    
+    def _build_search_params(
+        self,
+        query: str,
+        sort: str,
+        order: str,
+        language: Optional[str],
+        min_stars: int,
+        per_page: int
+    ) -> Dict:
+        """Build the query parameters for the repository search endpoint."""
         search_query = query
         
         # Add language filter to query
@@ -122,81 +1956,59 @@ class GitHubCodeFetcher:
         if min_stars > 0:
             search_query += f" stars:>={min_stars}"
             
-        params = {
+        return {
             'q': search_query,
             'sort': sort,
             'order': order,
             'per_page': min(per_page, 100)
         }
+    
+    def _fetch_search_page(self, params: Dict, page: int) -> Dict:
+        """Fetch a single page of repository search results."""
+        return self._get_json(f"{self.base_url}/search/repositories", {**params, 'page': page}, resource='search')
+    
+    def _get_json(self, url: str, params: Dict, resource: Optional[str] = 'core') -> Dict:
+        """GET a JSON API response, using the response cache when one is configured."""
+        key = entry = None
+        headers = {}
+        if self.cache:
+            key = self.cache.make_key(url, params)
+            entry = self.cache.get(key)
+            if entry and entry['fresh']:
+                return entry['body']
+            if entry and entry['etag']:
+                headers['If-None-Match'] = entry['etag']
         
-        repositories = []
-        page = 1
+        response = self._request('GET', url, resource=resource, params=params, headers=headers)
+        if response.status_code == 304 and entry:
+            self.cache.touch(key)
+            return entry['body']
+        response.raise_for_status()
         
-        with tqdm(desc="Searching repositories", unit="repos") as pbar:
-            while len(repositories) < max_results:
-                params['page'] = page
-                
-                try:
-                    response = self.session.get(
-                        f"{self.base_url}/search/repositories",
-                        params=params
-                    )
-                    response.raise_for_status()
-                    
-                    data = response.json()
-                    items = data.get('items', [])
-                    
-                    if not items:
-                        break
-                        
-                    for repo in items:
-                        if len(repositories) >= max_results:
-                            break
-                            
-                        repo_data = {
-                            'name': repo['name'],
-                            'full_name': repo['full_name'],
-                            'description': repo.get('description', ''),
-                            'html_url': repo['html_url'],
-                            'clone_url': repo['clone_url'],
-                            'stars': repo['stargazers_count'],
-                            'forks': repo['forks_count'],
-                            'language': repo.get('language', ''),
-                            'size': repo['size'],
-                            'created_at': repo['created_at'],
-                            'updated_at': repo['updated_at'],
-                            'topics': repo.get('topics', []),
-                            'license': repo.get('license', {}).get('name', '') if repo.get('license') else '',
-                            'archived': repo.get('archived', False),
-                            'default_branch': repo.get('default_branch', 'main')
-                        }
-                        repositories.append(repo_data)
-                        pbar.update(1)
-                        
-                    page += 1
-                    
-                    # Check if we've reached the last page
-                    if page > (data.get('total_count', 0) // per_page) + 1:
-                        break
-                        
-                except requests.exceptions.RequestException as e:
-                    click.echo(f"Error searching repositories: {e}")
-                    break
-                    
-        return repositories[:max_results]
+        data = response.json()
+        self.telemetry.add_bytes(resource, _wire_bytes(response))
+        if self.cache:
+            self.cache.put(key, data, response.headers.get('ETag'))
+        return data
     
     def download_repository(
         self,
         repo_data: Dict,
         download_dir: str = "downloaded_repos",
-        method: str = "clone"
+        method: str = "clone",
+        show_progress: bool = True,
+        sync: bool = False,
+        clone_options: Optional[Dict] = None
     ) -> bool:
         """Download a repository either by cloning or downloading ZIP.
         
         Args:
             repo_data: Repository information dictionary
             download_dir: Directory to download repositories to
-            method: 'clone' or 'zip'
+            method: 'clone', 'zip' or 'tarball'
+            show_progress: Show a per-file progress bar for archive downloads
+            sync: Refresh repositories that already exist instead of skipping them
+            clone_options: Shallow/partial/sparse clone options, see ``_clone_repository``
             
         Returns:
             Success status
@@ -205,105 +2017,1461 @@ class GitHubCodeFetcher:
         repo_path = Path(download_dir) / repo_name
         
         # Create download directory if it doesn't exist
-        Path(download_dir).mkdir(exist_ok=True)
+        Path(download_dir).mkdir(parents=True, exist_ok=True)
         
         # Skip if already exists
-        if repo_path.exists():
+        if repo_path.exists() and not sync:
             click.echo(f"Repository {repo_name} already exists, skipping...")
             return True
             
         try:
-            if method == "clone":
-                return self._clone_repository(repo_data, repo_path)
+            if repo_path.exists():
+                success = self._sync_repository(repo_data, repo_path, method, show_progress, clone_options)
             else:
-                return self._download_zip(repo_data, repo_path)
+                success = self._fetch_atomically(repo_data, repo_path, method, show_progress, clone_options)
+            
+            if success:
+                self._record_sync_state(repo_data, Path(download_dir))
+            return success
                 
         except Exception as e:
             click.echo(f"Error downloading {repo_name}: {e}")
             return False
     
-    def _clone_repository(self, repo_data: Dict, repo_path: Path) -> bool:
-        """Clone repository using git."""
+    def _fetch_repository(
+        self,
+        repo_data: Dict,
+        repo_path: Path,
+        method: str,
+        show_progress: bool = True,
+        clone_options: Optional[Dict] = None
+    ) -> bool:
+        """Download a repository into ``repo_path`` with the given method."""
+        if method == "clone":
+            return self._clone_repository(repo_data, repo_path, clone_options)
+        if method == "tarball":
+            return self._download_tarball(repo_data, repo_path, show_progress)
+        return self._download_zip(repo_data, repo_path, show_progress)
+    
+    def _fetch_atomically(
+        self,
+        repo_data: Dict,
+        repo_path: Path,
+        method: str,
+        show_progress: bool = True,
+        clone_options: Optional[Dict] = None
+    ) -> bool:
+        """Download into a temporary folder and rename it to ``repo_path`` on success.
+        
+        An interrupted download therefore never leaves a half-written
+        ``repo_path`` behind. An existing ``repo_path`` is only replaced once
+        the new download is complete.
+        """
+        # Not mkdtemp(): its 0700 mode would carry over to the renamed repository folder
+        tmp_path = repo_path.parent / f".{repo_path.name}-{uuid.uuid4().hex[:12]}{PARTIAL_SUFFIX}"
+        tmp_path.mkdir(parents=True)
+        try:
+            if not self._fetch_repository(repo_data, tmp_path, method, show_progress, clone_options):
+                return False
+            
+            if repo_path.exists():
+                backup_path = repo_path.with_name(f".{repo_path.name}{BACKUP_SUFFIX}")
+                if backup_path.exists():
+                    shutil.rmtree(backup_path)
+                repo_path.rename(backup_path)
+                tmp_path.rename(repo_path)
+                shutil.rmtree(backup_path)
+            else:
+                tmp_path.rename(repo_path)
+            return True
+        finally:
+            if tmp_path.exists():
+                shutil.rmtree(tmp_path, ignore_errors=True)
+    
+    def _sync_repository(
+        self,
+        repo_data: Dict,
+        repo_path: Path,
+        method: str,
+        show_progress: bool = True,
+        clone_options: Optional[Dict] = None
+    ) -> bool:
+        """Bring an existing download up to date.
+        
+        Repositories whose ``pushed_at``/``updated_at`` is not newer than the
+        value recorded at the last download are left alone. Git clones are
+        fast-forwarded; ZIP downloads are replaced by a fresh download.
+        """
+        recorded = self._read_sync_state(repo_path.parent).get(repo_data['full_name'])
+        current = repo_data.get('pushed_at') or repo_data.get('updated_at')
+        if recorded and current and current <= recorded:
+            click.echo(f"Repository {repo_data['full_name']} is up to date")
+            return True
+        
+        if (repo_path / '.git').exists():
+            return self._pull_repository(repo_data, repo_path)
+        
+        return self._fetch_atomically(repo_data, repo_path, method, show_progress, clone_options)
+    
+    def _pull_repository(self, repo_data: Dict, repo_path: Path) -> bool:
+        """Fetch and fast-forward an existing clone to the remote default branch."""
+        import git
+        
+        try:
+            click.echo(f"Updating {repo_data['full_name']}...")
+            repo = git.Repo(repo_path)
+            with self.telemetry.phase('fetch'):
+                repo.remotes.origin.fetch(repo_data['default_branch'])
+            with self.telemetry.phase('checkout'):
+                repo.git.merge('--ff-only', 'FETCH_HEAD')
+            return True
+        except git.exc.GitError as e:
+            click.echo(f"Git update failed for {repo_data['full_name']}: {e}")
+            return False
+    
+    def _read_sync_state(self, download_dir: Path) -> Dict[str, str]:
+        """Read the last recorded push timestamps for a download directory."""
+        state_file = download_dir / SYNC_STATE_FILE
+        if not state_file.exists():
+            return {}
+        with open(state_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _record_sync_state(self, repo_data: Dict, download_dir: Path) -> None:
+        """Remember the push timestamp of a repository that was just downloaded."""
+        pushed_at = repo_data.get('pushed_at') or repo_data.get('updated_at')
+        if not pushed_at:
+            return
+        with self._sync_state_lock:
+            state = self._read_sync_state(download_dir)
+            state[repo_data['full_name']] = pushed_at
+            state_file = download_dir / SYNC_STATE_FILE
+            tmp_file = state_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+            os.replace(tmp_file, state_file)
+    
+    def download_repositories(
+        self,
+        repositories: List[Dict],
+        download_dir: str = "downloaded_repos",
+        method: str = "clone",
+        jobs: int = 1,
+        sync: bool = False,
+        clone_options: Optional[Dict] = None,
+        manifest: Optional[JobManifest] = None,
+        on_complete: Optional[Callable[[Dict, bool], None]] = None
+    ) -> Dict[str, bool]:
+        """Download several repositories, optionally in parallel.
+        
+        With ``jobs > 1`` downloads run on a bounded thread pool and the
+        per-repository archive progress bars are replaced by a single aggregate
+        progress bar.
+        
+        Args:
+            repositories: List of repository dictionaries
+            download_dir: Directory to download repositories to
+            method: 'clone', 'zip' or 'tarball'
+            jobs: Number of concurrent downloads
+            sync: Refresh repositories that already exist instead of skipping them
+            clone_options: Shallow/partial/sparse clone options, see ``_clone_repository``
+            manifest: Optional job manifest to record per-repository progress in
+            on_complete: Optional callback called with each repository and its success status
+            
+        Returns:
+            Mapping of repository full name to success status, in input order
+        """
+        from tqdm import tqdm
+        
+        jobs = max(1, jobs)
+        results = {}
+        
+        def download(repo: Dict, show_progress: bool) -> bool:
+            if manifest is not None:
+                manifest.record(repo['full_name'], JobManifest.DOWNLOADING)
+            start = time.monotonic()
+            success = self.download_repository(
+                repo, download_dir, method, show_progress, sync=sync, clone_options=clone_options
+            )
+            duration = time.monotonic() - start
+            repo_path = Path(download_dir) / repo['full_name'].replace('/', '_')
+            size = _directory_size(repo_path) if success else 0
+            self.telemetry.record_download(repo['full_name'], method, success, size, duration)
+            if manifest is not None:
+                manifest.record(
+                    repo['full_name'],
+                    JobManifest.DONE if success else JobManifest.FAILED,
+                    bytes=size,
+                    duration=round(duration, 3)
+                )
+            return success
+        
+        with self.telemetry.phase('download'), \
+                tqdm(total=len(repositories), desc="Downloading repositories", unit="repos") as pbar:
+            if jobs == 1:
+                for repo in repositories:
+                    results[repo['full_name']] = download(repo, True)
+                    if on_complete is not None:
+                        on_complete(repo, results[repo['full_name']])
+                    pbar.update(1)
+            else:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    futures = {executor.submit(download, repo, False): repo for repo in repositories}
+                    for future in as_completed(futures):
+                        repo = futures[future]
+                        results[repo['full_name']] = future.result()
+                        if on_complete is not None:
+                            on_complete(repo, results[repo['full_name']])
+                        failed = sum(1 for ok in results.values() if not ok)
+                        pbar.set_postfix(ok=len(results) - failed, failed=failed)
+                        pbar.update(1)
+        
+        if self.mirrors is not None and method == "clone" and self.mirrors.dissociate:
+            for name in self.mirrors.evict():
+                click.echo(f"Evicted mirror {name}")
+        
+        return {repo['full_name']: results[repo['full_name']] for repo in repositories}
+    
+    def download_code_files(
+        self,
+        files: List[Dict],
+        download_dir: str = "downloaded_repos",
+        jobs: int = 4
+    ) -> Dict[str, bool]:
+        """Download individual files found by ``search_code``.
+        
+        Each file is fetched from the Git blobs API by its SHA and written to
+        ``download_dir/<owner>_<repo>/<path>``. Files that are already on
+        disk with the same blob SHA are skipped, and identical blobs are only
+        fetched once.
+        
+        Args:
+            files: File dictionaries from ``search_code``
+            download_dir: Directory to write the files to
+            jobs: Number of concurrent downloads
+            
+        Returns:
+            Mapping of ``repository/path`` to success status, in input order
+        """
+        from tqdm import tqdm
+        
+        blobs = {}
+        blobs_lock = threading.Lock()
+        
+        def download(file: Dict) -> bool:
+            target = _safe_join(Path(download_dir) / file['repository'].replace('/', '_'), file['path'])
+            if target is None:
+                click.echo(f"Skipping unsafe path {file['path']} in {file['repository']}")
+                return False
+            if target.is_file() and git_blob_sha(target.read_bytes()) == file['sha']:
+                return True
+            
+            with blobs_lock:
+                data = blobs.get(file['sha'])
+            if data is None:
+                try:
+                    data = self._fetch_blob(file['repository'], file['sha'])
+                except Exception as e:
+                    click.echo(f"Error downloading {file['repository']}/{file['path']}: {e}")
+                    return False
+                with blobs_lock:
+                    blobs[file['sha']] = data
+            
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(f".{target.name}{PARTIAL_SUFFIX}")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, target)
+            return True
+        
+        keys = [f"{file['repository']}/{file['path']}" for file in files]
+        results = {}
+        with self.telemetry.phase('download'), \
+                tqdm(total=len(files), desc="Downloading files", unit="files") as pbar, \
+                ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = {executor.submit(download, file): key for file, key in zip(files, keys)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                pbar.update(1)
+        
+        return {key: results[key] for key in keys}
+    
+    def _fetch_blob(self, repository: str, sha: str) -> bytes:
+        """Fetch the raw contents of a Git blob."""
+        with self.telemetry.phase('transfer'):
+            response = self._request(
+                'GET', f"{self.base_url}/repos/{repository}/git/blobs/{sha}",
+                headers={'Accept': 'application/vnd.github.raw'}
+            )
+            response.raise_for_status()
+            data = response.content
+        self.telemetry.add_bytes('core', _wire_bytes(response))
+        if git_blob_sha(data) != sha:
+            raise ValueError(f"blob {sha} failed verification")
+        return data
+    
+    def _clone_repository(self, repo_data: Dict, repo_path: Path, clone_options: Optional[Dict] = None) -> bool:
+        """Clone repository using git.
+        
+        ``clone_options`` may contain ``depth`` (shallow clone), ``single_branch``,
+        ``blob_filter`` (partial clone filter such as ``blob:none``) and
+        ``sparse_paths`` (sparse checkout patterns such as ``*.py`` or ``src/``).
+        With a mirror cache, the clone only fetches objects its mirror lacks.
+        """
+        import git
+        
+        options = clone_options or {}
+        kwargs = {}
+        if options.get('depth'):
+            kwargs['depth'] = options['depth']
+        if options.get('single_branch'):
+            kwargs['single_branch'] = True
+            kwargs['branch'] = repo_data['default_branch']
+        if options.get('blob_filter'):
+            kwargs['filter'] = options['blob_filter']
+        sparse_paths = options.get('sparse_paths')
+        if sparse_paths:
+            # Check out only after the sparse patterns are set so that, with a
+            # partial clone, only the matching blobs are downloaded
+            kwargs['no_checkout'] = True
+        
+        # Mirrors hold every branch with full history and all blobs, more than
+        # a shallow, partial or single-branch clone would transfer on its own
+        use_mirror = self.mirrors is not None and not (
+            options.get('depth') or options.get('blob_filter') or options.get('single_branch')
+        )
+        if self.mirrors is not None and not use_mirror and not self._mirror_skip_warned:
+            self._mirror_skip_warned = True
+            click.echo("Note: the mirror cache is not used for shallow, partial or single-branch clones")
+        
+        with ExitStack() as stack:
+            if use_mirror:
+                with self.telemetry.phase('mirror'):
+                    # Borrowed until the clone and checkout are done, so eviction cannot delete it meanwhile
+                    reference = stack.enter_context(self.mirrors.borrow(repo_data, self._fork_network(repo_data)))
+                if reference is not None:
+                    kwargs['reference'] = str(reference)
+                    kwargs['dissociate'] = self.mirrors.dissociate
+            
+            try:
+                click.echo(f"Cloning {repo_data['full_name']}...")
+                with self.telemetry.phase('clone'):
+                    repo = git.Repo.clone_from(repo_data['clone_url'], repo_path, **kwargs)
+                if sparse_paths:
+                    with self.telemetry.phase('checkout'):
+                        repo.git.sparse_checkout('set', '--no-cone', *sparse_paths)
+                        repo.git.checkout(repo_data['default_branch'])
+                return True
+            except git.exc.GitError as e:
+                click.echo(f"Git clone failed for {repo_data['full_name']}: {e}")
+                return False
+    
+    def _fork_network(self, repo_data: Dict) -> str:
+        """Full name of the root repository of a repository's fork network."""
+        import requests
+        
+        if not repo_data.get('fork'):
+            return repo_data['full_name']
+        try:
+            data = self._get_json(f"{self.base_url}/repos/{repo_data['full_name']}", {})
+        except requests.exceptions.RequestException:
+            return repo_data['full_name']
+        return (data.get('source') or {}).get('full_name') or repo_data['full_name']
+    
+    def _download_zip(self, repo_data: Dict, repo_path: Path, show_progress: bool = True) -> bool:
+        """Download repository as ZIP file and extract.
+        
+        The archive is buffered in memory and moved to a temporary file only
+        once it grows beyond ``spool_size``, and entries are extracted straight
+        into ``repo_path`` with the ``name-branch/`` prefix stripped.
+        """
+        from tqdm import tqdm
+        
         try:
-            click.echo(f"Cloning {repo_data['full_name']}...")
-            git.Repo.clone_from(repo_data['clone_url'], repo_path)
+            # GitHub ZIP download URL
+            zip_url = f"{self.web_url}/{repo_data['full_name']}/archive/refs/heads/{repo_data['default_branch']}.zip"
+            
+            click.echo(f"Downloading ZIP for {repo_data['full_name']}...")
+            
+            response = self._request('GET', zip_url, resource=None, stream=True)
+            response.raise_for_status()
+            
+            total_size = int(response.headers.get('content-length', 0))
+            
+            # SpooledTemporaryFile is not seekable() before Python 3.11, which ZipFile needs
+            with ExitStack() as stack:
+                buffer = stack.enter_context(io.BytesIO())
+                with self.telemetry.phase('transfer'), \
+                        tqdm(total=total_size, unit='B', unit_scale=True, desc=f"Downloading {repo_data['name']}",
+                             disable=not show_progress) as pbar:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        if chunk:
+                            buffer.write(chunk)
+                            pbar.update(len(chunk))
+                            if isinstance(buffer, io.BytesIO) and buffer.tell() > self.spool_size:
+                                spooled = stack.enter_context(tempfile.TemporaryFile())
+                                spooled.write(buffer.getbuffer())
+                                buffer = spooled
+                self.telemetry.add_bytes(None, buffer.tell())
+                
+                buffer.seek(0)
+                with self.telemetry.phase('extract'), zipfile.ZipFile(buffer, 'r') as zip_ref:
+                    for member in zip_ref.infolist():
+                        target = _strip_archive_prefix(repo_path, member.filename)
+                        if target is None:
+                            continue
+                        if member.is_dir():
+                            target.mkdir(parents=True, exist_ok=True)
+                            continue
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        with zip_ref.open(member) as source, open(target, 'wb') as dest:
+                            shutil.copyfileobj(source, dest, self.chunk_size)
+            
+            repo_path.mkdir(parents=True, exist_ok=True)
             return True
-        except git.exc.GitError as e:
-            click.echo(f"Git clone failed for {repo_data['full_name']}: {e}")
+            
+        except Exception as e:
+            click.echo(f"ZIP download failed for {repo_data['full_name']}: {e}")
             return False
     
-    def _download_zip(self, repo_data: Dict, repo_path: Path) -> bool:
-        """Download repository as ZIP file and extract."""
+    def _download_tarball(self, repo_data: Dict, repo_path: Path, show_progress: bool = True) -> bool:
+        """Download repository as a tarball, extracting it while it streams in.
+        
+        Nothing is written to disk except the extracted files, and the
+        ``name-branch/`` prefix is stripped during extraction.
+        """
+        from tqdm import tqdm
+        
         try:
-            # GitHub ZIP download URL
-            zip_url = f"https://github.com/{repo_data['full_name']}/archive/refs/heads/{repo_data['default_branch']}.zip"
+            tar_url = f"{self.web_url}/{repo_data['full_name']}/archive/refs/heads/{repo_data['default_branch']}.tar.gz"
             
-            click.echo(f"Downloading ZIP for {repo_data['full_name']}...")
+            click.echo(f"Downloading tarball for {repo_data['full_name']}...")
             
-            response = self.session.get(zip_url, stream=True)
+            response = self._request('GET', tar_url, resource=None, stream=True)
             response.raise_for_status()
+            response.raw.decode_content = True
             
-            # Download ZIP file
-            zip_path = repo_path.with_suffix('.zip')
             total_size = int(response.headers.get('content-length', 0))
+            # Reject links and special files that would escape the target directory
+            extract_kwargs = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+            repo_path.mkdir(parents=True, exist_ok=True)
             
-            with open(zip_path, 'wb') as f:
-                with tqdm(total=total_size, unit='B', unit_scale=True, desc=f"Downloading {repo_data['name']}") as pbar:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            pbar.update(len(chunk))
-            
-            # Extract ZIP file
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(repo_path.parent)
-                
-            # Rename extracted folder to remove branch suffix
-            extracted_folder = repo_path.parent / f"{repo_data['name']}-{repo_data['default_branch']}"
-            if extracted_folder.exists():
-                extracted_folder.rename(repo_path)
-            
-            # Remove ZIP file
-            zip_path.unlink()
+            # Extraction happens while the archive streams in, so it is timed as transfer
+            with self.telemetry.phase('transfer'), \
+                    tqdm(total=total_size, unit='B', unit_scale=True, desc=f"Downloading {repo_data['name']}",
+                         disable=not show_progress) as pbar:
+                stream = _ProgressReader(response.raw, pbar)
+                with tarfile.open(fileobj=stream, mode='r|gz', bufsize=self.chunk_size) as archive:
+                    for member in archive:
+                        target = _strip_archive_prefix(repo_path, member.name)
+                        if target is None:
+                            continue
+                        member.name = str(target.relative_to(repo_path))
+                        if member.islnk():
+                            link_target = _strip_archive_prefix(repo_path, member.linkname)
+                            if link_target is None:
+                                continue
+                            member.linkname = str(link_target.relative_to(repo_path))
+                        try:
+                            archive.extract(member, repo_path, **extract_kwargs)
+                        except tarfile.TarError as e:
+                            click.echo(f"Skipping {member.name} in {repo_data['full_name']}: {e}")
+                # Read the tar padding and gzip trailer so the connection is released for reuse
+                while stream.read(self.chunk_size):
+                    pass
+            self.telemetry.add_bytes(None, stream.bytes_read)
             
             return True
             
         except Exception as e:
-            click.echo(f"ZIP download failed for {repo_data['full_name']}: {e}")
+            click.echo(f"Tarball download failed for {repo_data['full_name']}: {e}")
             return False
     
-    def save_metadata(self, repositories: List[Dict], filename: str = "repository_metadata.csv") -> None:
-        """Save repository metadata to CSV file.
+    def save_metadata(
+        self,
+        repositories: Iterable[Dict],
+        filename: str = "repository_metadata.csv",
+        output_format: Optional[str] = None
+    ) -> None:
+        """Save repository metadata to a CSV or JSON Lines file.
+        
+        When the fetcher has a metadata index, the records are upserted into
+        it as well.
         
         Args:
-            repositories: List of repository dictionaries
-            filename: Output CSV filename
+            repositories: Repository dictionaries (any iterable, consumed lazily)
+            filename: Output filename
+            output_format: 'csv' or 'jsonl' (inferred from the file extension if omitted)
         """
-        if not repositories:
+        iterator = iter(repositories)
+        with MetadataWriter(filename, output_format) as writer:
+            while True:
+                batch = list(islice(iterator, 500))
+                if not batch:
+                    break
+                writer.write(batch)
+                if self.index is not None:
+                    self.index.upsert(batch)
+        
+        if not writer.count:
             click.echo("No repositories to save.")
             return
+        click.echo(f"Metadata saved to {filename}")
+
+
+class JobQueue:
+    """Priority queue of search/download jobs run by worker threads on one shared fetcher.
+    
+    Jobs with a higher ``priority`` start first, equal priorities in
+    submission order. Each job is a dict with its ``id``, ``type``,
+    ``params``, ``state`` (queued, running, done, failed, cancelled),
+    timestamps, ``progress`` and, once finished, ``result`` or ``error``.
+    Only the most recent ``max_finished`` finished jobs are kept.
+    """
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    
+    TYPES = ('search', 'download')
+    DOWNLOAD_KEYS = ('repositories', 'download_dir', 'method', 'jobs', 'sync', 'depth', 'single_branch',
+                     'blob_filter', 'sparse_paths')
+    
+    def __init__(self, fetcher: 'GitHubCodeFetcher', workers: int = 2, download_dir: str = "downloaded_repos",
+                 max_finished: int = 1000, search_concurrency: int = 4):
+        """Start the worker threads.
+        
+        Args:
+            fetcher: Fetcher shared by all jobs (session, caches, rate limits)
+            workers: Number of jobs run at the same time
+            download_dir: Base directory for download jobs without a ``download_dir``
+            max_finished: Number of finished jobs kept for status queries
+            search_concurrency: Number of search result pages each job fetches in parallel
+        """
+        self.fetcher = fetcher
+        self.download_dir = download_dir
+        self.search_concurrency = search_concurrency
+        self.max_finished = max_finished
+        self.jobs: Dict[str, Dict] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._counter = 0
+        self._stopping = False
+        self.condition = threading.Condition()
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, workers))]
+        for worker in self.workers:
+            worker.start()
+    
+    def submit(self, job_type: str, params: Dict, priority: int = 0) -> Dict:
+        """Queue a job.
+        
+        Args:
+            job_type: 'search' or 'download'
+            params: Search keys (as in batch files) plus, for downloads, ``repositories``
+                (instead of a query), ``download_dir``, ``method``, ``jobs``, ``sync`` and clone options;
+                ``download_dir`` is relative to the queue's base directory and must stay inside it
+            priority: Higher priorities run first
             
-        # Convert to DataFrame for easy CSV export
-        df = pd.DataFrame(repositories)
+        Returns:
+            The job record
+        """
+        if job_type not in self.TYPES:
+            raise ValueError(f"Unknown job type {job_type!r}, expected one of {', '.join(self.TYPES)}")
+        allowed = BATCH_QUERY_KEYS + (self.DOWNLOAD_KEYS if job_type == 'download' else ())
+        unknown = set(params) - set(allowed)
+        if unknown:
+            raise ValueError(f"Unknown parameters for a {job_type} job: {', '.join(sorted(unknown))}")
+        if not params.get('query') and not (job_type == 'download' and params.get('repositories')):
+            raise ValueError("A job needs a 'query'" + (" or 'repositories'" if job_type == 'download' else ""))
+        if params.get('download_dir'):
+            base = Path(self.download_dir).resolve()
+            target = (base / params['download_dir']).resolve()
+            if target != base and base not in target.parents:
+                raise ValueError(f"download_dir must be inside {base}")
+            params = dict(params, download_dir=str(target))
         
-        # Add download timestamp
-        df['downloaded_at'] = datetime.now().isoformat()
+        job = {
+            'id': uuid.uuid4().hex[:12], 'type': job_type, 'params': params, 'priority': int(priority),
+            'state': self.QUEUED, 'created_at': datetime.now().isoformat(), 'started_at': None,
+            'finished_at': None, 'progress': {'done': 0, 'total': None}, 'result': None, 'error': None
+        }
+        with self.condition:
+            self.jobs[job['id']] = job
+            self._counter += 1
+            heapq.heappush(self._heap, (-job['priority'], self._counter, job['id']))
+            self.condition.notify()
+        return job
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Copy of a job record, or None if unknown."""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            return dict(job, progress=dict(job['progress'])) if job else None
+    
+    def list(self) -> List[Dict]:
+        """All known jobs without their results, oldest first."""
+        with self.condition:
+            return [{key: value for key, value in job.items() if key != 'result'} for job in self.jobs.values()]
+    
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet."""
+        with self.condition:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] != self.QUEUED:
+                return False
+            job['state'] = self.CANCELLED
+            job['finished_at'] = datetime.now().isoformat()
+            return True
+    
+    def stats(self) -> Dict:
+        """Number of jobs per state."""
+        with self.condition:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['state']] = counts.get(job['state'], 0) + 1
+        return counts
+    
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the workers once their current jobs finish; queued jobs are left queued."""
+        with self.condition:
+            self._stopping = True
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+    
+    def _work(self) -> None:
+        while True:
+            with self.condition:
+                while not self._stopping and not self._heap:
+                    self.condition.wait()
+                if self._stopping:
+                    return
+                job = self.jobs.get(heapq.heappop(self._heap)[2])
+                if job is None or job['state'] != self.QUEUED:
+                    continue
+                job['state'] = self.RUNNING
+                job['started_at'] = datetime.now().isoformat()
+            
+            try:
+                result = self._run(job)
+                state, error = self.DONE, None
+            except Exception as e:
+                result, state, error = None, self.FAILED, f"{type(e).__name__}: {e}"
+            
+            with self.condition:
+                job.update(state=state, result=result, error=error, finished_at=datetime.now().isoformat())
+                self._forget_old_jobs()
+    
+    def _run(self, job: Dict) -> Dict:
+        params = dict(job['params'])
+        search_params = {key: params[key] for key in BATCH_QUERY_KEYS if key in params}
+        repositories = params.get('repositories')
+        if repositories is None:
+            repositories = self.fetcher.search_repositories(concurrency=self.search_concurrency, **search_params)
+            if self.fetcher.index is not None:
+                self.fetcher.index.upsert(repositories)
+        if job['type'] == 'search':
+            return {'count': len(repositories), 'repositories': repositories}
         
-        # Reorder columns for better readability
-        column_order = [
-            'name', 'full_name', 'description', 'stars', 'forks', 'language',
-            'html_url', 'clone_url', 'size', 'created_at', 'updated_at',
-            'topics', 'license', 'archived', 'default_branch', 'downloaded_at'
-        ]
+        download_dir = params.get('download_dir') or str(Path(self.download_dir) / sanitize_folder_name(
+            search_params.get('query', 'repositories'), search_params.get('language'),
+            search_params.get('min_stars', 0)
+        ))
+        job['progress']['total'] = len(repositories)
         
-        df = df.reindex(columns=column_order)
+        def on_complete(repo: Dict, success: bool) -> None:
+            with self.condition:
+                job['progress']['done'] += 1
         
-        # Save to CSV
-        df.to_csv(filename, index=False)
-        click.echo(f"Metadata saved to {filename}")
+        results = self.fetcher.download_repositories(
+            repositories, download_dir, params.get('method', 'clone'), jobs=params.get('jobs', 4),
+            sync=params.get('sync', False), on_complete=on_complete,
+            clone_options=_make_clone_options(
+                params.get('depth'), params.get('single_branch', False), params.get('blob_filter'),
+                params.get('sparse_paths', ())
+            )
+        )
+        return {
+            'download_dir': download_dir,
+            'succeeded': sum(1 for ok in results.values() if ok),
+            'failed': [name for name, ok in results.items() if not ok],
+        }
+    
+    def _forget_old_jobs(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items()
+                    if job['state'] in (self.DONE, self.FAILED, self.CANCELLED)]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+
+def make_job_server(queue: JobQueue, host: str = "127.0.0.1", port: int = 8765,
+                    socket_path: Optional[str] = None):
+    """Build the HTTP server for a job queue, on a TCP port or a Unix socket.
+    
+    Endpoints (JSON in and out):
+    
+    - ``POST /jobs`` with ``{"type": ..., "params": {...}, "priority": 0}`` queues a job;
+      the request must have ``Content-Type: application/json``
+    - ``GET /jobs`` lists jobs, ``GET /jobs/<id>`` returns one job with its result
+    - ``DELETE /jobs/<id>`` cancels a queued job
+    - ``GET /stats`` returns job counts and the fetcher's telemetry summary
+    
+    Args:
+        queue: Job queue the requests go to
+        host: Interface to listen on for TCP
+        port: TCP port (0 picks a free one)
+        socket_path: Listen on this Unix socket instead of TCP
+        
+    Returns:
+        A ``socketserver`` server; call ``serve_forever()`` on it
+    """
+    import socketserver
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/jobs':
+                self._reply(200, {'jobs': queue.list()})
+            elif self.path.startswith('/jobs/'):
+                job = queue.get(self.path[len('/jobs/'):])
+                if job is None:
+                    self._reply(404, {'error': 'Unknown job'})
+                else:
+                    self._reply(200, job)
+            elif self.path == '/stats':
+                queue.fetcher.telemetry.set_connections(queue.fetcher.connection_stats())
+                self._reply(200, {'jobs': queue.stats(), 'telemetry': queue.fetcher.telemetry.summary()})
+            else:
+                self._reply(404, {'error': 'Not found'})
+        
+        def do_POST(self):
+            if self.path != '/jobs':
+                self._reply(404, {'error': 'Not found'})
+                return
+            # Browsers can only send cross-site JSON after a CORS preflight, which is never answered
+            if self.headers.get_content_type() != 'application/json':
+                self._reply(415, {'error': 'Content-Type must be application/json'})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                job = queue.submit(body.get('type', ''), body.get('params') or {}, body.get('priority', 0))
+            except (ValueError, TypeError, AttributeError) as e:
+                self._reply(400, {'error': str(e)})
+                return
+            self._reply(202, job)
+        
+        def do_DELETE(self):
+            if self.path.startswith('/jobs/') and queue.cancel(self.path[len('/jobs/'):]):
+                self._reply(200, {'cancelled': True})
+            else:
+                self._reply(409, {'error': 'Job is unknown or already started'})
+        
+        def _reply(self, status: int, payload: Dict) -> None:
+            body = json.dumps(payload, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def address_string(self):
+            # Unix socket peers have no address
+            return self.client_address[0] if self.client_address else socket_path
+        
+        def log_message(self, format, *args):
+            click.echo(f"{self.address_string()} - {format % args}")
+    
+    if socket_path is None:
+        return ThreadingHTTPServer((host, port), Handler)
+    
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+    
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = UnixHTTPServer(socket_path, Handler)
+    os.chmod(socket_path, 0o600)
+    return server
+
+
+def _echo_repository(index: int, repo: Dict) -> None:
+    """Print one search result line with its (truncated) description."""
+    description = repo['description'] or ''
+    click.echo(f"{index:2d}. {repo['full_name']} ⭐{repo['stars']} ({repo['language']})")
+    click.echo(f"    {description[:80]}..." if len(description) > 80 else f"    {description}")
+
+def parse_size(value: str) -> int:
+    """Parse a human-readable size such as ``500MB``, ``2G`` or ``1.5GiB`` into bytes.
+    
+    Units are binary (1K = 1024 bytes); a bare number is a byte count.
+    
+    Args:
+        value: Size string
+        
+    Returns:
+        Size in bytes
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** ' KMGT'.index(unit.upper() or ' '))
+
+
+def format_size(num_bytes: float) -> str:
+    """Format a byte count for display, e.g. ``1.5 GB``."""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{int(num_bytes)} B"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
+
+
+def plan_downloads(
+    repositories: List[Dict],
+    download_dir: str,
+    max_repo_size: Optional[int] = None,
+    total_budget: Optional[int] = None,
+    check_free_space: bool = True
+) -> Dict:
+    """Choose which repositories to download within size limits, smallest first.
+    
+    Sizes come from the ``size`` field of the search results (in KB).
+    Repositories are considered in result order, so the best matches win when
+    the budget runs out, and the selection is then ordered by ascending size
+    to get the first results on disk sooner. Repositories that already exist
+    in ``download_dir`` cost nothing.
+    
+    Args:
+        repositories: Repository dictionaries
+        download_dir: Directory the repositories will be downloaded to
+        max_repo_size: Skip repositories larger than this many bytes
+        total_budget: Maximum total bytes to download
+        check_free_space: Also keep the total within the free disk space
+        
+    Returns:
+        Dict with 'selected' repositories, 'skipped' (repository, reason)
+        pairs, 'total_bytes' and 'free_bytes'
+    """
+    free_bytes = None
+    if check_free_space:
+        existing = Path(download_dir).resolve()
+        while not existing.exists():
+            existing = existing.parent
+        free_bytes = shutil.disk_usage(existing).free
+    
+    limits = [limit for limit in (total_budget, free_bytes) if limit is not None]
+    budget = min(limits) if limits else None
+    selected = []
+    skipped = []
+    total_bytes = 0
+    
+    for repo in repositories:
+        size = (repo.get('size') or 0) * 1024
+        if (Path(download_dir) / repo['full_name'].replace('/', '_')).exists():
+            size = 0
+        
+        if max_repo_size is not None and size > max_repo_size:
+            skipped.append((repo, f"larger than {format_size(max_repo_size)}"))
+        elif budget is not None and total_bytes + size > budget:
+            reason = "over total budget" if budget == total_budget else "not enough free disk space"
+            skipped.append((repo, reason))
+        else:
+            selected.append(repo)
+            total_bytes += size
+    
+    selected.sort(key=lambda repo: repo.get('size') or 0)
+    return {'selected': selected, 'skipped': skipped, 'total_bytes': total_bytes, 'free_bytes': free_bytes}
+
+
+def parse_rank_weights(value: str) -> Dict[str, float]:
+    """Parse ranking weights such as ``stars=1,recency=2,size=-0.5``.
+    
+    Factors that are not mentioned keep their ``DEFAULT_RANK_WEIGHTS`` weight;
+    set one to 0 to leave it out of the score.
+    
+    Args:
+        value: Comma-separated ``factor=weight`` pairs
+        
+    Returns:
+        Weight for every factor
+    """
+    weights = dict(DEFAULT_RANK_WEIGHTS)
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        name, _, number = part.partition('=')
+        try:
+            if name.strip() not in weights:
+                raise ValueError
+            weights[name.strip()] = float(number)
+        except ValueError:
+            raise ValueError(f"Invalid ranking weight {part!r}, expected <factor>=<number> "
+                             f"with factor one of {', '.join(DEFAULT_RANK_WEIGHTS)}")
+    return weights
+
+
+def rank_repositories(
+    repositories: List[Dict],
+    weights: Optional[Dict[str, float]] = None,
+    top_k: Optional[int] = None,
+    exclude_archived: bool = False,
+    licenses: Iterable[str] = (),
+    recency_half_life: float = 365.0,
+    now: Optional[datetime] = None
+) -> List[Dict]:
+    """Score repositories with a weighted formula and return the best ones first.
+    
+    The score is ``stars * log1p(stars) + forks * log1p(forks) + recency *
+    0.5 ** (days since updated_at / recency_half_life) + size * log1p(size in
+    KB)``, with the factor names standing for their weights. It is computed
+    with NumPy over all records at once, so tens of thousands of search
+    results rank in milliseconds; equal scores keep their search order.
+    
+    Args:
+        repositories: Repository dictionaries
+        weights: Weight per factor, missing ones taken from ``DEFAULT_RANK_WEIGHTS``
+        top_k: Only return this many repositories
+        exclude_archived: Drop archived repositories
+        licenses: Only keep repositories with one of these license names (case-insensitive)
+        recency_half_life: Days after which the recency factor halves
+        now: Reference time for recency (default: now)
+        
+    Returns:
+        Copies of the kept repositories with a ``score`` field, highest score first
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        raise ValueError("NumPy is required for ranking (pip install numpy)")
+    
+    weights = {**DEFAULT_RANK_WEIGHTS, **(weights or {})}
+    count = len(repositories)
+    if not count:
+        return []
+    
+    def column(field):
+        return np.fromiter((repo.get(field) or 0 for repo in repositories), dtype=np.float64, count=count)
+    
+    now = now or datetime.now(timezone.utc)
+    if now.tzinfo is not None:
+        now = now.astimezone(timezone.utc).replace(tzinfo=None)
+    # Timestamps are UTC ("2024-01-31T12:00:00Z"); NumPy wants them without the zone
+    updated = np.array([str(repo.get('updated_at') or '')[:19] or 'NaT' for repo in repositories],
+                       dtype='datetime64[s]')
+    age_days = (np.datetime64(now, 's') - updated) / np.timedelta64(1, 'D')
+    recency = np.nan_to_num(0.5 ** (np.maximum(age_days, 0) / recency_half_life), nan=0.0)
+    
+    scores = (weights['stars'] * np.log1p(column('stars'))
+              + weights['forks'] * np.log1p(column('forks'))
+              + weights['recency'] * recency
+              + weights['size'] * np.log1p(column('size')))
+    
+    keep = np.ones(count, dtype=bool)
+    if exclude_archived:
+        keep &= ~np.fromiter((bool(repo.get('archived')) for repo in repositories), dtype=bool, count=count)
+    allowed = {name.lower() for name in licenses}
+    if allowed:
+        keep &= np.fromiter(((repo.get('license') or '').lower() in allowed for repo in repositories),
+                            dtype=bool, count=count)
+    
+    candidates = np.flatnonzero(keep)
+    order = candidates[np.argsort(-scores[candidates], kind='stable')[:top_k]]
+    return [dict(repositories[i], score=round(float(scores[i]), 4)) for i in order.tolist()]
+
+
+def _scan_repository(repo_dir: str, extensions: Tuple[str, ...], max_file_size: int,
+                     utf8_only: bool = False) -> Tuple[List[Tuple], int]:
+    """Hash the packageable files of one repository; runs in a worker process.
+    
+    Skips ``.git``, symlinks, binary files (a NUL byte in the first 8 KiB),
+    files over ``max_file_size`` or without one of ``extensions`` and, with
+    ``utf8_only``, files that are not valid UTF-8.
+    
+    Returns:
+        Sorted (relative path, blob SHA, size) tuples and the number of files skipped
+    """
+    files = []
+    skipped = 0
+    for root, dirs, names in os.walk(repo_dir):
+        dirs[:] = [name for name in dirs if name != '.git']
+        for name in names:
+            path = os.path.join(root, name)
+            if extensions and not name.lower().endswith(extensions):
+                skipped += 1
+                continue
+            try:
+                if os.path.islink(path) or os.path.getsize(path) > max_file_size:
+                    skipped += 1
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                skipped += 1
+                continue
+            if b'\0' in data[:8192]:
+                skipped += 1
+                continue
+            if utf8_only:
+                try:
+                    data.decode('utf-8')
+                except UnicodeDecodeError:
+                    skipped += 1
+                    continue
+            files.append((os.path.relpath(path, repo_dir).replace(os.sep, '/'), git_blob_sha(data), len(data)))
+    files.sort()
+    return files, skipped
+
+
+def _write_shard(shard_path: str, shard_format: str, entries: List[Tuple[str, List[Dict]]],
+                 level: Optional[int]) -> Dict:
+    """Write one corpus shard and its index; runs in a worker process.
+    
+    Args:
+        shard_path: Shard filename without extension
+        shard_format: One of ``CORPUS_FORMATS``
+        entries: (file to read, occurrences) per unique file; the first occurrence is stored
+        level: Compression level, or None for the format's default
+        
+    Returns:
+        Shard summary for the corpus manifest
+    """
+    filename = f"{shard_path}.{shard_format}"
+    index_filename = f"{shard_path}.index.jsonl"
+    stored = occurrences = num_bytes = 0
+    
+    with open(filename + PARTIAL_SUFFIX, 'wb') as raw, open(index_filename + PARTIAL_SUFFIX, 'w',
+                                                            encoding='utf-8') as index:
+        if shard_format == 'tar.zst':
+            import zstandard
+            compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+            stream = compressor.stream_writer(raw, closefd=False)
+            archive = tarfile.open(fileobj=stream, mode='w|')
+        else:
+            stream = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6 if level is None else level, mtime=0)
+        
+        for source, found in entries:
+            first = found[0]
+            try:
+                with open(source, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            # The file changed (or vanished) since it was scanned
+            if git_blob_sha(data) != first['sha']:
+                continue
+            
+            if shard_format == 'tar.zst':
+                member = tarfile.TarInfo(first['sha'])
+                member.size = len(data)
+                archive.addfile(member, io.BytesIO(data))
+            else:
+                # Only valid UTF-8 was scanned for this format and the SHA still matches
+                record = dict(first, content=data.decode('utf-8'))
+                stream.write(json.dumps(record).encode('utf-8') + b"\n")
+            for occurrence in found:
+                index.write(json.dumps(occurrence) + "\n")
+            stored += 1
+            occurrences += len(found)
+            num_bytes += len(data)
+        
+        if shard_format == 'tar.zst':
+            archive.close()
+        stream.close()
+    
+    os.replace(filename + PARTIAL_SUFFIX, filename)
+    os.replace(index_filename + PARTIAL_SUFFIX, index_filename)
+    return {
+        'shard': os.path.basename(filename), 'index': os.path.basename(index_filename), 'files': stored,
+        'occurrences': occurrences, 'bytes': num_bytes, 'compressed_bytes': os.path.getsize(filename)
+    }
+
+
+def package_corpus(
+    sources: Iterable[str],
+    output_dir: str,
+    extensions: Iterable[str] = (),
+    max_file_size: int = 1024 * 1024,
+    shard_size: int = 256 * 1024 * 1024,
+    shard_format: str = 'jsonl.gz',
+    level: Optional[int] = None,
+    workers: Optional[int] = None,
+    show_progress: bool = True
+) -> Dict:
+    """Pack downloaded repositories into compressed, deduplicated corpus shards.
+    
+    Every folder directly under a source (a topic folder) is one repository.
+    Repositories are scanned and hashed in a process pool; each distinct file
+    content (by Git blob SHA) is then stored once, in the first repository
+    and path it was found at, in shards of at most ``shard_size``
+    uncompressed bytes that are compressed in the process pool as well.
+    
+    ``jsonl.gz`` shards hold one JSON record per file with its ``content``,
+    so files that are not valid UTF-8 are skipped for them; ``tar.zst``
+    shards hold the raw bytes in one member per file, named by its SHA. Next to
+    every shard, ``<shard>.index.jsonl`` lists the repository, path, SHA,
+    language and size of every file whose content is in that shard,
+    duplicates included. ``manifest.json`` summarises the run.
+    
+    Args:
+        sources: Topic folders to package
+        output_dir: Directory for the shards; shards of an earlier run there are replaced
+        extensions: Only package files with one of these extensions (default: all)
+        max_file_size: Skip files larger than this many bytes
+        shard_size: Uncompressed bytes per shard (a larger single file gets a shard of its own)
+        shard_format: One of ``CORPUS_FORMATS``
+        level: Compression level (default: 6 for gzip, 3 for zstd)
+        workers: Worker processes (default: one per CPU)
+        show_progress: Show progress bars
+        
+    Returns:
+        The manifest dict
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from tqdm import tqdm
+    
+    if shard_format not in CORPUS_FORMATS:
+        raise ValueError(f"Unsupported corpus format {shard_format!r}, expected one of {', '.join(CORPUS_FORMATS)}")
+    if shard_format == 'tar.zst':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ValueError("zstandard is required for tar.zst shards (pip install zstandard); or use jsonl.gz")
+    
+    extensions = tuple(ext.lower() if ext.startswith('.') else f".{ext.lower()}" for ext in extensions)
+    repo_dirs = sorted(
+        path for source in sources for path in Path(source).iterdir()
+        if path.is_dir() and not path.name.startswith('.')
+    )
+    
+    # Distinct contents in first-seen order, each with every place it occurs
+    unique: Dict[str, Tuple[str, List[Dict]]] = {}
+    skipped = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        scans = executor.map(_scan_repository, [str(path) for path in repo_dirs], [extensions] * len(repo_dirs),
+                             [max_file_size] * len(repo_dirs), [shard_format == 'jsonl.gz'] * len(repo_dirs))
+        with tqdm(total=len(repo_dirs), desc="Scanning repositories", unit="repos",
+                  disable=not show_progress) as pbar:
+            for repo_dir, (files, repo_skipped) in zip(repo_dirs, scans):
+                skipped += repo_skipped
+                for path, sha, size in files:
+                    occurrence = {
+                        'repository': repo_dir.name, 'path': path, 'sha': sha,
+                        'language': EXTENSION_LANGUAGES.get(os.path.splitext(path)[1].lower(), ''), 'size': size
+                    }
+                    if sha in unique:
+                        unique[sha][1].append(occurrence)
+                    else:
+                        unique[sha] = (str(repo_dir / path), [occurrence])
+                pbar.update(1)
+        
+        shards = [[]]
+        shard_bytes = 0
+        for source, found in unique.values():
+            size = found[0]['size']
+            if shards[-1] and shard_bytes + size > shard_size:
+                shards.append([])
+                shard_bytes = 0
+            shards[-1].append((source, found))
+            shard_bytes += size
+        if not shards[-1]:
+            shards.pop()
+        
+        output = Path(output_dir)
+        output.mkdir(parents=True, exist_ok=True)
+        for old in output.glob("shard-*"):
+            old.unlink()
+        
+        written = executor.map(
+            _write_shard, [str(output / f"shard-{number:05d}") for number in range(len(shards))],
+            [shard_format] * len(shards), shards, [level] * len(shards)
+        )
+        summaries = list(tqdm(written, total=len(shards), desc="Writing shards", unit="shards",
+                              disable=not show_progress))
+    
+    manifest = {
+        'created_at': datetime.now().isoformat(),
+        'format': shard_format,
+        'repositories': len(repo_dirs),
+        'files': sum(shard['occurrences'] for shard in summaries),
+        'unique_files': sum(shard['files'] for shard in summaries),
+        'skipped_files': skipped,
+        'bytes': sum(shard['bytes'] for shard in summaries),
+        'compressed_bytes': sum(shard['compressed_bytes'] for shard in summaries),
+        'shards': summaries,
+    }
+    with open(output / "manifest.json", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class _SizeType(click.ParamType):
+    """Click parameter type for human-readable sizes (see ``parse_size``)."""
+    
+    name = "size"
+    
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return parse_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+def _metadata_columns(enrich: bool = False, scored: bool = False) -> List[str]:
+    """Metadata columns, with the enrichment and ranking score columns if requested."""
+    extra = (ENRICHMENT_COLUMNS if enrich else []) + (['score'] if scored else [])
+    return METADATA_COLUMNS[:-1] + extra + METADATA_COLUMNS[-1:]
+
+def _search_and_save(
+    fetcher: GitHubCodeFetcher,
+    metadata_file: Optional[str],
+    metadata_format: Optional[str] = None,
+    keep_results: bool = True,
+    enrich: bool = False,
+    **search_kwargs
+) -> Tuple[int, List[Dict]]:
+    """Run a search, printing results and writing metadata as each page arrives.
+    
+    Args:
+        fetcher: Fetcher to search with
+        metadata_file: Metadata output filename, or None to not write metadata
+        metadata_format: 'csv' or 'jsonl' (inferred from the file extension if omitted)
+        keep_results: Return the repository records (otherwise only count them)
+        enrich: Add GraphQL metadata to each page before it is written; pages
+            are then requested ``GRAPHQL_BATCH_SIZE`` results at a time so
+            every GraphQL query carries a full batch
+        **search_kwargs: Passed to ``iter_search_pages``
+        
+    Returns:
+        Number of repositories found and, if kept, their records
+    """
+    repositories = []
+    found = 0
+    if enrich:
+        search_kwargs['per_page'] = GRAPHQL_BATCH_SIZE
+    writer = MetadataWriter(metadata_file, metadata_format, _metadata_columns(enrich)) if metadata_file else None
+    with fetcher.telemetry.phase('search'), writer or nullcontext():
+        for page in fetcher.iter_search_pages(show_progress=False, **search_kwargs):
+            if enrich:
+                fetcher.enrich_repositories(page)
+            if writer is not None:
+                writer.write(page)
+            if fetcher.index is not None:
+                fetcher.index.upsert(page)
+            for repo in page:
+                found += 1
+                _echo_repository(found, repo)
+            # Only keep the records around when we still need them for downloading
+            if keep_results:
+                repositories.extend(page)
+    return found, repositories
+
+def _search_local(
+    index: MetadataIndex,
+    metadata_file: Optional[str],
+    metadata_format: Optional[str] = None,
+    **search_kwargs
+) -> Tuple[int, List[Dict]]:
+    """Search the local metadata index, printing results and optionally writing metadata.
+    
+    Args:
+        index: Metadata index to search
+        metadata_file: Metadata output filename, or None to only print
+        metadata_format: 'csv' or 'jsonl' (inferred from the file extension if omitted)
+        **search_kwargs: Passed to ``MetadataIndex.search``
+        
+    Returns:
+        Number of repositories found and their records
+    """
+    repositories = index.search(**search_kwargs)
+    for found, repo in enumerate(repositories, 1):
+        _echo_repository(found, repo)
+    if metadata_file:
+        with MetadataWriter(metadata_file, metadata_format) as writer:
+            writer.write(repositories)
+    return len(repositories), repositories
+
+def _rank_and_save(repositories, metadata_file, metadata_format, enrich, weights, top_k, exclude_archived,
+                   licenses, recency_half_life) -> List[Dict]:
+    """Rank search results and write all that pass the filters, with scores, to the metadata file.
+    
+    Returns:
+        The best ``top_k`` (or all) ranked repositories, to be downloaded
+    """
+    try:
+        ranked = rank_repositories(
+            repositories, weights, exclude_archived=exclude_archived, licenses=licenses,
+            recency_half_life=recency_half_life
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    selected = ranked[:top_k]
+    
+    click.echo(f"\nRanked {len(ranked)} of {len(repositories)} repositories, selected {len(selected)}:")
+    for index, repo in enumerate(selected, 1):
+        click.echo(f"{index:2d}. {repo['full_name']} score {repo['score']:.2f} ⭐{repo['stars']}")
+    with MetadataWriter(metadata_file, metadata_format, _metadata_columns(enrich, scored=True)) as writer:
+        writer.write(ranked)
+    return selected
+
+def _run_code_search(fetcher, query, language, max_results, metadata_file, metadata_format,
+                     download_dir, search_only, jobs) -> None:
+    """Search code, write the file metadata and download the matching files."""
+    click.echo("Searching code...")
+    files = fetcher.search_code(query, language=language, max_results=max_results)
+    if not files:
+        click.echo("No files found matching your criteria.")
+        return
+    
+    for index, file in enumerate(files, 1):
+        click.echo(f"{index:2d}. {file['repository']}: {file['path']}")
+    with MetadataWriter(metadata_file, metadata_format, CODE_COLUMNS) as writer:
+        writer.write(files)
+    click.echo(f"\nFound {len(files)} files")
+    click.echo(f"Metadata saved to {metadata_file}")
+    if search_only:
+        return
+    
+    click.echo(f"\nDownloading files to '{download_dir}'...")
+    results = fetcher.download_code_files(files, download_dir, jobs=jobs)
+    failed = [name for name, ok in results.items() if not ok]
+    click.echo("\nDownload completed!")
+    click.echo(f"Successfully downloaded: {len(results) - len(failed)}/{len(results)} files")
+    if failed:
+        click.echo(f"Failed: {', '.join(failed)}")
+    click.echo(f"Download directory: {download_dir}")
+
+def _fetcher_options(f):
+    """Options for building the shared GitHubCodeFetcher, used by every command."""
+    options = [
+        click.option('--token', help='GitHub personal access token'),
+        click.option('--search-concurrency', default=4, type=click.IntRange(min=1),
+                     help='Number of search result pages to fetch in parallel'),
+        click.option('--cache-dir', default='.cache', help='Directory for the API response cache'),
+        click.option('--cache-ttl', default=3600, type=click.IntRange(min=0),
+                     help='Seconds a cached search response is used without revalidation'),
+        click.option('--no-cache', is_flag=True, help='Disable the API response cache'),
+        click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE // 1024, type=click.IntRange(min=1),
+                     help='Archive download read size in KiB'),
+        click.option('--pool-size', default=DEFAULT_POOL_SIZE, type=click.IntRange(min=1),
+                     help='Keep-alive connections kept open per host'),
+        click.option('--stats-file', help='Write a JSON timing and transfer summary to this file'),
+        click.option('--prometheus-file', help='Write run metrics in Prometheus text format to this file'),
+        click.option('--index-file', default=DEFAULT_INDEX_FILE, help='Local SQLite index of harvested metadata'),
+        click.option('--no-index', is_flag=True, help='Do not record search results in the local index'),
+        click.option('--mirror-cache', is_flag=True,
+                     help='Keep bare mirrors under <cache-dir>/mirrors and clone with --reference to them'),
+        click.option('--mirror-cache-size', type=_SizeType(), default='10GB',
+                     help='Evict least recently used mirrors beyond this total size'),
+        click.option('--mirror-refresh', default=3600, type=click.IntRange(min=0),
+                     help='Seconds before a mirrored repository is fetched again'),
+        click.option('--no-dissociate', is_flag=True,
+                     help='Let clones keep borrowing objects from the mirrors (disables eviction)'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+def _download_options(f):
+    """Options controlling metadata output and downloads."""
+    options = [
+        click.option('--download-dir', '-d', default='downloaded_repos', help='Download directory'),
+        click.option('--method', '-m',
+                     type=click.Choice(['clone', 'zip', 'tarball']),
+                     default='clone',
+                     help='Download method'),
+        click.option('--metadata-file', default='repository_metadata.csv', help='Metadata CSV filename'),
+        click.option('--metadata-format', type=click.Choice(MetadataWriter.FORMATS),
+                     help='Metadata output format (default: from the file extension)'),
+        click.option('--search-only', is_flag=True, help='Only search, do not download'),
+        click.option('--jobs', '-j', default=1, type=click.IntRange(min=1), help='Number of parallel downloads'),
+        click.option('--sync', is_flag=True, help='Update existing downloads instead of skipping them'),
+        click.option('--depth', type=click.IntRange(min=1), help='Shallow clone with this many commits of history'),
+        click.option('--single-branch', is_flag=True, help='Clone only the default branch'),
+        click.option('--filter', 'blob_filter', help='Partial clone filter, e.g. blob:none'),
+        click.option('--sparse', 'sparse_paths', multiple=True,
+                     help='Sparse checkout pattern, e.g. "*.py" or "src/" (repeatable)'),
+        click.option('--max-repo-size', type=_SizeType(), help='Skip repositories larger than this, e.g. 500MB'),
+        click.option('--total-budget', type=_SizeType(), help='Maximum total download size, e.g. 20GB'),
+        click.option('--bandwidth', type=_SizeType(), default='10MB',
+                     help='Expected download speed per second, used for the time estimate'),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+def _make_fetcher(token, cache_dir, cache_ttl, no_cache, chunk_size, stats_file=None, prometheus_file=None,
+                  index_file=None, no_index=False, mirror_cache=False, mirror_cache_size=None,
+                  mirror_refresh=3600, no_dissociate=False, pool_size=DEFAULT_POOL_SIZE) -> GitHubCodeFetcher:
+    """Build a fetcher from the shared command-line options.
+    
+    The timing report is printed, and the telemetry files written, when the
+    current command finishes, however it returns.
+    """
+    cache = None if no_cache else ResponseCache(str(Path(cache_dir) / "http_cache.sqlite"), ttl=cache_ttl)
+    index = None if no_index or not index_file else MetadataIndex(index_file)
+    mirrors = None
+    if mirror_cache:
+        mirrors = MirrorCache(
+            str(Path(cache_dir) / "mirrors"), max_size=mirror_cache_size, refresh_interval=mirror_refresh,
+            dissociate=not no_dissociate
+        )
+    fetcher = GitHubCodeFetcher(
+        token=token, cache=cache, chunk_size=chunk_size * 1024, index=index, mirrors=mirrors, pool_size=pool_size
+    )
+    
+    def report():
+        fetcher.telemetry.set_connections(fetcher.connection_stats())
+        _report_telemetry(fetcher.telemetry, stats_file, prometheus_file)
+    
+    click.get_current_context().call_on_close(report)
+    return fetcher
+
+def _report_telemetry(telemetry: Telemetry, stats_file: Optional[str], prometheus_file: Optional[str]) -> None:
+    """Print the per-phase timing report and write the requested telemetry files."""
+    summary = telemetry.summary()
+    phases = ', '.join(f"{name} {stats['seconds']:.1f}s" for name, stats in summary['phases'].items())
+    requests_sent = sum(stats['count'] for stats in summary['requests'].values())
+    waited = sum(stats['wait_seconds'] for stats in summary['requests'].values())
+    connections = sum(host['connections'] for host in summary['connections'].values())
+    click.echo(f"\nTiming: {phases or 'nothing timed'} "
+               f"({requests_sent} requests over {connections} connections, "
+               f"{waited:.1f}s waiting on rate limits, {summary['duration']:.1f}s total)")
+    
+    if stats_file:
+        telemetry.write_json(stats_file)
+        click.echo(f"Run statistics saved to {stats_file}")
+    if prometheus_file:
+        telemetry.write_prometheus(prometheus_file)
+        click.echo(f"Prometheus metrics saved to {prometheus_file}")
+
+def _plan_and_report(repositories, download_dir, max_repo_size, total_budget, bandwidth, manifest=None):
+    """Apply the size planner, print the projection and record skipped repositories."""
+    plan = plan_downloads(repositories, download_dir, max_repo_size, total_budget)
+    
+    for repo, reason in plan['skipped']:
+        click.echo(f"Skipping {repo['full_name']} ({format_size((repo.get('size') or 0) * 1024)}): {reason}")
+        if manifest is not None:
+            manifest.record(repo['full_name'], JobManifest.SKIPPED, reason=reason)
+    
+    estimate = plan['total_bytes'] / bandwidth if bandwidth else 0
+    click.echo(f"Download plan: {len(plan['selected'])} repositories, ~{format_size(plan['total_bytes'])}, "
+               f"~{estimate:.0f}s at {format_size(bandwidth)}/s"
+               + (f" ({format_size(plan['free_bytes'])} free)" if plan['free_bytes'] is not None else ""))
+    return plan['selected']
 
-@click.command()
-@click.option('--query', '-q', required=True, help='Search query for repositories')
+def _make_clone_options(depth, single_branch, blob_filter, sparse_paths) -> Dict:
+    """Build the clone_options dict from command-line options."""
+    return {
+        'depth': depth,
+        'single_branch': single_branch,
+        'blob_filter': blob_filter,
+        'sparse_paths': list(sparse_paths)
+    }
+
+@click.group(invoke_without_command=True)
+@click.option('--query', '-q', help='Search query for repositories')
 @click.option('--max-results', '-n', default=10, help='Maximum number of repositories to fetch')
 @click.option('--sort', '-s', 
               type=click.Choice(['stars', 'updated', 'best-match']), 
@@ -315,18 +3483,37 @@ class GitHubCodeFetcher:
               help='Sort order')
 @click.option('--language', '-l', help='Filter by programming language')
 @click.option('--min-stars', default=0, help='Minimum star count')
-@click.option('--download-dir', '-d', default='downloaded_repos', help='Download directory')
-@click.option('--method', '-m', 
-              type=click.Choice(['clone', 'zip']), 
-              default='clone', 
-              help='Download method')
-@click.option('--metadata-file', default='repository_metadata.csv', help='Metadata CSV filename')
-@click.option('--token', help='GitHub personal access token')
-@click.option('--search-only', is_flag=True, help='Only search, do not download')
-def main(query, max_results, sort, order, language, min_stars, download_dir, 
-         method, metadata_file, token, search_only):
+@_download_options
+@_fetcher_options
+@click.option('--resume', is_flag=True, help='Resume the previous run for this query from its job manifest')
+@click.option('--enrich', is_flag=True, help='Add commit, language and release metadata via GraphQL (needs a token)')
+@click.option('--offline', is_flag=True, help='Answer the search from the local metadata index instead of the API')
+@click.option('--code-search', is_flag=True, help='Search code and download only the matching files (needs a token)')
+@click.option('--rank', 'rank_weights', help='Rank results by weighted factors, e.g. "stars=1,forks=0.5,recency=1,size=-0.1"')
+@click.option('--top-k', type=click.IntRange(min=1), help='Rank the results and download only the best K')
+@click.option('--exclude-archived', is_flag=True, help='Rank the results, dropping archived repositories')
+@click.option('--license', 'licenses', multiple=True, help='Rank the results, keeping only this license name (repeatable)')
+@click.option('--recency-half-life', default=365.0, type=click.FloatRange(min=0, min_open=True),
+              help='Days after which the ranking recency factor halves')
+@click.pass_context
+def main(ctx, query, max_results, sort, order, language, min_stars, download_dir, 
+         method, metadata_file, metadata_format, search_only, jobs, sync, depth, single_branch,
+         blob_filter, sparse_paths, max_repo_size, total_budget, bandwidth, token, search_concurrency,
+         cache_dir, cache_ttl, no_cache, chunk_size, stats_file, prometheus_file, index_file, no_index,
+         mirror_cache, mirror_cache_size, mirror_refresh, no_dissociate, pool_size, resume, enrich, offline,
+         code_search, rank_weights, top_k, exclude_archived, licenses, recency_half_life):
     """GitHub Code Fetcher - Search and download GitHub repositories by topic."""
     
+    if ctx.invoked_subcommand is not None:
+        return
+    if not query:
+        raise click.UsageError("Missing option '--query' / '-q'.")
+    rank = rank_weights is not None or top_k is not None or exclude_archived or bool(licenses)
+    try:
+        weights = parse_rank_weights(rank_weights or '')
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="'--rank'")
+    
     click.echo(f"GitHub Code Fetcher")
     click.echo(f"==================")
     click.echo(f"Query: {query}")
@@ -339,28 +3526,11 @@ def main(query, max_results, sort, order, language, min_stars, download_dir,
     click.echo()
     
     # Initialize fetcher
-    fetcher = GitHubCodeFetcher(token=token)
-    
-    # Search repositories
-    click.echo("Searching repositories...")
-    repositories = fetcher.search_repositories(
-        query=query,
-        sort=sort,
-        order=order,
-        language=language,
-        min_stars=min_stars,
-        max_results=max_results
+    fetcher = _make_fetcher(
+        token, cache_dir, cache_ttl, no_cache, chunk_size, stats_file, prometheus_file, index_file, no_index,
+        mirror_cache, mirror_cache_size, mirror_refresh, no_dissociate, pool_size
     )
     
-    if not repositories:
-        click.echo("No repositories found matching your criteria.")
-        return
-    
-    click.echo(f"\nFound {len(repositories)} repositories:")
-    for i, repo in enumerate(repositories, 1):
-        click.echo(f"{i:2d}. {repo['full_name']} ⭐{repo['stars']} ({repo['language']})")
-        click.echo(f"    {repo['description'][:80]}..." if len(repo['description']) > 80 else f"    {repo['description']}")
-    
     # Create topic-based folder name
     topic_folder = sanitize_folder_name(query, language, min_stars)
     topic_download_dir = Path(download_dir) / topic_folder
@@ -370,27 +3540,273 @@ def main(query, max_results, sort, order, language, min_stars, download_dir,
     metadata_dir.mkdir(exist_ok=True)
     topic_metadata_file = metadata_dir / f"{topic_folder}_{metadata_file}"
     
-    # Save metadata
-    fetcher.save_metadata(repositories, str(topic_metadata_file))
-    
-    if search_only:
-        click.echo(f"\nSearch completed. Metadata saved to '{topic_metadata_file}'")
-        click.echo("Use --search-only=false to download repositories.")
+    if code_search:
+        _run_code_search(
+            fetcher, query, language, max_results, str(topic_metadata_file), metadata_format,
+            str(topic_download_dir), search_only, jobs
+        )
         return
     
+    manifest = JobManifest(str(Path(download_dir) / f"{topic_folder}{MANIFEST_SUFFIX}"))
+    
+    if resume and manifest.entries and not search_only:
+        # Pick up the previous job without searching again
+        repositories = manifest.repositories(exclude_states=[JobManifest.DONE])
+        remove_partial_downloads(str(topic_download_dir))
+        click.echo(f"Resuming from '{manifest.path}': "
+                   f"{len(repositories)} of {len(manifest.entries)} repositories left")
+    else:
+        if offline:
+            if fetcher.index is None:
+                raise click.UsageError("--offline needs the local metadata index (drop --no-index).")
+            click.echo(f"Searching local index '{index_file}'...")
+            found, repositories = _search_local(
+                fetcher.index, None if rank else str(topic_metadata_file), metadata_format,
+                text=query, language=language, min_stars=min_stars, sort=sort, order=order, limit=max_results
+            )
+        else:
+            click.echo("Searching repositories...")
+            found, repositories = _search_and_save(
+                fetcher, None if rank else str(topic_metadata_file), metadata_format,
+                keep_results=rank or not search_only, enrich=enrich,
+                query=query, sort=sort, order=order, language=language, min_stars=min_stars,
+                max_results=max_results, concurrency=search_concurrency
+            )
+        
+        if not found:
+            click.echo("No repositories found matching your criteria.")
+            return
+        
+        click.echo(f"\nFound {found} repositories")
+        if rank:
+            with fetcher.telemetry.phase('rank'):
+                repositories = _rank_and_save(
+                    repositories, str(topic_metadata_file), metadata_format, enrich, weights, top_k,
+                    exclude_archived, licenses, recency_half_life
+                )
+            if not repositories:
+                click.echo("No repositories left after the ranking filters.")
+                return
+        click.echo(f"Metadata saved to {topic_metadata_file}")
+        
+        if search_only:
+            click.echo(f"\nSearch completed. Metadata saved to '{topic_metadata_file}'")
+            click.echo("Use --search-only=false to download repositories.")
+            return
+        
+        manifest.start(repositories)
+    
+    # Check sizes against the limits before fetching anything
+    repositories = _plan_and_report(
+        repositories, str(topic_download_dir), max_repo_size, total_budget, bandwidth, manifest
+    )
+    
     # Download repositories
     click.echo(f"\nDownloading repositories to '{topic_download_dir}'...")
-    success_count = 0
-    
-    for repo in tqdm(repositories, desc="Downloading repositories"):
-        if fetcher.download_repository(repo, str(topic_download_dir), method):
-            success_count += 1
+    clone_options = _make_clone_options(depth, single_branch, blob_filter, sparse_paths)
+    results = fetcher.download_repositories(
+        repositories, str(topic_download_dir), method, jobs=jobs, sync=sync,
+        clone_options=clone_options, manifest=manifest
+    )
+    success_count = sum(1 for ok in results.values() if ok)
+    failed = [name for name, ok in results.items() if not ok]
     
     click.echo(f"\nDownload completed!")
     click.echo(f"Successfully downloaded: {success_count}/{len(repositories)} repositories")
+    if failed:
+        click.echo(f"Failed: {', '.join(failed)}")
     click.echo(f"Download directory: {topic_download_dir}")
     click.echo(f"Metadata file: {topic_metadata_file}")
+    click.echo(f"Job manifest: {manifest.path}")
     click.echo(f"Topic folder: {topic_folder}")
 
+@main.command()
+@click.argument('batch_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--link', 'link_mode', type=click.Choice(['symlink', 'hardlink']), default='symlink',
+              help='How topic folders reference the shared content store')
+@click.option('--enrich', is_flag=True, help='Add commit, language and release metadata via GraphQL (needs a token)')
+@_download_options
+@_fetcher_options
+def batch(batch_file, link_mode, enrich, download_dir, method, metadata_file, metadata_format, search_only,
+          jobs, sync, depth, single_branch, blob_filter, sparse_paths, max_repo_size, total_budget,
+          bandwidth, token, search_concurrency, cache_dir, cache_ttl, no_cache, chunk_size,
+          stats_file, prometheus_file, index_file, no_index, mirror_cache, mirror_cache_size, mirror_refresh,
+          no_dissociate, pool_size):
+    """Run many queries from a YAML/JSON file through one shared fetcher.
+    
+    Each repository is downloaded once into a shared content store and then
+    linked into the topic folder of every query that matched it.
+    """
+    try:
+        queries = load_batch_file(batch_file)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    
+    fetcher = _make_fetcher(
+        token, cache_dir, cache_ttl, no_cache, chunk_size, stats_file, prometheus_file, index_file, no_index,
+        mirror_cache, mirror_cache_size, mirror_refresh, no_dissociate, pool_size
+    )
+    metadata_dir = Path("metadata")
+    metadata_dir.mkdir(exist_ok=True)
+    
+    unique = {}
+    topics = {}
+    for spec in queries:
+        topic_folder = sanitize_folder_name(spec['query'], spec.get('language'), spec.get('min_stars', 0))
+        topic_metadata_file = metadata_dir / f"{topic_folder}_{metadata_file}"
+        
+        click.echo(f"\nQuery: {spec['query']}")
+        found, repositories = _search_and_save(
+            fetcher, str(topic_metadata_file), metadata_format, keep_results=not search_only, enrich=enrich,
+            concurrency=search_concurrency, **spec
+        )
+        click.echo(f"Found {found} repositories, metadata saved to {topic_metadata_file}")
+        
+        topics[topic_folder] = [repo['full_name'] for repo in repositories]
+        for repo in repositories:
+            unique.setdefault(repo['full_name'], repo)
+    
+    if search_only:
+        return
+    
+    matched = sum(len(names) for names in topics.values())
+    store_dir = Path(download_dir) / STORE_DIR
+    click.echo(f"\nDownloading {len(unique)} unique repositories ({matched} matches) to '{store_dir}'...")
+    
+    manifest = JobManifest(str(Path(download_dir) / f"{STORE_DIR}{MANIFEST_SUFFIX}"))
+    manifest.start(list(unique.values()))
+    repositories = _plan_and_report(
+        list(unique.values()), str(store_dir), max_repo_size, total_budget, bandwidth, manifest
+    )
+    results = fetcher.download_repositories(
+        repositories, str(store_dir), method, jobs=jobs, sync=sync,
+        clone_options=_make_clone_options(depth, single_branch, blob_filter, sparse_paths),
+        manifest=manifest
+    )
+    
+    for topic_folder, names in topics.items():
+        for full_name in names:
+            if results.get(full_name):
+                repo_name = full_name.replace('/', '_')
+                link_repository(store_dir / repo_name, Path(download_dir) / topic_folder / repo_name, link_mode)
+    
+    failed = [name for name, ok in results.items() if not ok]
+    click.echo("\nBatch completed!")
+    click.echo(f"Successfully downloaded: {len(results) - len(failed)}/{len(results)} repositories")
+    if failed:
+        click.echo(f"Failed: {', '.join(failed)}")
+    click.echo(f"Topic folders: {', '.join(topics)}")
+
+@main.command()
+@click.option('--cache-dir', default='.cache', help='Directory holding the mirrors/ cache')
+@click.option('--refresh', is_flag=True, help='Fetch every mirrored repository now')
+@click.option('--evict', is_flag=True, help='Evict least recently used mirrors beyond --max-size')
+@click.option('--max-size', type=_SizeType(), default='10GB', help='Size limit for --evict')
+def mirrors(cache_dir, refresh, evict, max_size):
+    """List, refresh (e.g. from cron) or evict the bare mirror cache."""
+    cache = MirrorCache(str(Path(cache_dir) / "mirrors"), max_size=max_size)
+    if refresh:
+        click.echo(f"Refreshed {cache.refresh()} mirrors")
+    if evict:
+        for name in cache.evict():
+            click.echo(f"Evicted mirror {name}")
+    
+    stats = cache.stats()
+    for mirror in stats:
+        click.echo(f"{mirror['name']}  {format_size(mirror['size'])}  last used {mirror['used'] or 'never'}  "
+                   f"({', '.join(mirror['repositories'])})")
+    click.echo(f"{len(stats)} mirrors, {format_size(sum(mirror['size'] for mirror in stats))} in '{cache.root}'")
+
+@main.command()
+@click.argument('sources', nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option('--output', '-o', default='corpus', help='Directory for the shards, their indexes and manifest.json')
+@click.option('--format', 'shard_format', type=click.Choice(CORPUS_FORMATS), default='jsonl.gz',
+              help='Shard format (tar.zst needs zstandard)')
+@click.option('--ext', 'extensions', multiple=True, help='Only package files with this extension, e.g. .py (repeatable)')
+@click.option('--max-file-size', type=_SizeType(), default='1MB', help='Skip files larger than this')
+@click.option('--shard-size', type=_SizeType(), default='256MB', help='Uncompressed bytes per shard')
+@click.option('--level', type=click.IntRange(min=1, max=22), help='Compression level (default: 6 for gzip, 3 for zstd)')
+@click.option('--workers', type=click.IntRange(min=1), help='Worker processes (default: one per CPU)')
+def package(sources, output, shard_format, extensions, max_file_size, shard_size, level, workers):
+    """Pack downloaded topic folders into compressed, deduplicated corpus shards."""
+    if shard_format == 'jsonl.gz' and level is not None and level > 9:
+        raise click.BadParameter("gzip levels go up to 9", param_hint="'--level'")
+    try:
+        manifest = package_corpus(
+            sources, output, extensions, max_file_size, shard_size, shard_format, level=level, workers=workers
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    
+    click.echo(f"Packaged {manifest['unique_files']} unique of {manifest['files']} files from "
+               f"{manifest['repositories']} repositories ({manifest['skipped_files']} skipped) into "
+               f"{len(manifest['shards'])} shards: {format_size(manifest['bytes'])} -> "
+               f"{format_size(manifest['compressed_bytes'])}")
+    click.echo(f"Corpus manifest: {Path(output) / 'manifest.json'}")
+
+@main.command('query-local')
+@click.argument('text', required=False)
+@click.option('--language', '-l', help='Filter by programming language')
+@click.option('--min-stars', default=0, help='Minimum star count')
+@click.option('--updated-since', help='Only repositories updated on or after this date (YYYY-MM-DD)')
+@click.option('--sort', '-s', type=click.Choice(['stars', 'updated', 'best-match']), default='stars',
+              help='Sort repositories by')
+@click.option('--order', '-o', type=click.Choice(['asc', 'desc']), default='desc', help='Sort order')
+@click.option('--max-results', '-n', default=10, help='Maximum number of repositories to show')
+@click.option('--index-file', default=DEFAULT_INDEX_FILE, help='Local SQLite index of harvested metadata')
+@click.option('--metadata-file', help='Also write the matches to this CSV or JSON Lines file')
+@click.option('--metadata-format', type=click.Choice(MetadataWriter.FORMATS),
+              help='Metadata output format (default: from the file extension)')
+def query_local(text, language, min_stars, updated_since, sort, order, max_results, index_file,
+                metadata_file, metadata_format):
+    """Search previously harvested metadata offline, without any API calls."""
+    if not Path(index_file).exists():
+        raise click.ClickException(f"No metadata index at '{index_file}' yet, run a search first.")
+    
+    index = MetadataIndex(index_file)
+    start = time.monotonic()
+    found, _ = _search_local(
+        index, metadata_file, metadata_format, text=text, language=language, min_stars=min_stars,
+        updated_since=updated_since, sort=sort, order=order, limit=max_results
+    )
+    elapsed = time.monotonic() - start
+    
+    click.echo(f"\n{found} of {index.count()} indexed repositories shown ({elapsed * 1000:.1f} ms)")
+    if metadata_file and found:
+        click.echo(f"Metadata saved to {metadata_file}")
+    index.close()
+
+
+@main.command()
+@click.option('--host', default='127.0.0.1', help='Interface to listen on')
+@click.option('--port', default=8765, help='TCP port to listen on')
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False), help='Listen on this Unix socket instead of TCP')
+@click.option('--workers', default=2, help='Number of jobs run at the same time')
+@click.option('--download-dir', '-d', default='downloaded_repos', help='Base directory for download jobs')
+@_fetcher_options
+def serve(host, port, socket_path, workers, download_dir, token, search_concurrency, cache_dir, cache_ttl,
+          no_cache, chunk_size, stats_file, prometheus_file, index_file, no_index, mirror_cache,
+          mirror_cache_size, mirror_refresh, no_dissociate, pool_size):
+    """Keep one fetcher resident and run search/download jobs submitted over a local HTTP API."""
+    fetcher = _make_fetcher(
+        token, cache_dir, cache_ttl, no_cache, chunk_size, stats_file, prometheus_file, index_file, no_index,
+        mirror_cache, mirror_cache_size, mirror_refresh, no_dissociate, pool_size
+    )
+    queue = JobQueue(fetcher, workers=workers, download_dir=download_dir, search_concurrency=search_concurrency)
+    server = make_job_server(queue, host, port, socket_path)
+    
+    address = socket_path or "http://{}:{}".format(*server.server_address[:2])
+    click.echo(f"Serving jobs on {address} with {workers} workers (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        click.echo("\nShutting down, waiting for running jobs...")
+    finally:
+        server.server_close()
+        queue.shutdown()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
 if __name__ == "__main__":
     main()
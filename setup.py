@@ -39,6 +39,10 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=requirements,
+    extras_require={
+        "rank": ["numpy>=1.20"],
+        "zst": ["zstandard>=0.21"],
+    },
     entry_points={
         "console_scripts": [
             "github-code-fetcher=github_code_fetcher:main",
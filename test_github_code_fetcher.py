@@ -11,10 +11,32 @@ import unittest
 from unittest.mock import patch, MagicMock
 import tempfile
 import os
+import sys
+import subprocess
+import io
+import importlib.util
+import re
+import csv
+import gzip
+import json
+import math
+import tarfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 # Import the main class
-from github_code_fetcher import GitHubCodeFetcher, sanitize_folder_name
+from click.testing import CliRunner
+from benchmark import MockGitHub, build_archives, run_benchmarks
+
+from github_code_fetcher import (
+    GitHubCodeFetcher, JobManifest, JobQueue, MetadataIndex, MetadataWriter, MirrorCache, RequestScheduler, ResponseCache,
+    Telemetry, TokenBucket,
+    git_blob_sha, load_batch_file, main, make_job_server, package_corpus, parse_code_result, parse_rank_weights,
+    parse_size, plan_downloads, rank_repositories, remove_partial_downloads, sanitize_folder_name
+)
 
 
 class TestSanitizeFolderName(unittest.TestCase):
@@ -80,6 +102,1473 @@ class TestGitHubCodeFetcher(unittest.TestCase):
         folder_name = sanitize_folder_name(query)
         self.assertIsInstance(folder_name, str)
         self.assertGreater(len(folder_name), 0)
+    
+    def test_download_repositories_parallel(self):
+        """Test parallel downloads keep per-repository results in input order."""
+        repos = [{'full_name': f"owner/repo{i}"} for i in range(6)]
+        
+        def fake_download(repo_data, download_dir, method, show_progress=True, sync=False, clone_options=None):
+            return repo_data['full_name'] != "owner/repo3"
+        
+        with patch.object(self.fetcher, 'download_repository', side_effect=fake_download):
+            results = self.fetcher.download_repositories(repos, "unused", "zip", jobs=3)
+        
+        self.assertEqual(list(results), [repo['full_name'] for repo in repos])
+        self.assertFalse(results["owner/repo3"])
+        self.assertEqual(sum(results.values()), 5)
+    
+    def test_search_repositories_concurrent_keeps_order(self):
+        """Test that concurrently fetched search pages are merged in page order."""
+        def make_repo(i):
+            return {
+                'name': f"repo{i}", 'full_name': f"owner/repo{i}", 'html_url': '',
+                'clone_url': '', 'stargazers_count': 1000 - i, 'forks_count': 0,
+                'size': 1, 'created_at': '', 'updated_at': ''
+            }
+        
+        def fake_page(params, page):
+            start = (page - 1) * params['per_page']
+            return {'total_count': 95, 'items': [make_repo(i) for i in range(start, min(start + params['per_page'], 95))]}
+        
+        with patch.object(self.fetcher, '_fetch_search_page', side_effect=fake_page) as mock_page:
+            results = self.fetcher.search_repositories("test", max_results=70, per_page=20, concurrency=3)
+        
+        self.assertEqual([repo['name'] for repo in results], [f"repo{i}" for i in range(70)])
+        self.assertEqual(mock_page.call_count, 4)
+
+
+
+def make_origin_repo(path, files):
+    """Create a local git repository with one commit containing ``files``."""
+    import git
+    origin = git.Repo.init(path, initial_branch="main")
+    with origin.config_writer() as config:
+        config.set_value("user", "name", "Test")
+        config.set_value("user", "email", "test@example.com")
+    for name, content in files.items():
+        Path(origin.working_dir, name).parent.mkdir(parents=True, exist_ok=True)
+        Path(origin.working_dir, name).write_text(content)
+    origin.index.add(list(files))
+    origin.index.commit("initial")
+    return origin
+
+
+class TestCloneOptions(unittest.TestCase):
+    """Test shallow, partial and sparse clones."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fetcher = GitHubCodeFetcher()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_shallow_sparse_clone(self):
+        """Test that sparse patterns limit the checkout and depth limits history."""
+        origin = make_origin_repo(
+            Path(self.tmpdir.name) / "origin",
+            {"main.py": "print()", "src/lib.c": "", "docs/guide.md": ""}
+        )
+        repo = {
+            'name': 'repo', 'full_name': 'owner/repo', 'default_branch': 'main',
+            'clone_url': Path(origin.working_dir).as_uri()
+        }
+        options = {'depth': 1, 'single_branch': True, 'sparse_paths': ['*.py', 'src/']}
+        download_dir = Path(self.tmpdir.name) / "repos"
+        
+        self.assertTrue(self.fetcher.download_repository(repo, str(download_dir), "clone", clone_options=options))
+        
+        clone_path = download_dir / "owner_repo"
+        self.assertTrue((clone_path / "main.py").exists())
+        self.assertTrue((clone_path / "src" / "lib.c").exists())
+        self.assertFalse((clone_path / "docs").exists())
+        self.assertTrue((clone_path / ".git" / "shallow").exists())
+
+
+class TestMirrorCache(unittest.TestCase):
+    """Test the bare mirror reference cache for clones."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        origin = make_origin_repo(self.root / "origin", {"main.py": "print()", "lib/util.py": "x = 1"})
+        self.repo = {
+            'name': 'repo', 'full_name': 'owner/repo', 'default_branch': 'main',
+            'clone_url': Path(origin.working_dir).as_uri()
+        }
+        self.mirror_root = str(self.root / "mirrors")
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_clone_through_mirror_shares_fork_network(self):
+        """Test that clones use one mirror per fork network and dissociate from it."""
+        fetcher = GitHubCodeFetcher(mirrors=MirrorCache(self.mirror_root))
+        fork = dict(self.repo, full_name='someone/repo', fork=True)
+        download_dir = self.root / "repos"
+        
+        with patch.object(fetcher, '_get_json', return_value={'source': {'full_name': 'owner/repo'}}):
+            results = fetcher.download_repositories([self.repo, fork], str(download_dir), "clone")
+        
+        self.assertEqual(list(results.values()), [True, True])
+        self.assertTrue((download_dir / "someone_repo" / "lib" / "util.py").exists())
+        self.assertFalse((download_dir / "owner_repo" / ".git" / "objects" / "info" / "alternates").exists())
+        stats = fetcher.mirrors.stats()
+        self.assertEqual([mirror['name'] for mirror in stats], ["owner_repo.git"])
+        self.assertEqual(stats[0]['repositories'], ["owner_repo", "someone_repo"])
+    
+    def test_no_dissociate_keeps_alternates(self):
+        """Test that without --dissociate the clone borrows objects from the mirror."""
+        fetcher = GitHubCodeFetcher(mirrors=MirrorCache(self.mirror_root, dissociate=False))
+        self.assertTrue(fetcher.download_repository(self.repo, str(self.root / "repos"), "clone"))
+        alternates = self.root / "repos" / "owner_repo" / ".git" / "objects" / "info" / "alternates"
+        self.assertIn("owner_repo.git", alternates.read_text())
+    
+    def test_shallow_partial_clones_skip_the_mirror(self):
+        """Test that --depth/--filter/--sparse clones do not fill a full mirror first."""
+        fetcher = GitHubCodeFetcher(mirrors=MirrorCache(self.mirror_root))
+        options = {'depth': 1, 'blob_filter': 'blob:none', 'sparse_paths': ['*.py'], 'single_branch': False}
+        
+        with patch.object(fetcher.mirrors, 'prepare', side_effect=AssertionError("mirror fetched")):
+            self.assertTrue(fetcher.download_repository(
+                self.repo, str(self.root / "repos"), "clone", clone_options=options
+            ))
+        self.assertTrue((self.root / "repos" / "owner_repo" / "main.py").exists())
+        self.assertEqual(fetcher.mirrors.stats(), [])
+    
+    def test_refresh_interval(self):
+        """Test that a recently fetched mirror is not fetched again."""
+        cache = MirrorCache(self.mirror_root, refresh_interval=3600)
+        path = cache.prepare(self.repo)
+        fetched = cache._read_state(path)['fetched']['owner_repo']
+        cache.prepare(self.repo)
+        self.assertEqual(cache._read_state(path)['fetched']['owner_repo'], fetched)
+        
+        cache.refresh_interval = 0
+        cache.prepare(self.repo)
+        self.assertGreater(cache._read_state(path)['fetched']['owner_repo'], fetched)
+    
+    def test_evicts_least_recently_used(self):
+        """Test that eviction removes the oldest mirrors until the cache fits."""
+        cache = MirrorCache(self.mirror_root)
+        old = cache.prepare(dict(self.repo, full_name='old/repo'))
+        new = cache.prepare(self.repo)
+        state = cache._read_state(old)
+        state['used'] -= 100
+        cache._write_state(old, state)
+        
+        cache.max_size = sum(mirror['size'] for mirror in cache.stats()) - 1
+        self.assertEqual(cache.evict(), ["old_repo.git"])
+        self.assertFalse(old.exists())
+        self.assertTrue(new.exists())
+    
+    def test_eviction_skips_mirrors_in_use(self):
+        """Test that a mirror borrowed by a running clone, or locked by a fetch, is not evicted."""
+        cache = MirrorCache(self.mirror_root, max_size=0)
+        with cache.borrow(self.repo) as path:
+            self.assertEqual(cache.evict(), [])
+            self.assertTrue(path.exists())
+        
+        with cache._locks[str(path)]:
+            self.assertEqual(cache.evict(), [])
+        self.assertEqual(cache.evict(), ["owner_repo.git"])
+        self.assertFalse(path.exists())
+
+
+class TestArchiveDownloads(unittest.TestCase):
+    """Test streaming ZIP and tarball extraction."""
+    
+    FILES = {"repo-main/README.md": b"hello", "repo-main/src/app.py": b"print()"}
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fetcher = GitHubCodeFetcher(chunk_size=4)
+        self.repo = {'name': 'repo', 'full_name': 'owner/repo', 'default_branch': 'main'}
+        self.repo_path = Path(self.tmpdir.name) / "owner_repo"
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    @staticmethod
+    def make_response(payload):
+        response = MagicMock(headers={'content-length': str(len(payload))})
+        response.raw = io.BytesIO(payload)
+        response.iter_content = lambda chunk_size: iter(
+            [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+        )
+        return response
+    
+    def assert_extracted(self):
+        self.assertEqual((self.repo_path / "README.md").read_bytes(), b"hello")
+        self.assertEqual((self.repo_path / "src" / "app.py").read_bytes(), b"print()")
+        self.assertEqual(os.listdir(self.tmpdir.name), ["owner_repo"])
+    
+    def test_zip_strips_prefix(self):
+        """Test that ZIP entries are extracted without the name-branch prefix or a temp file."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr("repo-main/", b"")
+            for name, data in self.FILES.items():
+                archive.writestr(name, data)
+            archive.writestr("repo-main/../../evil.txt", b"x")
+        
+        with patch.object(self.fetcher, '_request', return_value=self.make_response(buffer.getvalue())):
+            self.assertTrue(self.fetcher._download_zip(self.repo, self.repo_path, show_progress=False))
+        self.assert_extracted()
+    
+    def test_large_zip_is_spooled_to_a_temporary_file(self):
+        """Test that a ZIP larger than spool_size moves from memory to a seekable temporary file."""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, data in self.FILES.items():
+                archive.writestr(name, data)
+        self.fetcher.spool_size = 16
+        self.fetcher.chunk_size = 8
+        
+        with patch.object(self.fetcher, '_request', return_value=self.make_response(buffer.getvalue())), \
+                patch('tempfile.TemporaryFile', wraps=tempfile.TemporaryFile) as temporary_file:
+            self.assertTrue(self.fetcher._download_zip(self.repo, self.repo_path, show_progress=False))
+        temporary_file.assert_called_once()
+        self.assert_extracted()
+    
+    def test_tarball_streams_and_strips_prefix(self):
+        """Test that tarball entries are extracted from the stream without the prefix."""
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for name, data in self.FILES.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        
+        with patch.object(self.fetcher, '_request', return_value=self.make_response(buffer.getvalue())):
+            self.assertTrue(self.fetcher._download_tarball(self.repo, self.repo_path, show_progress=False))
+        self.assert_extracted()
+
+
+class TestSync(unittest.TestCase):
+    """Test incremental sync of existing downloads."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.download_dir = Path(self.tmpdir.name) / "repos"
+        self.fetcher = GitHubCodeFetcher()
+        self.repo = {
+            'name': 'repo', 'full_name': 'owner/repo', 'default_branch': 'main',
+            'pushed_at': '2024-01-01T00:00:00Z', 'clone_url': ''
+        }
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def fake_zip(self, content):
+        def download(repo_data, repo_path, show_progress=True):
+            repo_path.mkdir(exist_ok=True)
+            (repo_path / "README").write_text(content)
+            return True
+        return download
+    
+    def test_zip_sync_only_downloads_newer(self):
+        """Test that ZIP mirrors are re-downloaded only when pushed_at is newer."""
+        with patch.object(self.fetcher, '_download_zip', side_effect=self.fake_zip("v1")):
+            self.assertTrue(self.fetcher.download_repository(self.repo, str(self.download_dir), "zip"))
+        
+        with patch.object(self.fetcher, '_download_zip') as mock_zip:
+            self.assertTrue(self.fetcher.download_repository(self.repo, str(self.download_dir), "zip", sync=True))
+            mock_zip.assert_not_called()
+        
+        newer = dict(self.repo, pushed_at='2024-02-01T00:00:00Z')
+        with patch.object(self.fetcher, '_download_zip', side_effect=self.fake_zip("v2")):
+            self.assertTrue(self.fetcher.download_repository(newer, str(self.download_dir), "zip", sync=True))
+        
+        self.assertEqual((self.download_dir / "owner_repo" / "README").read_text(), "v2")
+        self.assertEqual(sorted(os.listdir(self.download_dir)), [".sync_state.json", "owner_repo"])
+    
+    def test_zip_sync_failure_keeps_old_copy(self):
+        """Test that a failed re-download restores the previous copy."""
+        with patch.object(self.fetcher, '_download_zip', side_effect=self.fake_zip("v1")):
+            self.fetcher.download_repository(self.repo, str(self.download_dir), "zip")
+        
+        newer = dict(self.repo, pushed_at='2024-02-01T00:00:00Z')
+        with patch.object(self.fetcher, '_download_zip', return_value=False):
+            self.assertFalse(self.fetcher.download_repository(newer, str(self.download_dir), "zip", sync=True))
+        
+        self.assertEqual((self.download_dir / "owner_repo" / "README").read_text(), "v1")
+    
+    def test_clone_sync_fast_forwards(self):
+        """Test that existing clones are fast-forwarded to the remote branch."""
+        origin = make_origin_repo(Path(self.tmpdir.name) / "origin", {"file.txt": "one"})
+        self.repo['clone_url'] = origin.working_dir
+        
+        self.assertTrue(self.fetcher.download_repository(self.repo, str(self.download_dir), "clone"))
+        
+        Path(origin.working_dir, "file.txt").write_text("two")
+        origin.index.add(["file.txt"])
+        origin.index.commit("second")
+        newer = dict(self.repo, pushed_at='2024-02-01T00:00:00Z')
+        self.assertTrue(self.fetcher.download_repository(newer, str(self.download_dir), "clone", sync=True))
+        
+        self.assertEqual((self.download_dir / "owner_repo" / "file.txt").read_text(), "two")
+
+
+class TestMetadataWriter(unittest.TestCase):
+    """Test incremental metadata output."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.repos = [
+            {'name': 'a', 'full_name': 'o/a', 'stars': 5, 'topics': ['x'], 'extra': 1},
+            {'name': 'b', 'full_name': 'o/b', 'stars': 3, 'topics': []},
+        ]
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_csv_rows_are_flushed_per_page(self):
+        """Test that rows are on disk as soon as each page is written."""
+        path = os.path.join(self.tmpdir.name, "meta.csv")
+        with MetadataWriter(path) as writer:
+            self.assertFalse(os.path.exists(path))
+            writer.write(self.repos[:1])
+            with open(path, newline='') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 1)
+            writer.write(self.repos[1:])
+        
+        with open(path, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row['full_name'] for row in rows], ['o/a', 'o/b'])
+        self.assertNotIn('extra', rows[0])
+        self.assertTrue(rows[0]['downloaded_at'])
+    
+    def test_jsonl_inferred_from_extension(self):
+        """Test that .jsonl files are written as JSON Lines."""
+        path = os.path.join(self.tmpdir.name, "meta.jsonl")
+        GitHubCodeFetcher().save_metadata(iter(self.repos), path)
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(rows[0]['topics'], ['x'])
+        self.assertEqual(rows[1]['stars'], 3)
+
+
+class TestJobManifest(unittest.TestCase):
+    """Test the resumable job manifest and atomic downloads."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "topic.manifest.jsonl")
+        self.repos = [
+            {'name': f"r{i}", 'full_name': f"o/r{i}", 'default_branch': 'main'} for i in range(3)
+        ]
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_state_survives_reload(self):
+        """Test that the latest state per repository is restored, ignoring a truncated line."""
+        manifest = JobManifest(self.path)
+        manifest.start(self.repos)
+        manifest.record("o/r0", JobManifest.DONE, bytes=10, duration=0.5)
+        manifest.record("o/r1", JobManifest.DOWNLOADING)
+        with open(self.path, 'a') as f:
+            f.write('{"full_name": "o/r2", "sta')
+        
+        reloaded = JobManifest(self.path)
+        self.assertEqual(reloaded.entries["o/r0"]['state'], JobManifest.DONE)
+        self.assertEqual(reloaded.entries["o/r0"]['bytes'], 10)
+        self.assertEqual(
+            [repo['full_name'] for repo in reloaded.repositories(exclude_states=[JobManifest.DONE])],
+            ["o/r1", "o/r2"]
+        )
+    
+    def test_download_repositories_records_progress(self):
+        """Test that downloads record done/failed states with bytes and duration."""
+        fetcher = GitHubCodeFetcher()
+        manifest = JobManifest(self.path)
+        manifest.start(self.repos)
+        
+        def fake_fetch(repo_data, repo_path, method, show_progress=True, clone_options=None):
+            if repo_data['name'] == "r1":
+                (repo_path / "partial.txt").write_text("half")
+                return False
+            (repo_path / "file.txt").write_text("data")
+            return True
+        
+        download_dir = os.path.join(self.tmpdir.name, "topic")
+        with patch.object(fetcher, '_fetch_repository', side_effect=fake_fetch):
+            fetcher.download_repositories(self.repos, download_dir, "zip", jobs=2, manifest=manifest)
+        
+        self.assertEqual(manifest.entries["o/r0"]['state'], JobManifest.DONE)
+        self.assertEqual(manifest.entries["o/r0"]['bytes'], 4)
+        self.assertIn('duration', manifest.entries["o/r0"])
+        self.assertEqual(manifest.entries["o/r1"]['state'], JobManifest.FAILED)
+        # The failed download left nothing behind, not even its temporary folder
+        self.assertEqual(sorted(os.listdir(download_dir)), ["o_r0", "o_r2"])
+
+    
+    @unittest.skipIf(os.name != 'posix', "POSIX permissions")
+    def test_download_folder_honours_umask(self):
+        """Test that a finished download gets the umask's folder mode, not mkdtemp's 0700."""
+        fetcher = GitHubCodeFetcher()
+        download_dir = Path(self.tmpdir.name) / "topic"
+        umask = os.umask(0o022)
+        self.addCleanup(os.umask, umask)
+        
+        with patch.object(fetcher, '_fetch_repository', return_value=True):
+            fetcher.download_repositories(self.repos[:1], str(download_dir), "zip")
+        self.assertEqual((download_dir / "o_r0").stat().st_mode & 0o777, 0o755)
+    
+    def test_interrupted_replacement_is_restored(self):
+        """Test that cleanup restores the old folder when a crash hit between the two renames."""
+        download_dir = Path(self.tmpdir.name) / "topic"
+        backup = download_dir / ".o_r0.old.partial"
+        backup.mkdir(parents=True)
+        (backup / "file.txt").write_text("old")
+        (download_dir / ".o_r0-abc.partial").mkdir()
+        stale = download_dir / ".o_r1.old.partial"
+        stale.mkdir()
+        (download_dir / "o_r1").mkdir()
+        
+        self.assertEqual(remove_partial_downloads(str(download_dir)), 2)
+        self.assertEqual(sorted(os.listdir(download_dir)), ["o_r0", "o_r1"])
+        self.assertEqual((download_dir / "o_r0" / "file.txt").read_text(), "old")
+
+class TestDownloadPlanner(unittest.TestCase):
+    """Test size parsing and the pre-download budget planner."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        # Sizes are in KB, as reported by the search API
+        self.repos = [
+            {'name': "big", 'full_name': "o/big", 'size': 4096},
+            {'name': "small", 'full_name': "o/small", 'size': 10},
+            {'name': "medium", 'full_name': "o/medium", 'size': 1024},
+            {'name': "huge", 'full_name': "o/huge", 'size': 100000},
+        ]
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_parse_size(self):
+        """Test human-readable sizes with binary units."""
+        self.assertEqual(parse_size("512"), 512)
+        self.assertEqual(parse_size("2K"), 2048)
+        self.assertEqual(parse_size("500MB"), 500 * 1024 ** 2)
+        self.assertEqual(parse_size("1.5GiB"), int(1.5 * 1024 ** 3))
+        with self.assertRaises(ValueError):
+            parse_size("lots")
+    
+    def test_plan_respects_limits_and_orders_by_size(self):
+        """Test that oversized repositories are skipped and the budget favours earlier results."""
+        plan = plan_downloads(
+            self.repos, self.tmpdir.name, max_repo_size=parse_size("10MB"), total_budget=parse_size("5MB")
+        )
+        
+        self.assertEqual([repo['name'] for repo in plan['selected']], ["small", "big"])
+        self.assertEqual(
+            [(repo['name'], reason) for repo, reason in plan['skipped']],
+            [("medium", "over total budget"), ("huge", "larger than 10.0 MB")]
+        )
+        self.assertEqual(plan['total_bytes'], (4096 + 10) * 1024)
+        self.assertIsNotNone(plan['free_bytes'])
+    
+    def test_existing_repositories_are_free(self):
+        """Test that already downloaded repositories do not count against the budget."""
+        os.mkdir(os.path.join(self.tmpdir.name, "o_big"))
+        plan = plan_downloads(self.repos[:3], self.tmpdir.name, total_budget=parse_size("2MB"))
+        
+        self.assertEqual([repo['name'] for repo in plan['selected']], ["small", "medium", "big"])
+        self.assertEqual(plan['total_bytes'], (10 + 1024) * 1024)
+    
+    def test_cli_records_skipped_repositories(self):
+        """Test that the CLI prints the plan and marks skipped repositories in the manifest."""
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmpdir.name)
+        download_dir = os.path.join(self.tmpdir.name, "downloads")
+        repos = [dict(repo, description='', stars=0, language=None) for repo in self.repos]
+        with patch.object(GitHubCodeFetcher, 'iter_search_pages', return_value=iter([repos])), \
+             patch.object(GitHubCodeFetcher, 'download_repositories', return_value={}) as download:
+            result = CliRunner().invoke(main, [
+                '-q', 'topic', '-d', download_dir, '--no-cache', '--max-repo-size', '50M', '--bandwidth', '1MB'
+            ])
+        
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Skipping o/huge", result.output)
+        self.assertIn("Download plan: 3 repositories, ~5.0 MB, ~5s at 1.0 MB/s", result.output)
+        self.assertEqual([repo['name'] for repo in download.call_args[0][0]], ["small", "medium", "big"])
+        manifest = JobManifest(os.path.join(download_dir, "topic.manifest.jsonl"))
+        self.assertEqual(manifest.entries["o/huge"]['state'], JobManifest.SKIPPED)
+    
+    def test_invalid_size_option(self):
+        """Test that a malformed size is reported as a usage error."""
+        result = CliRunner().invoke(main, ['-q', 'topic', '--total-budget', 'plenty'])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("Invalid size", result.output)
+
+
+class TestBatchMode(unittest.TestCase):
+    """Test multi-query batch mode."""
+    
+    @staticmethod
+    def fake_search_page(params, page):
+        # "alpha" matches repos 0-2, "beta" matches repos 2-3
+        names = {'alpha': [0, 1, 2], 'beta': [2, 3]}[params['q'].split()[0]]
+        items = [{
+            'name': f"r{i}", 'full_name': f"o/r{i}", 'html_url': '', 'clone_url': '',
+            'stargazers_count': 1, 'forks_count': 0, 'size': 1, 'created_at': '', 'updated_at': ''
+        } for i in names]
+        return {'total_count': len(items), 'items': items}
+    
+    def test_load_batch_file_applies_defaults(self):
+        """Test that defaults are merged into every query and strings are accepted."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "batch.json")
+            with open(path, 'w') as f:
+                json.dump({'defaults': {'max_results': 5}, 'queries': ["alpha", {'query': 'beta', 'max_results': 2}]}, f)
+            queries = load_batch_file(path)
+        self.assertEqual(queries, [{'query': 'alpha', 'max_results': 5}, {'query': 'beta', 'max_results': 2}])
+    
+    def test_load_batch_file_rejects_unknown_keys(self):
+        """Test that typos in batch files are reported."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "batch.json")
+            with open(path, 'w') as f:
+                json.dump([{'query': 'alpha', 'min_star': 5}], f)
+            with self.assertRaises(ValueError):
+                load_batch_file(path)
+    
+    def test_batch_downloads_each_repository_once(self):
+        """Test that overlapping queries share one download linked into both topic folders."""
+        fetched = []
+        
+        def fake_fetch(repo_data, repo_path, method, show_progress=True, clone_options=None):
+            fetched.append(repo_data['full_name'])
+            (repo_path / "README").write_text(repo_data['name'])
+            return True
+        
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            self.addCleanup(os.chdir, cwd)
+            with open("batch.json", 'w') as f:
+                json.dump(["alpha", "beta"], f)
+            with patch.object(GitHubCodeFetcher, '_fetch_search_page', side_effect=self.fake_search_page), \
+                    patch.object(GitHubCodeFetcher, '_fetch_repository', side_effect=fake_fetch):
+                result = CliRunner().invoke(main, ['batch', 'batch.json', '--no-cache', '-m', 'zip', '-j', '2'])
+            
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual(sorted(fetched), ["o/r0", "o/r1", "o/r2", "o/r3"])
+            shared = Path("downloaded_repos") / "beta" / "o_r2"
+            self.assertTrue(shared.is_symlink())
+            self.assertEqual((shared / "README").read_text(), "r2")
+            self.assertTrue((Path("downloaded_repos") / "alpha" / "o_r2").is_symlink())
+            self.assertFalse((Path("downloaded_repos") / "beta" / "o_r0").exists())
+
+
+class FakeSearchAPI:
+    """In-memory stand-in for /search/repositories supporting stars:/created: qualifiers."""
+    
+    def __init__(self, repos):
+        self.repos = repos
+        self.requests = 0
+    
+    def matches(self, repo, query):
+        for low, high in re.findall(r"stars:(\d+)\.\.(\d+)", query):
+            if not int(low) <= repo['stargazers_count'] <= int(high):
+                return False
+        for low in re.findall(r"stars:>=(\d+)", query):
+            if repo['stargazers_count'] < int(low):
+                return False
+        for start, end in re.findall(r"created:(\S+)\.\.(\S+)", query):
+            if not start <= repo['created_at'][:10] <= end:
+                return False
+        return True
+    
+    def get_json(self, url, params, resource='core'):
+        self.requests += 1
+        found = [repo for repo in self.repos if self.matches(repo, params['q'])]
+        if params.get('sort') == 'stars':
+            found.sort(key=lambda repo: repo['stargazers_count'], reverse=params.get('order') != 'asc')
+        elif params.get('sort') == 'updated':
+            found.sort(key=lambda repo: repo['updated_at'], reverse=params.get('order') != 'asc')
+        per_page = params.get('per_page', 30)
+        start = (params.get('page', 1) - 1) * per_page
+        return {'total_count': len(found), 'items': found[:1000][start:start + per_page]}
+
+
+def make_search_item(i, stars, created='2015-01-01T00:00:00Z', updated=None):
+    return {
+        'name': f"r{i}", 'full_name': f"o/r{i}", 'html_url': '', 'clone_url': '',
+        'stargazers_count': stars, 'forks_count': 0, 'size': 1,
+        'created_at': created, 'updated_at': updated or created
+    }
+
+
+class TestSearchSharding(unittest.TestCase):
+    """Test sharding searches past the 1000-result cap."""
+    
+    def setUp(self):
+        self.fetcher = GitHubCodeFetcher()
+    
+    def test_sharded_search_merges_in_sort_order(self):
+        """Test that >1000 results are fetched as disjoint star shards and merged by stars."""
+        api = FakeSearchAPI([make_search_item(i, (i * 7919) % 3000) for i in range(2500)])
+        with patch.object(self.fetcher, '_get_json', side_effect=api.get_json):
+            results = self.fetcher.search_repositories("q", max_results=2200, per_page=100)
+        
+        self.assertEqual(len(results), 2200)
+        self.assertEqual(len({repo['full_name'] for repo in results}), 2200)
+        stars = [repo['stars'] for repo in results]
+        self.assertEqual(stars, sorted(stars, reverse=True))
+        expected = sorted((repo['stargazers_count'] for repo in api.repos), reverse=True)[:2200]
+        self.assertEqual(stars, expected)
+    
+    def test_single_star_count_is_split_by_creation_date(self):
+        """Test that a star count with more than 1000 repositories is split by created: ranges."""
+        repos = [
+            make_search_item(i, 5, f"20{10 + i % 10}-0{1 + i % 9}-1{i % 10}T00:00:00Z") for i in range(1500)
+        ]
+        api = FakeSearchAPI(repos)
+        with patch.object(self.fetcher, '_get_json', side_effect=api.get_json):
+            shards = self.fetcher.plan_search_shards("q")
+            results = self.fetcher.search_repositories("q", max_results=1500, per_page=100)
+        
+        self.assertTrue(all('created:' in qualifier for qualifier, _ in shards))
+        self.assertEqual(sum(count for _, count in shards), 1500)
+        self.assertEqual(len({repo['full_name'] for repo in results}), 1500)
+
+    
+    def make_api(self, total=12000):
+        updated = lambda i: (datetime(2020, 1, 1) + timedelta(minutes=(i * 7907) % total)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return FakeSearchAPI([make_search_item(i, (i * 7919) % 20000, updated=updated(i)) for i in range(total)])
+    
+    def test_best_match_stops_planning_once_covered(self):
+        """Test that best-match, like stars, only plans and fetches the shards it needs."""
+        api = self.make_api()
+        with patch.object(self.fetcher, '_get_json', side_effect=api.get_json):
+            results = self.fetcher.search_repositories("q", sort='best-match', max_results=1500, per_page=100)
+        
+        self.assertEqual(len(results), 1500)
+        self.assertLess(api.requests, 40)
+    
+    def test_updated_merges_lazily_paged_shards(self):
+        """Test that sorting by update time fetches each shard's pages only as the merge needs them."""
+        api = self.make_api()
+        with patch.object(self.fetcher, '_get_json', side_effect=api.get_json):
+            shards = self.fetcher.plan_search_shards("q", sort='updated')
+            planning = api.requests
+            api.requests = 0
+            results = self.fetcher.search_repositories("q", sort='updated', max_results=1500, per_page=100)
+        
+        expected = sorted((repo['updated_at'] for repo in api.repos), reverse=True)[:1500]
+        self.assertEqual([repo['updated_at'] for repo in results], expected)
+        # Besides the total count and planning: one page per shard plus the 15 pages of results
+        self.assertLessEqual(api.requests - 1 - planning, len(shards) + 15)
+    
+    def test_sharded_pages_are_yielded_before_all_shards_are_fetched(self):
+        """Test that the first page of a sharded search arrives after fetching only its first shards."""
+        api = self.make_api()
+        with patch.object(self.fetcher, '_get_json', side_effect=api.get_json):
+            pages = self.fetcher.iter_search_pages("q", max_results=5000, per_page=100, concurrency=1)
+            first = next(pages)
+            requests_for_first_page = api.requests
+            rest = [repo for page in pages for repo in page]
+        
+        self.assertEqual(len(first) + len(rest), 5000)
+        self.assertEqual(len({repo['full_name'] for repo in rest}), 4900)
+        self.assertLess(requests_for_first_page, api.requests - 30)
+
+
+class TestGraphQLEnrichment(unittest.TestCase):
+    """Test bulk GraphQL metadata enrichment."""
+    
+    @staticmethod
+    def graphql_response(json_payload):
+        ids = json_payload['variables']['ids']
+        nodes = [{
+            'id': node_id,
+            'pushedAt': '2024-05-01T00:00:00Z',
+            'diskUsage': 42,
+            'defaultBranchRef': {'target': {'oid': f"sha-{node_id}", 'history': {'totalCount': 7}}},
+            'languages': {'edges': [{'size': 100, 'node': {'name': 'Python'}}, {'size': 5, 'node': {'name': 'C'}}]},
+            'latestRelease': None,
+            'object': {'entries': [{'name': 'README.md'}, {'name': 'src'}]},
+        } for node_id in ids]
+        response = MagicMock(status_code=200)
+        response.json.return_value = {
+            'data': {'rateLimit': {'cost': 1, 'remaining': 4000, 'resetAt': '2030-01-01T00:00:00Z'}, 'nodes': nodes}
+        }
+        return response
+    
+    def test_batches_nodes_and_parses_fields(self):
+        """Test that repositories are enriched 100 at a time."""
+        fetcher = GitHubCodeFetcher(token="test_token")
+        repos = [{'full_name': f"o/r{i}", 'node_id': f"N{i}", 'pushed_at': ''} for i in range(250)]
+        
+        with patch.object(fetcher, '_request', side_effect=lambda *args, **kwargs: self.graphql_response(kwargs['json'])) \
+                as mock_request:
+            fetcher.enrich_repositories(repos)
+        
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(repos[0]['latest_commit_sha'], "sha-N0")
+        self.assertEqual(repos[0]['commit_count'], 7)
+        self.assertEqual(repos[0]['languages'], {'Python': 100, 'C': 5})
+        self.assertEqual(repos[0]['root_entry_count'], 2)
+        self.assertEqual(repos[249]['pushed_at'], '2024-05-01T00:00:00Z')
+        self.assertEqual(repos[249]['latest_release'], '')
+    
+    def test_cli_enriches_full_batches(self):
+        """Test that --enrich searches 100 results per page so each GraphQL query carries 100 IDs."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.addCleanup(os.chdir, os.getcwd())
+            os.chdir(tmpdir)
+            repos = [dict(make_search_item(i, 10), node_id=f"N{i}") for i in range(250)]
+            api = FakeSearchAPI(repos)
+            batches = []
+            
+            def graphql(*args, **kwargs):
+                batches.append(len(kwargs['json']['variables']['ids']))
+                return self.graphql_response(kwargs['json'])
+            
+            with patch.object(GitHubCodeFetcher, '_get_json', side_effect=api.get_json), \
+                    patch.object(GitHubCodeFetcher, '_request', side_effect=graphql):
+                result = CliRunner().invoke(main, ['-q', 'x', '-n', '250', '--enrich', '--search-only',
+                                                   '--token', 'test_token', '--no-cache', '--no-index'])
+        
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(batches, [100, 100, 50])
+    
+    def test_requires_token(self):
+        """Test that enrichment is skipped without a token."""
+        fetcher = GitHubCodeFetcher()
+        repos = [{'full_name': "o/r", 'node_id': "N"}]
+        with patch.object(fetcher, '_request') as mock_request:
+            fetcher.enrich_repositories(repos)
+        mock_request.assert_not_called()
+        self.assertNotIn('languages', repos[0])
+    
+    @patch('github_code_fetcher.time.sleep')
+    def test_waits_when_point_budget_is_exhausted(self, mock_sleep):
+        """Test that a query that would not fit the remaining points waits for the reset."""
+        fetcher = GitHubCodeFetcher(token="test_token")
+        fetcher._wait_for_graphql_budget({'cost': 2, 'remaining': 1, 'resetAt': '2999-01-01T00:00:00Z'})
+        mock_sleep.assert_called_once()
+
+
+class TestRequestScheduler(unittest.TestCase):
+    """Test rate limit pacing and retries."""
+    
+    @staticmethod
+    def make_response(status, headers=None):
+        response = MagicMock()
+        response.status_code = status
+        response.headers = headers or {}
+        return response
+    
+    @patch('github_code_fetcher.time.sleep')
+    def test_retries_with_retry_after(self, mock_sleep):
+        """Test that 429 responses are retried after the Retry-After delay."""
+        session = MagicMock()
+        session.request.side_effect = [
+            self.make_response(429, {'Retry-After': '7'}),
+            self.make_response(200),
+        ]
+        response = RequestScheduler().request(session, 'GET', 'https://example.com', resource=None)
+        self.assertEqual(response.status_code, 200)
+        mock_sleep.assert_called_once_with(7.0)
+    
+    @patch('github_code_fetcher.time.sleep')
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """Test that the last response is returned once retries are exhausted."""
+        session = MagicMock()
+        session.request.return_value = self.make_response(502)
+        scheduler = RequestScheduler(max_retries=2)
+        response = scheduler.request(session, 'GET', 'https://example.com', resource=None)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(session.request.call_count, 3)
+    
+    def test_forbidden_is_not_retried(self):
+        """Test that a 403 without rate limit headers is returned immediately."""
+        session = MagicMock()
+        session.request.return_value = self.make_response(403)
+        response = RequestScheduler().request(session, 'GET', 'https://example.com', resource=None)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(session.request.call_count, 1)
+    
+    def test_token_bucket_paces_requests(self):
+        """Test that an empty bucket waits for the next token."""
+        bucket = TokenBucket(rate=50, capacity=1)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertGreater(bucket.acquire(), 0.0)
+
+
+class TestMetadataIndex(unittest.TestCase):
+    """Test the local SQLite/FTS metadata index and offline queries."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "metadata", "repositories.sqlite")
+        self.repos = [
+            {'name': "fastapi", 'full_name': "t/fastapi", 'description': "Modern web framework",
+             'topics': ['python', 'api'], 'stars': 70000, 'language': 'Python', 'updated_at': '2024-05-01'},
+            {'name': "gin", 'full_name': "g/gin", 'description': "HTTP web framework",
+             'topics': ['go'], 'stars': 75000, 'language': 'Go', 'updated_at': '2023-01-01'},
+            {'name': "scrapy", 'full_name': "s/scrapy", 'description': "Web crawling",
+             'topics': ['crawler'], 'stars': 50000, 'language': 'Python', 'updated_at': '2024-06-01'},
+        ]
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_search_and_filters(self):
+        """Test full-text prefix search combined with language, star and date filters."""
+        index = MetadataIndex(self.path)
+        index.upsert(self.repos)
+        
+        self.assertEqual([r['full_name'] for r in index.search("web framework")], ["g/gin", "t/fastapi"])
+        self.assertEqual([r['full_name'] for r in index.search("crawl")], ["s/scrapy"])
+        self.assertEqual([r['full_name'] for r in index.search("api")], ["t/fastapi"])
+        self.assertEqual([r['full_name'] for r in index.search("web", language="python")], ["t/fastapi", "s/scrapy"])
+        self.assertEqual([r['full_name'] for r in index.search(min_stars=60000, sort='updated')], ["t/fastapi", "g/gin"])
+        self.assertEqual([r['full_name'] for r in index.search(updated_since='2024-01-01', order='asc')],
+                         ["s/scrapy", "t/fastapi"])
+        # Qualifiers are ignored and punctuation cannot break the FTS query syntax
+        self.assertEqual([r['full_name'] for r in index.search('gin" stars:>10 (')], ["g/gin"])
+        index.close()
+    
+    def test_upsert_updates_records_and_text_index(self):
+        """Test that re-indexing a repository replaces its record and searchable text."""
+        index = MetadataIndex(self.path)
+        index.upsert(self.repos)
+        index.upsert([dict(self.repos[1], description="Fast router", stars=80000)])
+        
+        self.assertEqual(index.count(), 3)
+        self.assertEqual(index.search("router")[0]['stars'], 80000)
+        self.assertEqual([r['full_name'] for r in index.search("web framework")], ["t/fastapi"])
+        index.close()
+    
+    def test_save_metadata_upserts(self):
+        """Test that save_metadata also records repositories in the fetcher's index."""
+        index = MetadataIndex(self.path)
+        fetcher = GitHubCodeFetcher(index=index)
+        fetcher.save_metadata(iter(self.repos), os.path.join(self.tmpdir.name, "meta.csv"))
+        self.assertEqual(index.count(), 3)
+        index.close()
+    
+    def test_cli_search_then_query_offline(self):
+        """Test that searched repositories can be queried later without the API."""
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmpdir.name)
+        repos = [dict(repo, html_url='', clone_url='') for repo in self.repos]
+        runner = CliRunner()
+        with patch.object(GitHubCodeFetcher, 'iter_search_pages', return_value=iter([repos])):
+            result = runner.invoke(main, ['-q', 'web', '--search-only', '--no-cache'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        
+        result = runner.invoke(main, ['query-local', 'framework', '-l', 'go'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("g/gin", result.output)
+        self.assertIn("1 of 3 indexed repositories shown", result.output)
+        
+        with patch.object(GitHubCodeFetcher, 'iter_search_pages', side_effect=AssertionError("API called")):
+            result = runner.invoke(main, ['-q', 'crawling', '--offline', '--search-only', '--no-cache'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("s/scrapy", result.output)
+        self.assertTrue(os.path.exists(os.path.join("metadata", "crawling_repository_metadata.csv")))
+
+
+class TestCodeSearch(unittest.TestCase):
+    """Test code search and per-file downloads."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fetcher = GitHubCodeFetcher(token="test-token")
+        self.blobs = {git_blob_sha(data): data for data in (b"print('a')\n", b"print('b')\n")}
+        self.shas = list(self.blobs)
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def make_item(self, repo, path, sha):
+        return {'name': path.rsplit('/', 1)[-1], 'path': path, 'sha': sha, 'html_url': '',
+                'score': 1.0, 'repository': {'full_name': repo}}
+    
+    def fake_blob_request(self, method, url, resource='core', **kwargs):
+        response = MagicMock()
+        response.content = self.blobs[url.rsplit('/', 1)[-1]]
+        return response
+    
+    def test_search_code_paginates(self):
+        """Test that result pages are fetched until max_results and parsed into file records."""
+        items = [self.make_item("o/r", f"src/f{i}.py", self.shas[0]) for i in range(5)]
+        pages = [{'total_count': 5, 'items': items[:2]}, {'total_count': 5, 'items': items[2:4]},
+                 {'total_count': 5, 'items': items[4:]}]
+        with patch.object(self.fetcher, '_get_json', side_effect=pages) as get_json:
+            files = self.fetcher.search_code("def main", language="python", max_results=3, per_page=2)
+        
+        self.assertEqual([f['path'] for f in files], ["src/f0.py", "src/f1.py", "src/f2.py"])
+        self.assertEqual(files[0]['repository'], "o/r")
+        self.assertEqual(get_json.call_count, 2)
+        self.assertEqual(get_json.call_args[0][1]['q'], "def main language:python")
+        self.assertEqual(GitHubCodeFetcher().search_code("def main"), [])
+    
+    def test_download_code_files(self):
+        """Test that blobs are written under the repository folder, deduplicated and verified."""
+        files = [
+            parse_code_result(self.make_item("o/r", "src/a.py", self.shas[0])),
+            parse_code_result(self.make_item("o/r", "copy/a.py", self.shas[0])),
+            parse_code_result(self.make_item("o/s", "b.py", self.shas[1])),
+            parse_code_result(self.make_item("o/s", "../escape.py", self.shas[1])),
+        ]
+        with patch.object(self.fetcher, '_request', side_effect=self.fake_blob_request) as request:
+            results = self.fetcher.download_code_files(files, self.tmpdir.name, jobs=1)
+        
+        self.assertEqual(list(results.values()), [True, True, True, False])
+        self.assertEqual(request.call_count, 2)
+        root = Path(self.tmpdir.name)
+        self.assertEqual((root / "o_r" / "copy" / "a.py").read_bytes(), b"print('a')\n")
+        self.assertEqual((root / "o_s" / "b.py").read_bytes(), b"print('b')\n")
+        
+        # Files already on disk with the same SHA are not fetched again
+        with patch.object(self.fetcher, '_request', side_effect=AssertionError("fetched again")):
+            self.assertTrue(all(self.fetcher.download_code_files(files[:3], self.tmpdir.name).values()))
+    
+    def test_corrupt_blob_is_rejected(self):
+        """Test that a blob whose contents do not match its SHA is not written."""
+        files = [parse_code_result(self.make_item("o/r", "a.py", self.shas[0]))]
+        self.blobs[self.shas[0]] = b"tampered"
+        with patch.object(self.fetcher, '_request', side_effect=self.fake_blob_request):
+            results = self.fetcher.download_code_files(files, self.tmpdir.name)
+        self.assertEqual(results, {"o/r/a.py": False})
+        self.assertFalse((Path(self.tmpdir.name) / "o_r" / "a.py").exists())
+    
+    def test_cli_code_search_metadata(self):
+        """Test that --code-search records repository, path and SHA in the metadata."""
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmpdir.name)
+        files = [parse_code_result(self.make_item("o/r", "src/a.py", self.shas[0]))]
+        with patch.object(GitHubCodeFetcher, 'search_code', return_value=files), \
+             patch.object(GitHubCodeFetcher, '_request', side_effect=self.fake_blob_request):
+            result = CliRunner().invoke(main, ['-q', 'def main', '--code-search', '--no-cache', '--token', 't'])
+        
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Successfully downloaded: 1/1 files", result.output)
+        with open(os.path.join("metadata", "def_main_repository_metadata.csv")) as f:
+            row = next(csv.DictReader(f))
+        self.assertEqual((row['repository'], row['path'], row['sha']), ("o/r", "src/a.py", self.shas[0]))
+        self.assertTrue(os.path.exists(os.path.join("downloaded_repos", "def_main", "o_r", "src", "a.py")))
+
+
+class TestTelemetry(unittest.TestCase):
+    """Test request, phase and download telemetry and its reports."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    @patch('github_code_fetcher.time.sleep')
+    def test_scheduler_records_retries_and_waits(self, mock_sleep):
+        """Test that the scheduler reports the final status, retry count and backoff time."""
+        telemetry = Telemetry()
+        session = MagicMock()
+        session.request.side_effect = [
+            TestRequestScheduler.make_response(429, {'Retry-After': '3'}),
+            TestRequestScheduler.make_response(200),
+        ]
+        RequestScheduler(telemetry=telemetry).request(session, 'GET', 'https://example.com', resource=None)
+        session.request.return_value = TestRequestScheduler.make_response(404)
+        session.request.side_effect = None
+        RequestScheduler(telemetry=telemetry).request(session, 'GET', 'https://example.com', resource=None)
+        
+        stats = telemetry.summary()['requests']['unpaced']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['retries'], 1)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['wait_seconds'], 3.0)
+    
+    def test_storage_is_bounded(self):
+        """Test that per-request and per-download samples are capped while totals stay exact."""
+        telemetry = Telemetry(max_latencies=10, max_downloads=3)
+        for i in range(100):
+            telemetry.record_request('search', i / 100, 200)
+            telemetry.record_download(f"o/r{i}", "zip", i % 2 == 0, 10, 1.0)
+        
+        summary = telemetry.summary()
+        self.assertEqual(len(telemetry.requests['search']['latencies']), 10)
+        self.assertEqual(summary['requests']['search']['count'], 100)
+        self.assertEqual(summary['requests']['search']['latency']['mean'], 0.495)
+        self.assertEqual(summary['requests']['search']['latency']['max'], 0.99)
+        self.assertEqual(summary['requests']['search']['latency']['p50'], 0.94)
+        downloads = summary['downloads']
+        self.assertEqual((downloads['count'], downloads['succeeded'], downloads['failed']), (100, 50, 50))
+        self.assertEqual(downloads['bytes'], 1000)
+        self.assertEqual([d['full_name'] for d in downloads['repositories']], ["o/r97", "o/r98", "o/r99"])
+    
+    def test_summary_and_prometheus_output(self):
+        """Test the aggregated summary and its Prometheus rendering."""
+        telemetry = Telemetry()
+        for latency in (0.1, 0.2, 0.3, 0.4):
+            telemetry.record_request('search', latency, 200)
+        telemetry.add_bytes('search', 2048)
+        with telemetry.phase('extract'):
+            pass
+        telemetry.record_download("o/r", "zip", True, 1000, 2.0)
+        telemetry.record_download("o/s", "zip", False, 0, 1.0)
+        
+        summary = telemetry.summary()
+        self.assertEqual(summary['requests']['search']['latency']['p50'], 0.2)
+        self.assertEqual(summary['requests']['search']['latency']['p95'], 0.4)
+        self.assertEqual(summary['requests']['search']['bytes'], 2048)
+        self.assertEqual(summary['phases']['extract']['count'], 1)
+        self.assertEqual(summary['downloads']['succeeded'], 1)
+        self.assertEqual(summary['downloads']['repositories'][0]['throughput'], 500.0)
+        
+        path = os.path.join(self.tmpdir.name, "metrics.prom")
+        telemetry.write_prometheus(path)
+        with open(path) as f:
+            text = f.read()
+        self.assertIn("# TYPE github_fetcher_requests_total counter", text)
+        self.assertIn('github_fetcher_requests_total{resource="search"} 4', text)
+        self.assertIn('github_fetcher_request_latency_seconds{resource="search",quantile="p95"} 0.4', text)
+        self.assertIn('github_fetcher_downloads_total{status="failed"} 1', text)
+    
+    def test_cli_writes_telemetry_files(self):
+        """Test that the CLI prints the timing report and writes the requested files."""
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmpdir.name)
+        repos = [{'name': "r", 'full_name': "o/r", 'size': 1, 'description': '', 'stars': 0, 'language': None}]
+        with patch.object(GitHubCodeFetcher, 'iter_search_pages', return_value=iter([repos])):
+            result = CliRunner().invoke(main, [
+                '-q', 'topic', '--search-only', '--no-cache',
+                '--stats-file', 'stats.json', '--prometheus-file', 'metrics.prom'
+            ])
+        
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Timing: search", result.output)
+        with open("stats.json") as f:
+            self.assertIn('search', json.load(f)['phases'])
+        self.assertTrue(os.path.exists("metrics.prom"))
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test the persistent API response cache."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite")
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_put_and_get(self):
+        """Test that stored responses are returned fresh within the TTL."""
+        cache = ResponseCache(self.path, ttl=60)
+        key = cache.make_key("https://api.github.com/search/repositories", {'q': 'x', 'page': 1})
+        cache.put(key, {'items': [1, 2]}, etag='"abc"')
+        entry = cache.get(key)
+        self.assertEqual(entry['body'], {'items': [1, 2]})
+        self.assertEqual(entry['etag'], '"abc"')
+        self.assertTrue(entry['fresh'])
+        cache.close()
+    
+    def test_key_ignores_param_order(self):
+        """Test that keys depend on the parameter values, not their order."""
+        self.assertEqual(
+            ResponseCache.make_key("u", {'a': 1, 'b': 2}),
+            ResponseCache.make_key("u", {'b': 2, 'a': 1})
+        )
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entries are evicted over the size limit."""
+        cache = ResponseCache(self.path, max_size=60)
+        cache.put("old", {'data': "x" * 20})
+        cache.put("new", {'data': "y" * 20})
+        cache.put("newest", {'data': "z" * 20})
+        self.assertIsNone(cache.get("old"))
+        self.assertIsNotNone(cache.get("newest"))
+        cache.close()
+    
+    def test_fetcher_revalidates_stale_entries(self):
+        """Test that stale entries are revalidated with If-None-Match and reused on 304."""
+        cache = ResponseCache(self.path, ttl=0)
+        fetcher = GitHubCodeFetcher(cache=cache)
+        url = f"{fetcher.base_url}/search/repositories"
+        cache.put(cache.make_key(url, {'q': 'x'}), {'items': ['cached']}, etag='"v1"')
+        
+        response = MagicMock(status_code=304, headers={})
+        with patch.object(fetcher, '_request', return_value=response) as mock_request:
+            data = fetcher._get_json(url, {'q': 'x'}, resource='search')
+        
+        self.assertEqual(data, {'items': ['cached']})
+        self.assertEqual(mock_request.call_args.kwargs['headers'], {'If-None-Match': '"v1"'})
+        cache.close()
+
+
+
+class TestBenchmark(unittest.TestCase):
+    """Smoke-test the offline benchmark harness."""
+    
+    def test_benchmarks_complete_offline(self):
+        """Test that every benchmark downloads all repositories from the local mock."""
+        results = run_benchmarks([5], ['zip', 'tarball', 'clone'], jobs=2, concurrency=2, files=3, file_size=256)
+        
+        self.assertEqual(len(results), 8)
+        for row in results:
+            self.assertEqual(row['completed'], 5, row)
+        self.assertEqual({row['mode'] for row in results}, {'serial', 'parallel'})
+    
+    def test_mock_rate_limit(self):
+        """Test that the mock answers with a rate-limited 403 once the window is used up."""
+        import requests
+        
+        with MockGitHub(3, "", {}, rate_limit=1, rate_window=60) as mock:
+            first = requests.get(f"{mock.url}/search/repositories", params={'q': 'x'})
+            second = requests.get(f"{mock.url}/search/repositories", params={'q': 'x'})
+        
+        self.assertEqual(len(first.json()['items']), 3)
+        self.assertEqual(second.status_code, 403)
+        self.assertEqual(second.headers['X-RateLimit-Remaining'], '0')
+
+
+class TestConnectionPooling(unittest.TestCase):
+    """Test the tuned connection pool and keep-alive reuse."""
+    
+    def test_pool_size_is_configurable(self):
+        """Test that the session's adapter keeps the requested number of connections per host."""
+        fetcher = GitHubCodeFetcher(pool_size=48)
+        self.assertEqual(fetcher.session.get_adapter("https://api.github.com")._pool_maxsize, 48)
+    
+    def test_connections_are_reused(self):
+        """Test that sequential search pages and streamed tarballs share one keep-alive connection."""
+        contents = [("a.py", b"print()\n")]
+        with tempfile.TemporaryDirectory() as tmpdir, MockGitHub(6, "", build_archives(contents)) as mock:
+            fetcher = GitHubCodeFetcher(token="test-token")
+            fetcher.base_url = fetcher.web_url = mock.url
+            repositories = fetcher.search_repositories("x", max_results=6, per_page=2)
+            results = fetcher.download_repositories(repositories[:3], tmpdir, "tarball")
+        
+        self.assertTrue(all(results.values()))
+        stats = fetcher.connection_stats()[mock.url]
+        self.assertEqual(stats['requests'], 6)
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(stats['reuse'], 6.0)
+
+
+class TestJobQueue(unittest.TestCase):
+    """Test the resident job queue and its HTTP API."""
+    
+    def wait_for(self, queue, job_id, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = queue.get(job_id)
+            if job['state'] not in (JobQueue.QUEUED, JobQueue.RUNNING):
+                return job
+            time.sleep(0.01)
+        self.fail(f"Job {job_id} did not finish")
+    
+    def test_jobs_run_by_priority(self):
+        """Test that queued jobs start highest priority first, then in submission order."""
+        queue = JobQueue(GitHubCodeFetcher(), workers=1)
+        started, release = [], threading.Event()
+        
+        def run(job):
+            started.append(job['params']['query'])
+            release.wait(5)
+            return {}
+        
+        with patch.object(queue, '_run', side_effect=run):
+            first = queue.submit('search', {'query': 'first'})
+            while not started:
+                time.sleep(0.01)
+            low = queue.submit('search', {'query': 'low'})
+            cancelled = queue.submit('search', {'query': 'cancelled'}, priority=9)
+            high = queue.submit('search', {'query': 'high'}, priority=5)
+            self.assertTrue(queue.cancel(cancelled['id']))
+            release.set()
+            for job in (first, low, high):
+                self.assertEqual(self.wait_for(queue, job['id'])['state'], JobQueue.DONE)
+        queue.shutdown()
+        
+        self.assertEqual(started, ['first', 'high', 'low'])
+        self.assertEqual(queue.get(cancelled['id'])['state'], JobQueue.CANCELLED)
+        self.assertFalse(queue.cancel(first['id']))
+    
+    def test_search_jobs_use_search_concurrency(self):
+        """Test that search jobs fetch pages with the queue's search concurrency."""
+        fetcher = GitHubCodeFetcher(index=None)
+        queue = JobQueue(fetcher, workers=1, search_concurrency=7)
+        with patch.object(fetcher, 'search_repositories', return_value=[]) as search:
+            job = queue.submit('search', {'query': 'x', 'max_results': 50})
+            self.wait_for(queue, job['id'])
+        queue.shutdown()
+        search.assert_called_once_with(concurrency=7, query='x', max_results=50)
+    
+    def test_rejects_invalid_jobs(self):
+        """Test that unknown job types, unknown parameters and missing queries are refused."""
+        queue = JobQueue(GitHubCodeFetcher(), workers=1)
+        with self.assertRaises(ValueError):
+            queue.submit('delete', {'query': 'x'})
+        with self.assertRaises(ValueError):
+            queue.submit('search', {'query': 'x', 'method': 'zip'})
+        with self.assertRaises(ValueError):
+            queue.submit('download', {'language': 'python'})
+        queue.shutdown()
+    
+    def test_download_dir_stays_inside_base(self):
+        """Test that download jobs cannot write outside the queue's base directory."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            queue = JobQueue(GitHubCodeFetcher(), workers=1, download_dir=tmpdir)
+            queue.shutdown()
+            for download_dir in ("../elsewhere", "/tmp", "sub/../../x"):
+                with self.assertRaises(ValueError):
+                    queue.submit('download', {'query': 'x', 'download_dir': download_dir})
+            job = queue.submit('download', {'query': 'x', 'download_dir': 'sub/topic'})
+            self.assertEqual(job['params']['download_dir'], str(Path(tmpdir).resolve() / "sub" / "topic"))
+    
+    def test_download_job_reports_progress(self):
+        """Test a download job end to end against the local mock."""
+        contents = [("a.py", b"print()\n")]
+        with tempfile.TemporaryDirectory() as tmpdir, MockGitHub(4, "", build_archives(contents)) as mock:
+            fetcher = GitHubCodeFetcher(token="test-token")
+            fetcher.base_url = fetcher.web_url = mock.url
+            queue = JobQueue(fetcher, workers=2, download_dir=tmpdir)
+            job = queue.submit('download', {'query': 'x', 'max_results': 3, 'method': 'tarball', 'jobs': 2})
+            job = self.wait_for(queue, job['id'])
+            queue.shutdown()
+            
+            self.assertEqual(job['state'], JobQueue.DONE, job['error'])
+            self.assertEqual(job['progress'], {'done': 3, 'total': 3})
+            self.assertEqual(job['result']['succeeded'], 3)
+            self.assertTrue((Path(job['result']['download_dir']) / 'bench_repo0' / 'a.py').exists())
+    
+    def test_http_api(self):
+        """Test submitting, polling and cancelling jobs over HTTP."""
+        import requests
+        
+        queue = JobQueue(GitHubCodeFetcher(), workers=1)
+        server = make_job_server(queue, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://{}:{}".format(*server.server_address[:2])
+        try:
+            with patch.object(queue, '_run', return_value={'count': 0, 'repositories': []}):
+                response = requests.post(f"{url}/jobs", json={'type': 'search', 'params': {'query': 'x'}})
+                self.assertEqual(response.status_code, 202)
+                job_id = response.json()['id']
+                self.wait_for(queue, job_id)
+            
+            self.assertEqual(requests.get(f"{url}/jobs/{job_id}").json()['result'], {'count': 0, 'repositories': []})
+            self.assertEqual([job['id'] for job in requests.get(f"{url}/jobs").json()['jobs']], [job_id])
+            self.assertEqual(requests.get(f"{url}/stats").json()['jobs'], {'done': 1})
+            self.assertEqual(requests.get(f"{url}/jobs/missing").status_code, 404)
+            self.assertEqual(requests.delete(f"{url}/jobs/{job_id}").status_code, 409)
+            self.assertEqual(requests.post(f"{url}/jobs", json={'type': 'bogus'}).status_code, 400)
+            # A cross-site form or text/plain POST is refused before it is parsed
+            body = json.dumps({'type': 'search', 'params': {'query': 'x'}})
+            response = requests.post(f"{url}/jobs", data=body, headers={'Content-Type': 'text/plain'})
+            self.assertEqual(response.status_code, 415)
+            self.assertEqual(len(queue.list()), 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+            queue.shutdown()
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, "ranking needs NumPy")
+class TestRanking(unittest.TestCase):
+    """Test the weighted ranking and top-K selection of search results."""
+    
+    NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    
+    def make_repo(self, name, stars=0, forks=0, size=0, days_old=0, **fields):
+        updated = (self.NOW - timedelta(days=days_old)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return dict({'name': name, 'full_name': f"o/{name}", 'description': '', 'language': 'Python',
+                     'html_url': '', 'clone_url': '', 'stars': stars, 'forks': forks, 'size': size,
+                     'updated_at': updated, 'license': '', 'archived': False}, **fields)
+    
+    def test_weighted_score(self):
+        """Test the score formula for each factor."""
+        repo = self.make_repo("a", stars=99, forks=9, size=999, days_old=365)
+        weights = {'stars': 2.0, 'forks': 1.0, 'recency': 4.0, 'size': -1.0}
+        [ranked] = rank_repositories([repo], weights, now=self.NOW)
+        
+        expected = 2 * math.log(100) + math.log(10) + 4 * 0.5 - math.log(1000)
+        self.assertAlmostEqual(ranked['score'], expected, places=3)
+        self.assertNotIn('score', repo)
+    
+    def test_recency_and_size_change_the_order(self):
+        """Test that a fresher, smaller repository can outrank one with slightly more stars."""
+        repos = [self.make_repo("old", stars=1000, size=10 ** 6, days_old=3000),
+                 self.make_repo("new", stars=900, size=100, days_old=10)]
+        self.assertEqual([r['name'] for r in rank_repositories(repos, now=self.NOW)], ["new", "old"])
+        self.assertEqual([r['name'] for r in rank_repositories(
+            repos, {'recency': 0, 'size': 0}, now=self.NOW)], ["old", "new"])
+    
+    def test_filters_and_top_k(self):
+        """Test archived and license filters, top-K and stable order for equal scores."""
+        repos = [self.make_repo(f"r{i}", stars=10, license="MIT License") for i in range(5)]
+        repos.append(self.make_repo("archived", stars=10 ** 6, archived=True, license="MIT License"))
+        repos.append(self.make_repo("gpl", stars=10 ** 6, license="GNU General Public License v3.0"))
+        repos.append(self.make_repo("missing", stars=10 ** 6, updated_at=None, license=None))
+        
+        self.assertEqual([r['name'] for r in rank_repositories(repos, top_k=3, now=self.NOW)],
+                         ["archived", "gpl", "missing"])
+        ranked = rank_repositories(repos, top_k=3, exclude_archived=True, licenses=["mit license"], now=self.NOW)
+        self.assertEqual([r['name'] for r in ranked], ["r0", "r1", "r2"])
+        self.assertEqual(rank_repositories([], top_k=3), [])
+    
+    def test_parse_rank_weights(self):
+        """Test that weights override the defaults and invalid factors are refused."""
+        weights = parse_rank_weights("stars=2, size=-0.5")
+        self.assertEqual((weights['stars'], weights['size'], weights['forks']), (2.0, -0.5, 0.5))
+        for value in ("watchers=1", "stars", "stars=many"):
+            with self.assertRaises(ValueError):
+                parse_rank_weights(value)
+    
+    def test_cli_downloads_top_k_and_writes_scores(self):
+        """Test that --top-k writes every ranked result with its score but only downloads the best K."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.addCleanup(os.chdir, os.getcwd())
+            os.chdir(tmpdir)
+            repos = [self.make_repo(f"r{i}", stars=i) for i in range(20)]
+            with patch.object(GitHubCodeFetcher, 'iter_search_pages', return_value=iter([repos])), \
+                    patch.object(GitHubCodeFetcher, 'download_repositories', return_value={}) as download:
+                result = CliRunner().invoke(main, ['-q', 'x', '-n', '20', '--top-k', '3', '--no-cache', '--no-index',
+                                                   '--metadata-file', 'meta.jsonl'])
+            
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertEqual({r['name'] for r in download.call_args[0][0]}, {"r19", "r18", "r17"})
+            with open(os.path.join("metadata", "x_meta.jsonl")) as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual([row['name'] for row in rows], [f"r{i}" for i in range(19, -1, -1)])
+            self.assertGreater(rows[0]['score'], rows[-1]['score'])
+
+
+class TestCorpusPackager(unittest.TestCase):
+    """Test packaging downloaded repositories into deduplicated shards."""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        files = {
+            "web/a_one": {"main.py": b"print('one')\n", "util.py": b"shared = 1\n", "README.md": b"# one\n",
+                          "logo.py": b"\x89PNG\0\0", "big.py": b"x" * 2048, ".git/config": b"[core]\n",
+                          "latin1.py": b"name = 'Jos\xe9'\n"},
+            "web/b_two": {"src/util.py": b"shared = 1\n", "app.js": b"console.log(2)\n"},
+            "cli/a_one": {"main.py": b"print('one')\n"},
+        }
+        for repo, contents in files.items():
+            for name, data in contents.items():
+                path = self.root / repo / name
+                path.parent.mkdir(parents=True, exist_ok=True)
+                path.write_bytes(data)
+        (self.root / "web" / ".a_one-x.partial").mkdir()
+        self.sources = [str(self.root / "web"), str(self.root / "cli")]
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def read_index(self, output, shard):
+        with open(os.path.join(output, shard['index']), encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    
+    def test_jsonl_shards_are_deduplicated(self):
+        """Test filtering, cross-repository deduplication and the per-shard index."""
+        output = str(self.root / "corpus")
+        manifest = package_corpus(self.sources, output, extensions=['py', '.JS'], max_file_size=1024,
+                                  shard_size=30, workers=2, show_progress=False)
+        
+        self.assertEqual(manifest['repositories'], 3)
+        self.assertEqual((manifest['files'], manifest['unique_files']), (5, 3))
+        # README.md, the binary, the big and the Latin-1 file
+        self.assertEqual(manifest['skipped_files'], 4)
+        self.assertEqual(len(manifest['shards']), 2)
+        
+        records = []
+        for shard in manifest['shards']:
+            with gzip.open(os.path.join(output, shard['shard']), 'rt', encoding='utf-8') as f:
+                records.extend(json.loads(line) for line in f)
+        self.assertEqual({r['content'] for r in records}, {"print('one')\n", "shared = 1\n", "console.log(2)\n"})
+        for record in records:
+            self.assertEqual(record['sha'], git_blob_sha(record['content'].encode()))
+        
+        index = [row for shard in manifest['shards'] for row in self.read_index(output, shard)]
+        self.assertEqual(len(index), 5)
+        shared = [(row['repository'], row['path']) for row in index if row['sha'] == git_blob_sha(b"shared = 1\n")]
+        self.assertEqual(shared, [("a_one", "util.py"), ("b_two", "src/util.py")])
+        self.assertEqual({row['language'] for row in index}, {"Python", "JavaScript"})
+        self.assertTrue(os.path.exists(os.path.join(output, "manifest.json")))
+    
+    @unittest.skipIf(importlib.util.find_spec("zstandard") is None, "tar.zst shards need zstandard")
+    def test_tar_zst_shards(self):
+        """Test that tar.zst shards hold one member per unique content, named by SHA."""
+        import zstandard
+        
+        output = str(self.root / "corpus")
+        manifest = package_corpus(self.sources, output, shard_format='tar.zst', max_file_size=1024,
+                                  workers=1, show_progress=False)
+        [shard] = manifest['shards']
+        with open(os.path.join(output, shard['shard']), 'rb') as f:
+            with tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(f), mode='r|') as archive:
+                members = {member.name: archive.extractfile(member).read() for member in archive}
+        
+        # Raw bytes are fine in tar shards, so the Latin-1 file is kept
+        self.assertEqual(len(members), 5)
+        for sha, data in members.items():
+            self.assertEqual(sha, git_blob_sha(data))
+        self.assertEqual(len(self.read_index(output, shard)), 7)
+    
+    def test_cli(self):
+        """Test the package command output."""
+        output = str(self.root / "corpus")
+        result = CliRunner().invoke(main, ['package', *self.sources, '-o', output, '--ext', '.py',
+                                           '--workers', '1'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Packaged 3 unique of 5 files from 3 repositories", result.output)
+
+
+class TestStartup(unittest.TestCase):
+    """Import-time benchmark for the CLI startup path."""
+    
+    # Generous enough for slow CI machines; eager imports took well over this
+    IMPORT_BUDGET_SECONDS = 0.15
+    HEAVY_MODULES = ('git', 'requests', 'tqdm', 'dotenv', 'pandas', 'asyncio', 'numpy')
+    
+    def run_python(self, code):
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        )
+        return result.stdout.strip().splitlines()
+    
+    def test_import_is_lightweight(self):
+        """Test that importing the module stays within budget and loads no heavy dependencies."""
+        elapsed, loaded = self.run_python(
+            "import sys, time\n"
+            "start = time.perf_counter()\n"
+            "import github_code_fetcher\n"
+            "print(time.perf_counter() - start)\n"
+            f"print([m for m in {self.HEAVY_MODULES!r} if m in sys.modules])\n"
+        )
+        self.assertEqual(loaded, "[]")
+        self.assertLess(float(elapsed), self.IMPORT_BUDGET_SECONDS)
+    
+    def test_help_does_not_load_heavy_dependencies(self):
+        """Test that --help does not import requests, GitPython or tqdm."""
+        output = self.run_python(
+            "import sys\n"
+            "from click.testing import CliRunner\n"
+            "from github_code_fetcher import main\n"
+            "assert CliRunner().invoke(main, ['--help']).exit_code == 0\n"
+            f"print([m for m in {self.HEAVY_MODULES!r} if m in sys.modules])\n"
+        )
+        self.assertEqual(output, ["[]"])
 
 
 if __name__ == '__main__':